@@ -90,6 +90,10 @@ def run_migrations_online():
                 directives[:] = []
                 logger.info('No changes in schema detected.')
 
+    # the full-text search index and its shadow tables are managed by hand
+    def include_object(object, name, type_, reflected, compare_to):
+        return not (type_ == 'table' and reflected and name.startswith('message_fts'))
+
     connectable = get_engine()
 
     with connectable.connect() as connection:
@@ -97,6 +101,7 @@ def run_migrations_online():
             connection=connection,
             target_metadata=get_metadata(),
             process_revision_directives=process_revision_directives,
+            include_object=include_object,
             **current_app.extensions['migrate'].configure_args
         )
 
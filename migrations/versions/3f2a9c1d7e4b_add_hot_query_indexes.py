@@ -0,0 +1,39 @@
+"""add indexes for hot query shapes
+
+Revision ID: 3f2a9c1d7e4b
+Revises:
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f2a9c1d7e4b'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+# Tables are created by db.create_all(), so only the indexes are managed here
+INDEXES = [
+    ('ix_message_channel_timestamp_id', 'message', ['channel_id', 'timestamp', 'id']),
+    ('ix_direct_message_pair_timestamp', 'direct_message', ['sender_id', 'recipient_id', 'timestamp']),
+    ('ix_reaction_target', 'reaction', ['target_type', 'target_id', 'reaction_type']),
+    ('ix_reaction_message_type', 'reaction', ['message_id', 'reaction_type']),
+    ('ix_comment_post_created_at', 'comment', ['post_id', 'created_at']),
+    ('ix_post_created_at', 'post', ['created_at']),
+    ('ix_verification_code_lookup', 'verification_code', ['student_id', 'email', 'type']),
+    ('ix_user_is_online', 'user', ['is_online']),
+]
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, unique=False, if_not_exists=True)
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table, if_exists=True)
@@ -0,0 +1,51 @@
+"""add denormalized like/comment counters to post and comment
+
+Revision ID: 8b4d2e6f1a3c
+Revises: 3f2a9c1d7e4b
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b4d2e6f1a3c'
+down_revision = '3f2a9c1d7e4b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('like_count', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('comment_count', sa.Integer(), nullable=False, server_default='0'))
+
+    with op.batch_alter_table('comment', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('like_count', sa.Integer(), nullable=False, server_default='0'))
+
+    # Backfill the counters from the existing rows
+    op.execute("""
+        UPDATE post SET
+            like_count = (SELECT COUNT(*) FROM reaction
+                          WHERE reaction.target_type = 'post'
+                            AND reaction.target_id = post.id
+                            AND reaction.reaction_type = 'like'),
+            comment_count = (SELECT COUNT(*) FROM comment WHERE comment.post_id = post.id)
+    """)
+    op.execute("""
+        UPDATE comment SET
+            like_count = (SELECT COUNT(*) FROM reaction
+                          WHERE reaction.target_type = 'comment'
+                            AND reaction.target_id = comment.id
+                            AND reaction.reaction_type = 'like')
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('comment', schema=None) as batch_op:
+        batch_op.drop_column('like_count')
+
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.drop_column('comment_count')
+        batch_op.drop_column('like_count')
@@ -0,0 +1,28 @@
+"""add resource version counters for conditional GETs
+
+Revision ID: a2c4e6f8b0d1
+Revises: f1b3d5e7a9c0
+Create Date: 2026-10-17 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a2c4e6f8b0d1'
+down_revision = 'f1b3d5e7a9c0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('resource_version',
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('resource_version')
@@ -0,0 +1,34 @@
+"""add channel_read_state watermarks and message (channel_id, id) index
+
+Revision ID: a7c9e1f3b5d6
+Revises: f4b6d8e0a2c3
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c9e1f3b5d6'
+down_revision = 'f4b6d8e0a2c3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('channel_read_state',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('channel_id', sa.Integer(), nullable=False),
+        sa.Column('last_read_message_id', sa.Integer(), server_default='0', nullable=False),
+        sa.ForeignKeyConstraint(['channel_id'], ['channel.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('user_id', 'channel_id')
+    )
+    op.create_index('ix_message_channel_id', 'message', ['channel_id', 'id'],
+                    unique=False, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_message_channel_id', table_name='message', if_exists=True)
+    op.drop_table('channel_read_state')
@@ -0,0 +1,39 @@
+"""add last message pointer to channel
+
+Revision ID: b3d5f7a9c1e2
+Revises: a7c9e1f3b5d6
+Create Date: 2026-10-17 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3d5f7a9c1e2'
+down_revision = 'a7c9e1f3b5d6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('channel', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('last_message_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('last_message_at', sa.DateTime(), nullable=True))
+
+    op.execute("""
+        UPDATE channel SET last_message_id = (
+            SELECT MAX(id) FROM message WHERE message.channel_id = channel.id
+        )
+    """)
+    op.execute("""
+        UPDATE channel SET last_message_at = (
+            SELECT timestamp FROM message WHERE message.id = channel.last_message_id
+        )
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('channel', schema=None) as batch_op:
+        batch_op.drop_column('last_message_at')
+        batch_op.drop_column('last_message_id')
@@ -0,0 +1,28 @@
+"""add id_sequence table for write-behind message ids
+
+Revision ID: c5e7a9b1d3f2
+Revises: 8b4d2e6f1a3c
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5e7a9b1d3f2'
+down_revision = '8b4d2e6f1a3c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('id_sequence',
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.Column('next_id', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('id_sequence')
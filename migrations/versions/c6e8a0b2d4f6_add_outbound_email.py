@@ -0,0 +1,41 @@
+"""add outbound email queue
+
+Revision ID: c6e8a0b2d4f6
+Revises: b3d5f7a9c1e2
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c6e8a0b2d4f6'
+down_revision = 'b3d5f7a9c1e2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('outbound_email',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('recipient', sa.String(length=100), nullable=False),
+        sa.Column('sender', sa.String(length=100), nullable=False),
+        sa.Column('subject', sa.String(length=200), nullable=False),
+        sa.Column('html', sa.Text(), nullable=False),
+        sa.Column('status', sa.String(length=10), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+        sa.Column('claimed_by', sa.String(length=32), nullable=True),
+        sa.Column('last_error', sa.String(length=200), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('sent_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_outbound_email_status_next_attempt_at', 'outbound_email',
+                    ['status', 'next_attempt_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_outbound_email_status_next_attempt_at', table_name='outbound_email')
+    op.drop_table('outbound_email')
@@ -0,0 +1,32 @@
+"""extend verification code lookup index and index reaper columns
+
+Revision ID: d7f9b1c3e5a7
+Revises: c6e8a0b2d4f6
+Create Date: 2026-10-17 18:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7f9b1c3e5a7'
+down_revision = 'c6e8a0b2d4f6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.drop_index('ix_verification_code_lookup', table_name='verification_code', if_exists=True)
+    op.create_index('ix_verification_code_lookup', 'verification_code',
+                    ['student_id', 'email', 'type', 'code'], unique=False)
+    op.create_index('ix_verification_code_expires_at', 'verification_code', ['expires_at'], unique=False)
+    op.create_index('ix_verification_code_used', 'verification_code', ['used'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_verification_code_used', table_name='verification_code')
+    op.drop_index('ix_verification_code_expires_at', table_name='verification_code')
+    op.drop_index('ix_verification_code_lookup', table_name='verification_code')
+    op.create_index('ix_verification_code_lookup', 'verification_code',
+                    ['student_id', 'email', 'type'], unique=False)
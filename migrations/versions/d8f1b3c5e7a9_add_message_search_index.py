@@ -0,0 +1,60 @@
+"""add message_fts full-text search index
+
+Revision ID: d8f1b3c5e7a9
+Revises: c5e7a9b1d3f2
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8f1b3c5e7a9'
+down_revision = 'c5e7a9b1d3f2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # FTS5 is SQLite only
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    op.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS message_fts
+        USING fts5(content, content='message', content_rowid='id', tokenize='unicode61 remove_diacritics 2')
+    """)
+    op.execute("""
+        CREATE TRIGGER IF NOT EXISTS message_fts_ai AFTER INSERT ON message
+        WHEN new.is_encrypted = 0 BEGIN
+            INSERT INTO message_fts(rowid, content) VALUES (new.id, new.content);
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER IF NOT EXISTS message_fts_ad AFTER DELETE ON message
+        WHEN old.is_encrypted = 0 BEGIN
+            INSERT INTO message_fts(message_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER IF NOT EXISTS message_fts_au AFTER UPDATE OF content, is_encrypted ON message BEGIN
+            INSERT INTO message_fts(message_fts, rowid, content)
+                SELECT 'delete', old.id, old.content WHERE old.is_encrypted = 0;
+            INSERT INTO message_fts(rowid, content)
+                SELECT new.id, new.content WHERE new.is_encrypted = 0;
+        END
+    """)
+
+    # Index existing history
+    op.execute("INSERT INTO message_fts(message_fts) VALUES ('delete-all')")
+    op.execute("INSERT INTO message_fts(rowid, content) SELECT id, content FROM message WHERE is_encrypted = 0")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    op.execute("DROP TRIGGER IF EXISTS message_fts_au")
+    op.execute("DROP TRIGGER IF EXISTS message_fts_ad")
+    op.execute("DROP TRIGGER IF EXISTS message_fts_ai")
+    op.execute("DROP TABLE IF EXISTS message_fts")
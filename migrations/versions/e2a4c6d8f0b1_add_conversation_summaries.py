@@ -0,0 +1,52 @@
+"""add conversation summary table for direct messages
+
+Revision ID: e2a4c6d8f0b1
+Revises: d8f1b3c5e7a9
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a4c6d8f0b1'
+down_revision = 'd8f1b3c5e7a9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('conversation',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('partner_id', sa.Integer(), nullable=False),
+        sa.Column('last_message_id', sa.Integer(), nullable=True),
+        sa.Column('last_message_at', sa.DateTime(), nullable=True),
+        sa.Column('unread_count', sa.Integer(), server_default='0', nullable=False),
+        sa.ForeignKeyConstraint(['last_message_id'], ['direct_message.id'], ),
+        sa.ForeignKeyConstraint(['partner_id'], ['user.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('user_id', 'partner_id')
+    )
+    op.create_index('ix_conversation_user_last_message_at', 'conversation',
+                    ['user_id', 'last_message_at'], unique=False)
+
+    # Backfill both sides of every existing thread
+    op.execute("""
+        INSERT INTO conversation (user_id, partner_id, last_message_id, last_message_at, unread_count)
+        SELECT user_id, partner_id, MAX(id), MAX(timestamp), SUM(unread)
+        FROM (
+            SELECT sender_id AS user_id, recipient_id AS partner_id, id, timestamp, 0 AS unread
+            FROM direct_message
+            UNION ALL
+            SELECT recipient_id, sender_id, id, timestamp, CASE WHEN is_read THEN 0 ELSE 1 END
+            FROM direct_message
+            WHERE recipient_id != sender_id
+        )
+        GROUP BY user_id, partner_id
+    """)
+
+
+def downgrade():
+    op.drop_index('ix_conversation_user_last_message_at', table_name='conversation')
+    op.drop_table('conversation')
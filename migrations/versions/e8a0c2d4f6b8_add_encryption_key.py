@@ -0,0 +1,29 @@
+"""add per-scope message encryption keys
+
+Revision ID: e8a0c2d4f6b8
+Revises: d7f9b1c3e5a7
+Create Date: 2026-10-17 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8a0c2d4f6b8'
+down_revision = 'd7f9b1c3e5a7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('encryption_key',
+        sa.Column('scope', sa.String(length=50), nullable=False),
+        sa.Column('wrapped_key', sa.LargeBinary(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('scope')
+    )
+
+
+def downgrade():
+    op.drop_table('encryption_key')
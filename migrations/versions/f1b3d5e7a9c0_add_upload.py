@@ -0,0 +1,42 @@
+"""add content-addressed uploads
+
+Revision ID: f1b3d5e7a9c0
+Revises: e8a0c2d4f6b8
+Create Date: 2026-10-17 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1b3d5e7a9c0'
+down_revision = 'e8a0c2d4f6b8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('upload',
+        sa.Column('sha256', sa.String(length=64), nullable=False),
+        sa.Column('url', sa.String(length=200), nullable=False),
+        sa.Column('size', sa.Integer(), nullable=False),
+        sa.Column('width', sa.Integer(), nullable=True),
+        sa.Column('height', sa.Integer(), nullable=True),
+        sa.Column('variants', sa.Text(), nullable=False, server_default='{}'),
+        sa.Column('status', sa.String(length=10), nullable=False, server_default='pending'),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('sha256')
+    )
+
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('upload_sha256', sa.String(length=64), nullable=True))
+        batch_op.create_foreign_key('fk_post_upload_sha256_upload', 'upload', ['upload_sha256'], ['sha256'])
+
+
+def downgrade():
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_post_upload_sha256_upload', type_='foreignkey')
+        batch_op.drop_column('upload_sha256')
+
+    op.drop_table('upload')
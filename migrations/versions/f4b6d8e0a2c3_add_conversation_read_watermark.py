@@ -0,0 +1,44 @@
+"""add read watermark to conversation rows
+
+Revision ID: f4b6d8e0a2c3
+Revises: e2a4c6d8f0b1
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4b6d8e0a2c3'
+down_revision = 'e2a4c6d8f0b1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('conversation', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('last_read_message_id', sa.Integer(), server_default='0', nullable=False))
+
+    # Start each watermark at the newest message already marked read
+    op.execute("""
+        UPDATE conversation SET last_read_message_id = COALESCE((
+            SELECT MAX(id) FROM direct_message
+            WHERE sender_id = conversation.partner_id
+              AND recipient_id = conversation.user_id
+              AND is_read
+        ), 0)
+    """)
+    op.execute("""
+        UPDATE conversation SET unread_count = (
+            SELECT COUNT(id) FROM direct_message
+            WHERE sender_id = conversation.partner_id
+              AND recipient_id = conversation.user_id
+              AND id > conversation.last_read_message_id
+        )
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('conversation', schema=None) as batch_op:
+        batch_op.drop_column('last_read_message_id')
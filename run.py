@@ -8,12 +8,15 @@ sys.path.append("./server")
 
 from server.app import app, db, socketio
 from server.models import User, Channel, Student
+from server.cache import invalidate_on_commit
+from server.conditional import bump
 
 @app.cli.command("init-db")
 @with_appcontext
 def init_db_command():
     """Initialize the database with tables and initial data."""
-    db.create_all()
+    from server.app import initialize_database
+    initialize_database(app)
 
     # Create default channels if they don't exist
     if Channel.query.count() == 0:
@@ -24,6 +27,7 @@ def init_db_command():
             Channel(name="Study Groups", description="Find and organize study groups")
         ]
         db.session.add_all(channels)
+        bump('channels')
         db.session.commit()
         click.echo(f"Created {len(channels)} default channels")
 
@@ -31,20 +35,31 @@ def init_db_command():
 
 @app.cli.command("import-students")
 @click.argument("file_path", type=click.Path(exists=True))
+@click.option("--column", default=None, help="CSV column holding the student id (header name or 0-based index)")
+@click.option("--batch-size", default=1000, help="Rows checked and inserted per transaction")
+@click.option("--dry-run", is_flag=True, help="Report what would be imported without writing")
 @with_appcontext
-def import_students_command(file_path):
-    """Import student IDs from a text file."""
-    with open(file_path, 'r') as f:
-        student_ids = [line.strip() for line in f if line.strip()]
+def import_students_command(file_path, column, batch_size, dry_run):
+    """Import student IDs from a text file (one per line) or a CSV roster."""
+    import time
+    from server.student_import import read_student_ids, import_students
 
-    count = 0
-    for student_id in student_ids:
-        if not Student.query.get(student_id):
-            db.session.add(Student(id=student_id))
-            count += 1
+    began = time.perf_counter()
 
-    db.session.commit()
-    click.echo(f"Imported {count} student IDs")
+    def progress(counts):
+        click.echo(f"\r{counts['read']} rows read, {counts['inserted']} new", nl=False, err=True)
+
+    with open(file_path, 'r', newline='', encoding='utf-8-sig') as f:
+        try:
+            counts = import_students(read_student_ids(f, column), batch_size=batch_size,
+                                     dry_run=dry_run, progress=progress)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+    click.echo(err=True)
+
+    verb = "Would import" if dry_run else "Imported"
+    click.echo(f"{verb} {counts['inserted']} student IDs, skipped {counts['skipped']} existing or repeated, "
+               f"{counts['invalid']} invalid ({time.perf_counter() - began:.1f}s)")
 
 @app.cli.command("add-test-students")
 @with_appcontext
@@ -100,14 +115,512 @@ def reset_user(student_id):
     if user:
         # Delete user data
         db.session.delete(user)
+        invalidate_on_commit('author_cards', user.id)
+        bump('authors', 'posts', f"user:{user.id}")
 
     # Mark student as not registered
     student.is_registered = False
+    invalidate_on_commit('students', student_id)
     db.session.commit()
 
     click.echo(f"User for Student ID {student_id} has been reset.")
 
+@app.cli.command("check-query-plans")
+@with_appcontext
+def check_query_plans():
+    """Fail if any registered hot query does a full table scan."""
+    from server.queries import check_hot_queries
+
+    failures = []
+    for name, (plan, has_full_scan) in check_hot_queries().items():
+        status = "FULL SCAN" if has_full_scan else "ok"
+        click.echo(f"{name}: {status}")
+        for detail in plan:
+            click.echo(f"    {detail}")
+        if has_full_scan:
+            failures.append(name)
+
+    if failures:
+        click.echo(f"{len(failures)} hot queries do a full table scan: {', '.join(failures)}")
+        sys.exit(1)
+
+    click.echo("All hot queries use an index.")
+
+@app.cli.command("rebuild-counters")
+@with_appcontext
+def rebuild_counters_command():
+    """Recompute post and comment like/comment counters from scratch."""
+    from server.queries import rebuild_counters
+
+    posts, comments = rebuild_counters()
+    click.echo(f"Rebuilt counters for {posts} posts and {comments} comments")
+
+@app.cli.command("rebuild-conversations")
+@with_appcontext
+def rebuild_conversations_command():
+    """Recompute direct message conversation summaries from scratch."""
+    from server.queries import rebuild_conversations
+
+    click.echo(f"Rebuilt {rebuild_conversations()} conversation rows")
+
+@app.cli.command("rebuild-search-index")
+@with_appcontext
+def rebuild_search_index_command():
+    """Recreate the message full-text search index from the message table."""
+    from server.search import rebuild_search_index, search_supported
+
+    if not search_supported(db.engine):
+        click.echo("Full-text search needs SQLite FTS5; nothing to do.")
+        return
+
+    click.echo(f"Indexed {rebuild_search_index()} messages")
+
+@app.cli.command("bench-search")
+@click.option("--messages", default=1000000, help="Size of the generated corpus")
+@click.option("--queries", default=200, help="Searches to time")
+@click.option("--path", default="search_bench.db", help="Scratch database file")
+@with_appcontext
+def bench_search(messages, queries, path):
+    """Time FTS5 search against a LIKE scan on a generated message corpus."""
+    import itertools
+    import random
+    import time
+    from datetime import datetime, timedelta
+    from sqlalchemy import create_engine, insert, text
+    from sqlalchemy.orm import Session
+    from server.models import Message
+    from server.search import create_search_index, search_messages
+
+    if os.path.exists(path):
+        os.remove(path)
+    engine = create_engine(f"sqlite:///{os.path.abspath(path)}")
+    Message.__table__.create(engine)
+    with engine.begin() as conn:
+        create_search_index(conn)
+
+    # Zipf-ish vocabulary so some words are common and most are rare
+    rng = random.Random(0)
+    vocabulary = [f"w{i}" for i in range(20000)]
+    cum_weights = list(itertools.accumulate(1 / (i + 1) for i in range(len(vocabulary))))
+    start = datetime(2025, 1, 1)
+
+    click.echo(f"Generating {messages} messages in {path}...")
+    began = time.perf_counter()
+    batch_size = 10000
+    with engine.begin() as conn:
+        for first in range(0, messages, batch_size):
+            rows = []
+            for _ in range(min(batch_size, messages - first)):
+                rows.append({
+                    "content": " ".join(rng.choices(vocabulary, cum_weights=cum_weights, k=rng.randint(5, 25))),
+                    "user_id": rng.randint(1, 500),
+                    "channel_id": rng.randint(1, 4),
+                    "is_encrypted": rng.random() < 0.05,
+                    "timestamp": start + timedelta(seconds=rng.randint(0, 365 * 86400))
+                })
+            conn.execute(insert(Message), rows)
+    click.echo(f"Inserted and indexed in {time.perf_counter() - began:.1f}s")
+
+    searches = [" ".join(rng.choices(vocabulary[50:2000], k=rng.randint(1, 2))) for _ in range(queries)]
+
+    with Session(engine) as session:
+        began = time.perf_counter()
+        hits = 0
+        for query in searches:
+            hits += len(search_messages(query, channel_ids=[1, 2], limit=20, session=session))
+        fts_ms = (time.perf_counter() - began) * 1000 / queries
+
+        # Substring scan over the same rows for comparison, on a sample of the queries
+        sample = searches[:max(1, queries // 20)]
+        began = time.perf_counter()
+        for query in sample:
+            session.execute(text(
+                "SELECT id FROM message WHERE is_encrypted = 0 AND channel_id IN (1, 2) "
+                "AND content LIKE :pattern ORDER BY timestamp DESC LIMIT 20"
+            ), {"pattern": f"%{query.split()[0]}%"}).all()
+        like_ms = (time.perf_counter() - began) * 1000 / len(sample)
+
+    engine.dispose()
+    os.remove(path)
+
+    click.echo(f"FTS5:      {fts_ms:.2f} ms/search over {queries} searches ({hits} results)")
+    click.echo(f"LIKE scan: {like_ms:.2f} ms/search over {len(sample)} searches")
+
+@app.cli.command("bench-typing")
+@click.option("--typers", default=10, help="Users typing in the channel")
+@click.option("--members", default=200, help="Sockets joined to the channel")
+@click.option("--keystrokes", default=8.0, help="Keystrokes per second while typing")
+@click.option("--seconds", default=60, help="Simulated duration")
+@with_appcontext
+def bench_typing(typers, members, keystrokes, seconds):
+    """Compare typing indicator frames sent per keystroke vs coalesced."""
+    import random
+    from server.typing_indicators import TypingTracker
+
+    tracker = TypingTracker(emit=lambda event, data, to: None)
+    tracker.min_event_interval = app.config['TYPING_MIN_EVENT_INTERVAL']
+    tracker.timeout = app.config['TYPING_TIMEOUT']
+    tracker.broadcast_interval = app.config['TYPING_BROADCAST_INTERVAL']
+
+    # Each typer alternates between a burst of typing and a pause
+    rng = random.Random(0)
+    step = 0.01
+    events = 0
+    next_key = {user_id: rng.uniform(0, 1) for user_id in range(typers)}
+    burst_end = {user_id: rng.uniform(2, 8) for user_id in range(typers)}
+    next_tick = tracker.broadcast_interval
+
+    now = 0.0
+    while now < seconds:
+        for user_id in range(typers):
+            if now >= next_key[user_id]:
+                events += 1
+                tracker.typing(user_id, f"user{user_id}", 1, now=now)
+                next_key[user_id] = now + rng.expovariate(keystrokes)
+                if now >= burst_end[user_id]:
+                    # Send the message, then pause before the next burst
+                    tracker.stop(user_id, 1)
+                    next_key[user_id] = now + rng.uniform(2, 8)
+                    burst_end[user_id] = next_key[user_id] + rng.uniform(2, 8)
+        if now >= next_tick:
+            tracker.tick(now=now)
+            next_tick += tracker.broadcast_interval
+        now += step
+
+    # The old handler emitted one frame per keystroke to everyone but the sender
+    old_frames, old_deliveries = events, events * (members - 1)
+    new_frames, new_deliveries = tracker.frames_emitted, tracker.frames_emitted * members
+
+    click.echo(f"{typers} typers, {members} members, {events} keystroke events over {seconds}s")
+    click.echo(f"per keystroke: {old_frames} frames, {old_deliveries} deliveries")
+    click.echo(f"coalesced:     {new_frames} frames, {new_deliveries} deliveries "
+               f"({old_deliveries / max(new_deliveries, 1):.1f}x fewer)")
+
+@app.cli.command("bench-login-storm")
+@click.option("--logins", default=200, help="Password checks in the storm")
+@click.option("--concurrency", default=50, help="Logins in flight at once")
+@with_appcontext
+def bench_login_storm(logins, concurrency):
+    """Measure socket latency on the hub during a login storm, inline vs offloaded hashing."""
+    import time
+    import eventlet
+    from werkzeug.security import generate_password_hash, check_password_hash
+    from server.passwords import PasswordHasher
+
+    pwhash = generate_password_hash("correct horse")
+    interval = 0.01
+
+    def measure(storm):
+        # A greenlet standing in for socket traffic: any time it wakes up late
+        # is latency every socket event on the process would have seen
+        delays = []
+        running = [True]
+
+        def ticker():
+            while running[0]:
+                began = time.perf_counter()
+                eventlet.sleep(interval)
+                delays.append((time.perf_counter() - began - interval) * 1000)
+
+        tick = eventlet.spawn(ticker)
+        eventlet.sleep(interval * 5)
+        began = time.perf_counter()
+        pool = eventlet.GreenPool(concurrency)
+        for _ in range(logins):
+            pool.spawn_n(storm)
+        pool.waitall()
+        elapsed = time.perf_counter() - began
+        running[0] = False
+        tick.wait()
+
+        delays.sort()
+        p50 = delays[len(delays) // 2]
+        p99 = delays[min(len(delays) - 1, int(len(delays) * 0.99))]
+        return elapsed, p50, p99, delays[-1]
+
+    hasher = PasswordHasher(threads=app.config['PASSWORD_HASH_THREADS'], max_pending=logins, offload=True)
+    runs = [
+        ("idle", lambda: eventlet.sleep(interval)),
+        ("inline", lambda: check_password_hash(pwhash, "correct horse")),
+        ("offloaded", lambda: hasher.verify(pwhash, "correct horse")),
+    ]
+
+    click.echo(f"{logins} logins, {concurrency} concurrent, {hasher.threads} hash threads")
+    for name, storm in runs:
+        elapsed, p50, p99, worst = measure(storm)
+        click.echo(f"{name:10} {elapsed:6.2f}s  socket delay p50 {p50:7.1f} ms  p99 {p99:7.1f} ms  max {worst:7.1f} ms")
+
+    stats = hasher.stats()
+    click.echo(f"hash latency p50 {stats['p50_ms']:.0f} ms, p95 {stats['p95_ms']:.0f} ms, max {stats['max_ms']:.0f} ms")
+
+@app.cli.command("fake-smtp")
+@click.option("--port", default=1025, help="Port to listen on")
+@click.option("--delay", default=0.0, help="Seconds to wait before each reply")
+def fake_smtp(port, delay):
+    """Run a local SMTP server that prints the emails it receives."""
+    import time
+    from server.fake_smtp import FakeSMTPServer
+
+    with FakeSMTPServer(port=port, delay=delay) as server:
+        click.echo(f"Fake SMTP server listening on {server.host}:{server.port}")
+        seen = 0
+        try:
+            while True:
+                time.sleep(0.5)
+                for sender, recipients, message in server.messages[seen:]:
+                    click.echo(f"{sender} -> {', '.join(recipients)}: {message['Subject']}")
+                seen = len(server.messages)
+        except KeyboardInterrupt:
+            pass
+
+@app.cli.command("verification-code-health")
+@click.option("--reap", is_flag=True, help="Reap dead codes now and report the rate")
+@with_appcontext
+def verification_code_health(reap):
+    """Report verification code table size, dead rows and reap rate."""
+    import time
+    from datetime import datetime
+    from sqlalchemy import func
+    from server.models import VerificationCode
+    from server.verification_reaper import verification_reaper, reapable
+
+    now = datetime.utcnow()
+    total = db.session.query(func.count(VerificationCode.id)).scalar()
+    dead = db.session.query(func.count(VerificationCode.id)).filter(reapable(now)).scalar()
+    oldest = db.session.query(func.min(VerificationCode.expires_at)).filter(VerificationCode.expires_at < now).scalar()
+
+    click.echo(f"Rows:          {total}")
+    click.echo(f"Expired/used:  {dead} ({dead / total:.1%})" if total else "Expired/used:  0")
+    if oldest:
+        click.echo(f"Oldest expiry: {oldest:%Y-%m-%d %H:%M} ({(now - oldest).days} days ago)")
+    click.echo(f"Reaper:        every {app.config['VERIFICATION_REAP_INTERVAL']}s, "
+               f"{app.config['VERIFICATION_REAP_BATCH_SIZE']} rows per batch")
+
+    if reap:
+        began = time.perf_counter()
+        deleted = verification_reaper.reap(now)
+        elapsed = time.perf_counter() - began
+        click.echo(f"Reaped {deleted} codes in {elapsed:.2f}s ({deleted / max(elapsed, 1e-9):.0f} rows/s)")
+
+@app.cli.command("bench-encryption")
+@click.option("--messages", default=20000, help="Messages to encrypt and decrypt")
+@click.option("--page-size", default=50, help="Messages per history page for the batch API")
+@with_appcontext
+def bench_encryption(messages, page_size):
+    """Compare per-message keys with cached per-channel keys, in messages per second."""
+    import os
+    import base64
+    import time
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    from server.encryption import message_encryption, channel_scope
+
+    texts = [f"message {i} " + "lorem ipsum dolor sit amet " * (i % 8) for i in range(messages)]
+    scope = channel_scope(1)
+    message_encryption.cipher(scope)  # create the key outside the timings
+
+    def rate(run):
+        began = time.perf_counter()
+        run()
+        return messages / (time.perf_counter() - began)
+
+    def per_message_keys():
+        # The old encrypt_message: fresh key and cipher, three base64 encodings
+        for text in texts:
+            key = AESGCM.generate_key(bit_length=256)
+            nonce = os.urandom(12)
+            ciphertext = AESGCM(key).encrypt(nonce, text.encode(), None)
+            base64.b64encode(ciphertext).decode(), base64.b64encode(key).decode(), base64.b64encode(nonce).decode()
+
+    def single():
+        for text in texts:
+            message_encryption.encrypt(scope, text)
+
+    tokens = []
+
+    def batched():
+        for start in range(0, messages, page_size):
+            tokens.extend(message_encryption.encrypt_many(scope, texts[start:start + page_size]))
+
+    def decrypt_batched():
+        for start in range(0, messages, page_size):
+            message_encryption.decrypt_many((scope, token) for token in tokens[start:start + page_size])
+
+    results = [
+        ("per-message key (old)", rate(per_message_keys)),
+        ("encrypt", rate(single)),
+        (f"encrypt_many x{page_size}", rate(batched)),
+        (f"decrypt_many x{page_size}", rate(decrypt_batched)),
+    ]
+    assert message_encryption.decrypt(scope, tokens[-1]) == texts[-1]
+
+    for name, per_second in results:
+        click.echo(f"{name:24} {per_second:>10,.0f} messages/s")
+
+@app.cli.command("bench-sanitize")
+@click.option("--lines", default=100000, help="Lines per corpus")
+@click.option("--fuzz", default=200000, help="Random inputs compared against the old sanitizer")
+@click.option("--seed", default=1, help="Seed for the fuzz corpus")
+def bench_sanitize(lines, fuzz, seed):
+    """Check sanitize_text against the old regex version and compare their speed."""
+    import re
+    import time
+    import random
+    from server.utils import sanitize_text, sanitize_many
+
+    def legacy(text):
+        # The old sanitize_text, kept here as the reference
+        if not text:
+            return ""
+        text = re.sub(r'<script\b[^<]*(?:(?!<\/script>)<[^<]*)*<\/script>', '', text)
+        text = re.sub(r'<iframe\b[^<]*(?:(?!<\/iframe>)<[^<]*)*<\/iframe>', '', text)
+        return text.replace('<', '&lt;').replace('>', '&gt;')
+
+    # Fuzz corpus: short strings built from tag fragments, so openers,
+    # closers and word boundaries line up in every combination
+    fragments = ['<', '>', '&', '/', ' ', '\n', '_', 'a', '1', 'é', 'script', 'iframe', '<script',
+                 '</script>', '<script>', '<iframe', '</iframe>', '<ifr', 'ame>', '<SCRIPT>', '<b>']
+    rng = random.Random(seed)
+    corpus = [''.join(rng.choice(fragments) for _ in range(rng.randint(0, 30))) for _ in range(fuzz)]
+    corpus += ['<script</script>', '<scriptx></script>', '<script_></script>', '<ifr<script></script>ame>x</iframe>']
+
+    mismatches = [text for text in corpus if sanitize_text(text) != legacy(text)]
+    for text in mismatches[:5]:
+        click.echo(f"MISMATCH {text!r}: {legacy(text)!r} != {sanitize_text(text)!r}")
+    click.echo(f"{len(corpus) - len(mismatches):,}/{len(corpus):,} fuzz inputs match the old sanitizer")
+
+    def timed(run, texts):
+        began = time.perf_counter()
+        run(texts)
+        return time.perf_counter() - began
+
+    corpora = [
+        ("plain chat", ["see you at the library at 5? bring notes & snacks"] * lines),
+        ("with html", ["look <b>here</b> <script>alert(1)</script> ok"] * lines),
+    ]
+    for name, texts in corpora:
+        old = timed(lambda batch: [legacy(text) for text in batch], texts)
+        new = timed(sanitize_many, texts)
+        click.echo(f"{name:12} old {lines / old:>12,.0f}/s  new {lines / new:>12,.0f}/s  {old / new:5.1f}x")
+
+    # Unclosed openers make the old patterns rescan the rest of the line from each one
+    for size in (1000, 2000, 4000):
+        text = '<script' * size
+        click.echo(f"{size:>6} unclosed <script: old {timed(legacy, text):8.3f}s  "
+                   f"new {timed(sanitize_text, text):8.4f}s")
+
+    if mismatches:
+        raise SystemExit(1)
+
+@app.cli.command("upload-variants")
+@click.option("--all", "rebuild", is_flag=True, help="Rebuild variants for every upload, not just unfinished ones")
+@with_appcontext
+def upload_variants(rebuild):
+    """Make the resized variants for uploads that don't have them yet."""
+    import time
+    from server.models import Upload
+    from server.uploads import upload_store, Image
+
+    if Image is None:
+        click.echo("Pillow is not installed")
+        return
+
+    query = db.session.query(Upload.sha256)
+    if not rebuild:
+        query = query.filter(Upload.status != 'ready')
+    sha256s = [row.sha256 for row in query]
+
+    began = time.perf_counter()
+    done = sum(upload_store.process(sha256) for sha256 in sha256s)
+    click.echo(f"Resized {done}/{len(sha256s)} uploads in {time.perf_counter() - began:.2f}s")
+
+@app.cli.command("bench-json")
+@click.option("--rounds", default=2000, help="Payloads encoded per timing")
+def bench_json(rounds):
+    """Compare the stdlib JSON provider with the configured one on API and socket payloads."""
+    import json
+    import time
+    import random
+    from datetime import datetime, timedelta
+    from flask.json.provider import DefaultJSONProvider
+    from socketio import packet
+    from server.json_provider import orjson
+
+    rng = random.Random(1)
+    now = datetime(2026, 10, 17, 12, 0, 0, 123456)
+    words = "see you at the library later tonight? exam notes café 😀 <3 & more".split()
+
+    def author(i):
+        return {"id": i, "alias": f"Curious Scholar{i}", "avatar_color": "blue", "avatar_face": "pink"}
+
+    def message(i):
+        return {
+            "id": i,
+            "content": " ".join(rng.choice(words) for _ in range(rng.randint(3, 30))),
+            "timestamp": (now - timedelta(seconds=i * 37)).isoformat(),
+            "author": author(i % 40),
+            "reactions": {"like": rng.randint(0, 9), "heart": rng.randint(0, 3)} if i % 3 else {},
+            "is_encrypted": False,
+            "user_reactions": ["like"] if i % 7 == 0 else []
+        }
+
+    def post(i):
+        url = f"/uploads/ab/{i:064x}"
+        return {
+            "id": i,
+            "content": " ".join(rng.choice(words) for _ in range(rng.randint(10, 80))),
+            "image_url": f"{url}.jpg",
+            "image": {"url": f"{url}.jpg", "width": 2000, "height": 1500, "variants": {
+                "thumb": {"url": f"{url}_320.jpg", "width": 320, "height": 240},
+                "preview": {"url": f"{url}_1280.jpg", "width": 1280, "height": 960}
+            }} if i % 2 else None,
+            "created_at": (now - timedelta(minutes=i)).isoformat(),
+            "author": author(i % 40),
+            "like_count": rng.randint(0, 200),
+            "comment_count": rng.randint(0, 40),
+            "user_liked": i % 5 == 0
+        }
+
+    payloads = [
+        ("message page x50", {"messages": [message(i) for i in range(50)],
+                              "pagination": {"next_cursor": "MjAyNi0xMC0xN3w1MA", "has_more": True}}),
+        ("feed page x10", {"posts": [post(i) for i in range(10)],
+                           "pagination": {"page": 1, "per_page": 10, "total": 500, "pages": 50,
+                                          "has_next": True, "has_prev": False}}),
+    ]
+
+    stdlib = DefaultJSONProvider(app)
+    stdlib.compact = app.json.compact = True
+    click.echo(f"Encoder: {'orjson ' + orjson.__version__ if app.json.codec.fast else 'json module'}")
+
+    def timed(encode, obj):
+        began = time.perf_counter()
+        for _ in range(rounds):
+            encode(obj)
+        return (time.perf_counter() - began) / rounds * 1e6
+
+    for name, obj in payloads:
+        old, new = stdlib.response(obj).get_data(), app.json.response(obj).get_data()
+        assert json.loads(old) == json.loads(new), name
+        old_us, new_us = timed(stdlib.response, obj), timed(app.json.response, obj)
+        click.echo(f"{name:22} {len(new):>7,} bytes  stdlib {old_us:8.1f}us  "
+                   f"configured {new_us:8.1f}us  {old_us / new_us:5.1f}x")
+
+    # Socket.IO broadcast of one new message, with the packet's json module swapped
+    event = packet.Packet(packet.EVENT, data=["new_message", dict(message(1), channel_id=1)], namespace="/")
+    codec, packet.Packet.json = packet.Packet.json, json
+    old_us = timed(lambda p: p.encode(), event)
+    packet.Packet.json = codec
+    new_us = timed(lambda p: p.encode(), event)
+    click.echo(f"{'socket new_message':22} {'':>13}  stdlib {old_us:8.1f}us  "
+               f"configured {new_us:8.1f}us  {old_us / new_us:5.1f}x")
+
+    # The same feed page with datetime objects left for the encoder instead of isoformat()
+    native = {"posts": [dict(p, created_at=now - timedelta(minutes=p["id"])) for p in payloads[1][1]["posts"]]}
+    assert json.loads(app.json.response(native).get_data()) == json.loads(app.json.response(
+        {"posts": payloads[1][1]["posts"]}).get_data())
+    click.echo(f"{'feed, native datetimes':22} {'':>13}  {'':>16}  "
+               f"configured {timed(app.json.response, native):8.1f}us")
+
 if __name__ == '__main__':
-    with app.app_context():
-        db.create_all()  # Create tables before running
+    # Tables were created when the app was, or are left to `flask db upgrade`
     socketio.run(app, debug=True, port=80)
\ No newline at end of file
@@ -1,7 +1,22 @@
 from flask import Blueprint, request, jsonify, session, current_app
 from server.models import db, User, Channel, Message, Post, Comment, Reaction, DirectMessage, Student
 from server.auth import require_login
-from server.utils import sanitize_text, allowed_file, save_file, encrypt_message, decrypt_message
+from server.utils import sanitize_text, allowed_file
+from server.encryption import message_encryption, channel_scope, dm_scope
+from server.message_writer import message_writer
+from server.uploads import upload_store, InvalidUpload
+from server.connection_profiles import connection_profiles
+from server.cache import invalidate_on_commit
+from server.conditional import conditional, bump
+from server.queries import (
+    load_message_page, paginate_channel_messages, load_author_cards,
+    load_liked_targets, adjust_like_count, adjust_comment_count,
+    record_direct_message, load_conversations, paginate_direct_messages,
+    advance_read_watermark, load_read_watermarks,
+    list_channels, record_channel_activity, refresh_channel_activity,
+    decrypt_channel_messages, decrypt_direct_messages, load_uploads, clamp_page_size
+)
+from server.search import search_messages, search_supported
 from datetime import datetime
 
 api = Blueprint('api', __name__, url_prefix='/api')
@@ -21,6 +36,7 @@ def get_current_user():
 
 @api.route('/users/<int:user_id>', methods=['GET'])
 @require_login
+@conditional('user:{user_id}')
 def get_user(user_id):
     """Get information about another user (limited for anonymity)"""
     user = User.query.get(user_id)
@@ -78,83 +94,61 @@ def update_user_settings():
         if key in data:
             current_settings[key] = data[key]
 
+    if 'avatar_color' in data or 'avatar_face' in data:
+        invalidate_on_commit('author_cards', user.id)
+        bump('authors', f"user:{user.id}")
+
     user.set_settings(current_settings)
     db.session.commit()
 
+    # Refresh the author card cached on the user's open sockets
+    if 'avatar_color' in data or 'avatar_face' in data:
+        connection_profiles.refresh(user)
+
     return jsonify({"status": "success", "settings": user.get_settings()})
 
 
 # Channel endpoints
 @api.route('/channels', methods=['GET'])
 @require_login
+@conditional('channels')
 def get_channels():
     """Get all available channels"""
-    channels = Channel.query.all()
+    # In id order, so the list only changes when the channels do
     return jsonify([{
-        "id": channel.id,
-        "name": channel.name,
-        "description": channel.description
-    } for channel in channels])
+        "id": channel["id"],
+        "name": channel["name"],
+        "description": channel["description"]
+    } for channel in sorted(list_channels(), key=lambda channel: channel["id"])])
 
 
 @api.route('/channels/<int:channel_id>/messages', methods=['GET'])
 @require_login
 def get_channel_messages(channel_id):
-    """Get messages for a specific channel with pagination"""
-    page = request.args.get('page', 1, type=int)
+    """Get messages for a specific channel with cursor pagination"""
     per_page = request.args.get('per_page', 50, type=int)
-
-    # Get messages with pagination
-    messages = Message.query.filter_by(channel_id=channel_id) \
-        .order_by(Message.timestamp.desc()) \
-        .paginate(page=page, per_page=per_page, error_out=False)
-
-    messages_data = []
-    for message in messages.items:
-        author = User.query.get(message.user_id)
-
-        # Decrypt message if needed
-        content = message.content
-        if message.is_encrypted and current_app.config.get('ENCRYPTION_ENABLED'):
-            # In a real app, we would retrieve the encryption keys from a secure store
-            # For demo purposes, we're just handling the fact that messages are encrypted
-            pass
-
-        # Count reactions by type
-        reactions = {}
-        for reaction in message.reactions:
-            reaction_type = reaction.reaction_type
-            if reaction_type not in reactions:
-                reactions[reaction_type] = 0
-            reactions[reaction_type] += 1
-
-        messages_data.append({
-            "id": message.id,
-            "content": content,
-            "timestamp": message.timestamp.isoformat(),
-            "author": {
-                "id": author.id,
-                "alias": author.alias,
-                "avatar_color": author.avatar_color,
-                "avatar_face": author.avatar_face
-            },
-            "reactions": reactions,
-            "is_encrypted": message.is_encrypted
-        })
+    include_total = request.args.get('include_total', 'false').lower() in ['true', 'yes', '1']
+
+    # Get one page of messages, newest first
+    try:
+        messages, pagination = paginate_channel_messages(
+            channel_id, per_page,
+            before=request.args.get('before_id'),
+            after=request.args.get('after_id'),
+            include_total=include_total
+        )
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
+
+    # Load authors and reaction counts for the whole page at once
+    messages_data = load_message_page(messages)
 
     # Reverse to get chronological order
     messages_data.reverse()
 
     return jsonify({
         "messages": messages_data,
-        "pagination": {
-            "page": page,
-            "per_page": per_page,
-            "total": messages.total,
-            "pages": messages.pages,
-            "has_next": messages.has_next,
-            "has_prev": messages.has_prev
-        }
+        "pagination": pagination
     })
 
 
@@ -175,24 +169,34 @@ def create_message():
     # Sanitize the content
     content = sanitize_text(data['content'])
 
-    # Apply encryption if enabled
-    if current_app.config.get('ENCRYPTION_ENABLED'):
-        encrypted_content, key, nonce = encrypt_message(content)
+    # Encrypt the stored copy if enabled
+    if message_encryption.enabled:
+        encrypted_content = message_encryption.encrypt(channel_scope(data['channel_id']), content)
         is_encrypted = True
     else:
         encrypted_content = content
         is_encrypted = False
 
-    # Create new message
-    new_message = Message(
-        content=encrypted_content,
-        user_id=session['user_id'],
-        channel_id=data['channel_id'],
-        is_encrypted=is_encrypted
-    )
-
-    db.session.add(new_message)
-    db.session.commit()
+    # Create new message, through the write-behind queue if it is enabled
+    if message_writer.enabled:
+        new_message = message_writer.write(
+            content=encrypted_content,
+            user_id=session['user_id'],
+            channel_id=data['channel_id'],
+            is_encrypted=is_encrypted
+        )
+    else:
+        new_message = Message(
+            content=encrypted_content,
+            user_id=session['user_id'],
+            channel_id=data['channel_id'],
+            is_encrypted=is_encrypted
+        )
+
+        db.session.add(new_message)
+        db.session.flush()
+        record_channel_activity(new_message.channel_id, new_message.id, new_message.timestamp)
+        db.session.commit()
 
     # Get author data for response
     author = User.query.get(new_message.user_id)
@@ -237,7 +241,7 @@ def get_message(message_id):
 
     return jsonify({
         "id": message.id,
-        "content": message.content,
+        "content": decrypt_channel_messages([message]).get(message.id, message.content),
         "timestamp": message.timestamp.isoformat(),
         "author": {
             "id": author.id,
@@ -265,14 +269,62 @@ def delete_message(message_id):
 
     # Delete message and related reactions
     db.session.delete(message)
+    db.session.flush()
+    refresh_channel_activity(message.channel_id)
     db.session.commit()
 
     return jsonify({"status": "success", "message": "Message deleted"})
 
 
+# Search endpoints
+@api.route('/search', methods=['GET'])
+@require_login
+def search():
+    """Full-text search over unencrypted channel messages, best match first"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"error": "Search query is required"}), 400
+
+    if not search_supported(db.engine):
+        return jsonify({"error": "Search is not available"}), 503
+
+    limit = clamp_page_size(request.args.get('limit', 20, type=int))
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    channel_ids = request.args.getlist('channel_id', type=int)
+
+    # Optional time range as ISO 8601 timestamps
+    try:
+        since = request.args.get('since')
+        since = datetime.fromisoformat(since) if since else None
+        until = request.args.get('until')
+        until = datetime.fromisoformat(until) if until else None
+    except ValueError:
+        return jsonify({"error": "Invalid date"}), 400
+
+    results = search_messages(query, channel_ids, since, until, limit=limit, offset=offset)
+
+    # Serialize the whole page at once, then attach the search fields
+    messages_data = load_message_page([message for message, _, _ in results],
+                                      user_id=session['user_id'], include_channel=True)
+    matches = {message.id: (snippet, rank) for message, snippet, rank in results}
+    for message_data in messages_data:
+        message_data["snippet"], message_data["rank"] = matches[message_data["id"]]
+
+    return jsonify({
+        "query": query,
+        "results": messages_data,
+        "pagination": {
+            "limit": limit,
+            "offset": offset,
+            "has_next": len(results) == limit
+        }
+    })
+
+
 # Post endpoints for social feed
 @api.route('/posts', methods=['GET'])
 @require_login
+@conditional('posts', 'authors')
 def get_posts():
     """Get posts for the social feed with pagination"""
     page = request.args.get('page', 1, type=int)
@@ -282,42 +334,23 @@ def get_posts():
     posts = Post.query.order_by(Post.created_at.desc()) \
         .paginate(page=page, per_page=per_page, error_out=False)
 
+    # Load authors and the current user's likes for the whole page at once
+    authors = load_author_cards(post.user_id for post in posts.items)
+    liked = load_liked_targets('post', [post.id for post in posts.items], session['user_id'])
+    images = load_uploads(post.upload_sha256 for post in posts.items)
+
     posts_data = []
     for post in posts.items:
-        author = User.query.get(post.user_id)
-
-        # Get like count
-        like_count = Reaction.query.filter_by(
-            target_id=post.id,
-            target_type='post',
-            reaction_type='like'
-        ).count()
-
-        # Check if current user has liked this post
-        user_liked = Reaction.query.filter_by(
-            target_id=post.id,
-            target_type='post',
-            reaction_type='like',
-            user_id=session['user_id']
-        ).first() is not None
-
-        # Get comment count
-        comment_count = Comment.query.filter_by(post_id=post.id).count()
-
         posts_data.append({
             "id": post.id,
             "content": post.content,
             "image_url": post.image_url,
+            "image": images.get(post.upload_sha256),
             "created_at": post.created_at.isoformat(),
-            "author": {
-                "id": author.id,
-                "alias": author.alias,
-                "avatar_color": author.avatar_color,
-                "avatar_face": author.avatar_face
-            },
-            "like_count": like_count,
-            "comment_count": comment_count,
-            "user_liked": user_liked
+            "author": authors.get(post.user_id),
+            "like_count": post.like_count,
+            "comment_count": post.comment_count,
+            "user_liked": post.id in liked
         })
 
     return jsonify({
@@ -339,6 +372,7 @@ def create_post():
     """Create a new post in the social feed"""
     # Check content type for file upload
     image_url = None
+    upload = None
 
     if request.content_type and request.content_type.startswith('multipart/form-data'):
         # Handle form submission with possible file
@@ -346,7 +380,11 @@ def create_post():
         image = request.files.get('image')
 
         if image and allowed_file(image.filename):
-            image_url = save_file(image)
+            try:
+                upload = upload_store.save(image)
+            except InvalidUpload:
+                return jsonify({"error": "Invalid image"}), 400
+            image_url = upload.url
     else:
         # Handle JSON request
         data = request.get_json()
@@ -363,10 +401,12 @@ def create_post():
     new_post = Post(
         content=content,
         image_url=image_url,
+        upload_sha256=upload.sha256 if upload else None,
         user_id=session['user_id']
     )
 
     db.session.add(new_post)
+    bump('posts')
     db.session.commit()
 
     # Get author data for response
@@ -376,6 +416,7 @@ def create_post():
         "id": new_post.id,
         "content": new_post.content,
         "image_url": new_post.image_url,
+        "image": load_uploads([new_post.upload_sha256]).get(new_post.upload_sha256),
         "created_at": new_post.created_at.isoformat(),
         "author": {
             "id": author.id,
@@ -403,6 +444,7 @@ def delete_post(post_id):
 
     # Delete post and related comments/reactions
     db.session.delete(post)
+    bump('posts')
     db.session.commit()
 
     return jsonify({"status": "success", "message": "Post deleted"})
@@ -420,37 +462,19 @@ def get_comments(post_id):
 
     comments = Comment.query.filter_by(post_id=post_id).order_by(Comment.created_at).all()
 
+    # Load authors and the current user's likes for all comments at once
+    authors = load_author_cards(comment.user_id for comment in comments)
+    liked = load_liked_targets('comment', [comment.id for comment in comments], session['user_id'])
+
     comments_data = []
     for comment in comments:
-        author = User.query.get(comment.user_id)
-
-        # Get like count
-        like_count = Reaction.query.filter_by(
-            target_id=comment.id,
-            target_type='comment',
-            reaction_type='like'
-        ).count()
-
-        # Check if current user has liked this comment
-        user_liked = Reaction.query.filter_by(
-            target_id=comment.id,
-            target_type='comment',
-            reaction_type='like',
-            user_id=session['user_id']
-        ).first() is not None
-
         comments_data.append({
             "id": comment.id,
             "content": comment.content,
             "created_at": comment.created_at.isoformat(),
-            "author": {
-                "id": author.id,
-                "alias": author.alias,
-                "avatar_color": author.avatar_color,
-                "avatar_face": author.avatar_face
-            },
-            "like_count": like_count,
-            "user_liked": user_liked
+            "author": authors.get(comment.user_id),
+            "like_count": comment.like_count,
+            "user_liked": comment.id in liked
         })
 
     return jsonify(comments_data)
@@ -480,6 +504,7 @@ def create_comment(post_id):
     )
 
     db.session.add(new_comment)
+    adjust_comment_count(post_id, 1)
     db.session.commit()
 
     # Get author data for response
@@ -514,6 +539,7 @@ def delete_comment(comment_id):
 
     # Delete comment and related reactions
     db.session.delete(comment)
+    adjust_comment_count(comment.post_id, -1)
     db.session.commit()
 
     return jsonify({"status": "success", "message": "Comment deleted"})
@@ -559,6 +585,8 @@ def add_reaction():
     if existing_reaction:
         # Toggle off (remove) the reaction
         db.session.delete(existing_reaction)
+        if reaction_type == 'like':
+            adjust_like_count(target_type, target_id, -1)
         db.session.commit()
         return jsonify({"status": "removed"})
 
@@ -575,6 +603,8 @@ def add_reaction():
         new_reaction.message_id = target_id
 
     db.session.add(new_reaction)
+    if reaction_type == 'like':
+        adjust_like_count(target_type, target_id, 1)
     db.session.commit()
 
     return jsonify({"status": "added"})
@@ -584,58 +614,103 @@ def add_reaction():
 @api.route('/direct-messages', methods=['GET'])
 @require_login
 def get_direct_messages():
-    """Get direct messages between current user and another user"""
+    """Get one page of direct messages between current user and another user"""
     user_id = session['user_id']
     recipient_id = request.args.get('user_id', type=int)
+    limit = request.args.get('limit', 50, type=int)
+    before = request.args.get('before')
 
     if not recipient_id:
         return jsonify({"error": "Recipient ID required"}), 400
 
-    # Check if recipient exists
-    recipient = User.query.get(recipient_id)
-    if not recipient:
+    # Both authors in one lookup, which also checks the recipient exists
+    authors = load_author_cards([user_id, recipient_id])
+    if recipient_id not in authors:
         return jsonify({"error": "Recipient not found"}), 404
 
-    # Get messages between the two users
-    messages = DirectMessage.query.filter(
-        ((DirectMessage.sender_id == user_id) & (DirectMessage.recipient_id == recipient_id)) |
-        ((DirectMessage.sender_id == recipient_id) & (DirectMessage.recipient_id == user_id))
-    ).order_by(DirectMessage.timestamp).all()
+    # Get one page of messages between the two users, newest first
+    try:
+        messages, pagination = paginate_direct_messages(user_id, recipient_id, limit, before=before)
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
 
-    messages_data = []
-    for msg in messages:
-        sender = User.query.get(msg.sender_id)
+    # Opening the newest page reads the conversation up to its latest message
+    if before is None and messages:
+        advance_read_watermark(user_id, recipient_id, messages[0].id)
 
-        # Decrypt message if needed
-        content = msg.content
-        if msg.is_encrypted and current_app.config.get('ENCRYPTION_ENABLED'):
-            # In a real app, we would retrieve the encryption keys from a secure store
-            pass
+    read_up_to, partner_read_up_to = load_read_watermarks(user_id, recipient_id)
+
+    contents = decrypt_direct_messages(messages)
+
+    messages_data = []
+    for msg in reversed(messages):
+        # A message is read once its recipient's watermark has passed it
+        watermark = partner_read_up_to if msg.sender_id == user_id else read_up_to
 
         messages_data.append({
             "id": msg.id,
-            "content": content,
+            "content": contents.get(msg.id, msg.content),
             "timestamp": msg.timestamp.isoformat(),
-            "sender": {
-                "id": sender.id,
-                "alias": sender.alias,
-                "avatar_color": sender.avatar_color,
-                "avatar_face": sender.avatar_face
-            },
-            "is_read": msg.is_read,
+            "sender": authors.get(msg.sender_id),
+            "is_read": msg.id <= watermark,
             "is_encrypted": msg.is_encrypted
         })
 
-    # Mark unread messages as read
-    DirectMessage.query.filter_by(
-        recipient_id=user_id,
-        sender_id=recipient_id,
-        is_read=False
-    ).update({DirectMessage.is_read: True})
-
     db.session.commit()
 
-    return jsonify(messages_data)
+    return jsonify({
+        "messages": messages_data,
+        "pagination": pagination,
+        "read_up_to": read_up_to,
+        "partner_read_up_to": partner_read_up_to
+    })
+
+
+@api.route('/direct-messages/conversations', methods=['GET'])
+@require_login
+def get_conversations():
+    """Get the current user's DM conversations with their last message and unread count"""
+    # Bounded the same way load_conversations bounds it, for the pagination fields
+    limit = clamp_page_size(request.args.get('limit', 50, type=int))
+
+    try:
+        before = request.args.get('before')
+        before = datetime.fromisoformat(before) if before else None
+    except ValueError:
+        return jsonify({"error": "Invalid date"}), 400
+
+    conversations = load_conversations(session['user_id'], limit=limit, before=before)
+    previews = decrypt_direct_messages([last_message for _, _, last_message in conversations if last_message])
+
+    conversations_data = []
+    for conversation, partner, last_message in conversations:
+        conversations_data.append({
+            "partner": {
+                "id": partner.id,
+                "alias": partner.alias,
+                "avatar_color": partner.avatar_color,
+                "avatar_face": partner.avatar_face,
+                "is_online": partner.is_online
+            },
+            "last_message": {
+                "id": last_message.id,
+                "content": previews.get(last_message.id, last_message.content),
+                "timestamp": last_message.timestamp.isoformat(),
+                "sender_id": last_message.sender_id,
+                "is_encrypted": last_message.is_encrypted
+            } if last_message else None,
+            "last_message_at": conversation.last_message_at.isoformat() if conversation.last_message_at else None,
+            "unread_count": conversation.unread_count
+        })
+
+    return jsonify({
+        "conversations": conversations_data,
+        "pagination": {
+            "limit": limit,
+            "has_next": len(conversations) == limit,
+            "next_before": conversations_data[-1]["last_message_at"] if conversations_data else None
+        }
+    })
 
 
 @api.route('/direct-messages', methods=['POST'])
@@ -657,9 +732,9 @@ def send_direct_message():
     # Sanitize content
     content = sanitize_text(data['content'])
 
-    # Apply encryption if enabled
-    if current_app.config.get('ENCRYPTION_ENABLED'):
-        encrypted_content, key, nonce = encrypt_message(content)
+    # Encrypt the stored copy if enabled
+    if message_encryption.enabled:
+        encrypted_content = message_encryption.encrypt(dm_scope(sender_id, recipient_id), content)
         is_encrypted = True
     else:
         encrypted_content = content
@@ -675,6 +750,8 @@ def send_direct_message():
     )
 
     db.session.add(new_dm)
+    db.session.flush()
+    record_direct_message(new_dm)
     db.session.commit()
 
     # Get sender data for response
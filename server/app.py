@@ -33,10 +33,34 @@ def create_app(config_name='default'):
     # Set up logging
     setup_logging(app)
     
+    # JSON for API responses and Socket.IO packets
+    from server.json_provider import FastJSONProvider
+    app.json = FastJSONProvider(app)
+
     # Initialize extensions
     db.init_app(app)
-    socketio.init_app(app, cors_allowed_origins="*", logger=True, engineio_logger=True)
+    from server.message_bus import get_queue_options
+    socketio.init_app(app, cors_allowed_origins="*", logger=True, engineio_logger=True,
+                      json=app.json.codec, **get_queue_options(app.config))
     mail.init_app(app)  # Initialize Flask-Mail
+    from server.message_writer import message_writer
+    message_writer.init_app(app)
+    from server.presence import presence
+    presence.init_app(app)
+    from server.typing_indicators import typing_tracker
+    typing_tracker.init_app(app)
+    from server import cache
+    cache.init_app(app)
+    from server.passwords import password_hasher
+    password_hasher.init_app(app)
+    from server.mail_outbox import mail_outbox
+    mail_outbox.init_app(app)
+    from server.verification_reaper import verification_reaper
+    verification_reaper.init_app(app)
+    from server.encryption import message_encryption
+    message_encryption.init_app(app)
+    from server.uploads import upload_store
+    upload_store.init_app(app)
     app.logger.info("Extensions initialized")
     
     # Initialize other extensions
@@ -110,6 +134,10 @@ def register_blueprints(app):
     # Import other API routes
     from server.api import api
     app.register_blueprint(api)
+
+    # Uploaded images, served with long-lived caching
+    from server.uploads import uploads
+    app.register_blueprint(uploads)
     
     # Register basic routes
     register_basic_routes(app)
@@ -137,12 +165,32 @@ def register_error_handlers(app):
         return render_template('errors/500.html'), 500
 
 def initialize_database(app):
-    """Initialize database with tables and default data"""
-    from server.models import User, Channel, Message, Post, Comment, Reaction, Student, VerificationCode, DirectMessage
-    
-    # Create tables
-    db.create_all()
-    
+    """Initialize database with tables and default data
+
+    Tables are only created on a new database, which is then stamped with
+    the latest migration. An existing database is left to ``flask db
+    upgrade``: until it is at the latest revision the models may not match
+    its tables, so nothing is created or queried here.
+    """
+    from sqlalchemy import inspect
+    from alembic.migration import MigrationContext
+    from alembic.script import ScriptDirectory
+    from server import models  # Registers every table on db.metadata
+    from server.search import create_search_index
+
+    script = ScriptDirectory(os.path.join(os.path.dirname(app.root_path), 'migrations'))
+    with db.engine.begin() as conn:
+        context = MigrationContext.configure(conn)
+        if not set(inspect(conn).get_table_names()) - {'alembic_version'}:
+            app.logger.info("Creating database tables")
+            db.metadata.create_all(conn)
+            # The full-text search index is not a model table
+            create_search_index(conn)
+            context.stamp(script, 'heads')
+        elif set(context.get_current_heads()) != set(script.get_heads()):
+            app.logger.warning("Database schema is not at the latest migration, run `flask db upgrade`")
+            return
+
     # Create default channels if they don't exist
     initialize_channels(app)
     
@@ -152,6 +200,7 @@ def initialize_database(app):
 def initialize_channels(app):
     """Initialize default channels"""
     from server.models import Channel
+    from server.conditional import bump
     
     if Channel.query.count() == 0:
         app.logger.info("Creating default channels")
@@ -164,6 +213,7 @@ def initialize_channels(app):
         ]
         
         db.session.add_all(channels)
+        bump('channels')
         db.session.commit()
         
         app.logger.info(f"Created {len(channels)} default channels")
@@ -4,17 +4,20 @@ from datetime import datetime, timedelta
 from functools import wraps
 from flask import Blueprint, render_template, redirect, url_for, request
 from flask import session, flash, jsonify, current_app
-from flask_mail import Mail, Message
 from itsdangerous import URLSafeTimedSerializer, SignatureExpired, BadSignature
-from werkzeug.security import generate_password_hash, check_password_hash
 
 from server.models import db, User, Student, VerificationCode
 from server.utils import sanitize_text, generate_verification_code
+from server.queries import load_student
+from server.cache import invalidate_on_commit
+from server.conditional import bump
+from server.passwords import password_hasher, HasherBusy
+from server.mail_outbox import mail_outbox
 
 auth = Blueprint('auth', __name__)
 
-# Initialize mail extension
-mail = Mail()
+# Shown when the password hasher's queue is full
+BUSY_ERROR = "The server is busy right now. Please try again in a moment."
 
 def require_login(f):
     """Decorator to require login for routes"""
@@ -47,20 +50,26 @@ def login():
             return render_template('login.html', error=error)
 
         # Check if student ID exists and is registered
-        student = Student.query.get(student_id)
+        student = load_student(student_id)
 
         if not student:
             error = "Invalid student ID. Please check and try again."
             return render_template('login.html', error=error)
 
-        if not student.is_registered:
+        if not student["is_registered"]:
             error = "This Student ID is not registered. Please register first."
             return render_template('login.html', error=error)
 
         # Find user
         user = User.query.filter_by(student_id=student_id).first()
 
-        if user and check_password_hash(user.password_hash, password):
+        try:
+            valid = user is not None and password_hasher.verify(user.password_hash, password)
+        except HasherBusy:
+            error = BUSY_ERROR
+            return render_template('login.html', error=error), 503
+
+        if valid:
             # Valid login
             session['user_id'] = user.id
             session['alias'] = user.alias
@@ -68,6 +77,7 @@ def login():
 
             # Update online status
             user.is_online = True
+            bump('presence', f"user:{user.id}")
             db.session.commit()
 
             # Redirect to next page or default
@@ -98,13 +108,13 @@ def register():
             return render_template('registration.html', error=error)
 
         # Check if student ID exists in the system
-        student = Student.query.get(student_id)
+        student = load_student(student_id)
         if not student:
             error = "This Student ID is not recognized. Please contact support."
             return render_template('registration.html', error=error)
 
         # Check if student is already registered
-        if student.is_registered:
+        if student["is_registered"]:
             error = "This Student ID is already registered."
             return render_template('registration.html', error=error)
             
@@ -191,6 +201,12 @@ def verify_registration():
             alias = generate_alias()
             
         avatar_data = generate_avatar_data()
+
+        try:
+            password_hash = password_hasher.hash(password)
+        except HasherBusy:
+            error = BUSY_ERROR
+            return render_template('verify_registration.html', error=error, email=email), 503
         
         new_user = User(
             student_id=student_id,
@@ -198,12 +214,13 @@ def verify_registration():
             alias=alias,
             avatar_color=avatar_data['color'],
             avatar_face=avatar_data['face'],
-            password_hash=generate_password_hash(password)
+            password_hash=password_hash
         )
         
         # Mark student as registered
         student = Student.query.get(student_id)
         student.is_registered = True
+        invalidate_on_commit('students', student_id)
         
         # Save to database
         db.session.add(new_user)
@@ -227,7 +244,7 @@ def forgot_password():
         student_id = request.form.get('email')  # Using email field for student ID
 
         # Check if student ID exists and is registered
-        student = Student.query.get(student_id)
+        student = load_student(student_id)
         user = User.query.filter_by(student_id=student_id).first() if student else None
 
         if student and user:
@@ -309,7 +326,11 @@ def reset_password():
             return render_template('reset_password.html', error=error)
         
         # Code is valid, update password
-        user.password_hash = generate_password_hash(new_password)
+        try:
+            user.password_hash = password_hasher.hash(new_password)
+        except HasherBusy:
+            error = BUSY_ERROR
+            return render_template('reset_password.html', error=error), 503
         
         # Save changes and remove used code
         db.session.delete(verification)
@@ -331,6 +352,7 @@ def logout():
         user = User.query.get(session['user_id'])
         if user:
             user.is_online = False
+            bump('presence', f"user:{user.id}")
             db.session.commit()
 
     # Clear session
@@ -440,17 +462,11 @@ def send_verification_email(email, code):
         <p>Regards,<br>Campus Connect Team</p>
         """
         
-        msg = Message(
-            subject=subject,
-            recipients=[email],
-            html=body,
-            sender=current_app.config.get('MAIL_DEFAULT_SENDER', 'noreply@campusconnect.com')
-        )
-        
-        mail.send(msg)
+        # Delivered by the outbox sender, so the request doesn't wait on SMTP
+        mail_outbox.enqueue(email, subject, body)
         return True
     except Exception as e:
-        current_app.logger.error(f"Failed to send verification email: {str(e)}")
+        current_app.logger.error(f"Failed to queue verification email: {str(e)}")
         return False
 
 
@@ -467,15 +483,9 @@ def send_password_reset_email(email, code):
         <p>Regards,<br>Campus Connect Team</p>
         """
         
-        msg = Message(
-            subject=subject,
-            recipients=[email],
-            html=body,
-            sender=current_app.config.get('MAIL_DEFAULT_SENDER', 'noreply@campusconnect.com')
-        )
-        
-        mail.send(msg)
+        # Delivered by the outbox sender, so the request doesn't wait on SMTP
+        mail_outbox.enqueue(email, subject, body)
         return True
     except Exception as e:
-        current_app.logger.error(f"Failed to send password reset email: {str(e)}")
+        current_app.logger.error(f"Failed to queue password reset email: {str(e)}")
         return False
\ No newline at end of file
@@ -0,0 +1,177 @@
+import time
+import logging
+from collections import OrderedDict
+from sqlalchemy import event
+from server.app import db, socketio
+
+logger = logging.getLogger('api')
+
+_MISSING = object()
+
+# Every named cache in this process, by name
+caches = {}
+
+
+class Cache:
+    """Process-local LRU cache whose entries also expire after ``ttl`` seconds.
+
+    Writers call :func:`invalidate` or :func:`invalidate_on_commit` for the
+    keys they change; invalidations are forwarded to the other workers when
+    the Socket.IO message queue is the SQLite bus. The TTL bounds how stale
+    an entry can get when an invalidation is missed.
+    """
+
+    def __init__(self, name, maxsize=1024, ttl=60):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()   # key -> (expires_at, value), least recently used first
+        self._listeners = []
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        caches[name] = self
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            del self._entries[key]
+
+        self.misses += 1
+        return default
+
+    def set(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get_or_load(self, key, loader):
+        """Get a value, calling ``loader()`` on a miss. ``None`` results are not cached."""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            if value is not None:
+                self.set(key, value)
+        return value
+
+    def get_many(self, keys, loader):
+        """Get several values, loading all the misses with one ``loader(keys)`` call.
+
+        ``loader`` returns a dict; keys it leaves out are treated as missing
+        and are not cached.
+        """
+        found, missing = {}, []
+        for key in keys:
+            value = self.get(key, _MISSING)
+            if value is _MISSING:
+                missing.append(key)
+            else:
+                found[key] = value
+
+        if missing:
+            loaded = loader(missing)
+            for key, value in loaded.items():
+                self.set(key, value)
+            found.update(loaded)
+
+        return found
+
+    def invalidate(self, *keys):
+        """Drop some keys, or everything when called without keys"""
+        if keys:
+            for key in keys:
+                self._entries.pop(key, None)
+        else:
+            self._entries.clear()
+
+        for listener in self._listeners:
+            listener(keys)
+
+    def on_invalidate(self, listener):
+        """Call ``listener(keys)`` whenever this cache is invalidated, locally or remotely"""
+        self._listeners.append(listener)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+
+# Shared caches for slowly changing data
+author_cards = Cache('author_cards', maxsize=10000, ttl=300)
+channel_list = Cache('channel_list', maxsize=1, ttl=5)
+students = Cache('students', maxsize=10000, ttl=300)
+encryption_keys = Cache('encryption_keys', maxsize=10000, ttl=3600)   # AESGCM objects by scope
+
+_bus = None
+
+
+def invalidate(name, *keys, broadcast=True):
+    """Invalidate keys of a named cache here and, if ``broadcast``, on every other worker"""
+    caches[name].invalidate(*keys)
+    if broadcast and _bus is not None:
+        try:
+            _bus.publish_control('cache_invalidate', cache=name, keys=list(keys))
+        except Exception as e:
+            logger.error(f"Error publishing invalidation for cache {name}: {str(e)}")
+
+
+def invalidate_on_commit(name, *keys, broadcast=True):
+    """Invalidate once the current transaction commits, so readers never reload the old row"""
+    db.session.info.setdefault('cache_invalidations', []).append((name, keys, broadcast))
+
+
+def stats():
+    return {name: cache.stats() for name, cache in caches.items()}
+
+
+def _after_commit(session):
+    for name, keys, broadcast in session.info.pop('cache_invalidations', []):
+        invalidate(name, *keys, broadcast=broadcast)
+
+
+def _after_rollback(session):
+    session.info.pop('cache_invalidations', None)
+
+
+def _on_remote_invalidate(data):
+    cache = caches.get(data.get('cache'))
+    if cache is not None:
+        cache.invalidate(*data.get('keys', ()))
+
+
+def init_app(app):
+    """Apply configured cache sizes and subscribe to invalidations from other workers"""
+    global _bus
+
+    for name, options in app.config.get('CACHES', {}).items():
+        cache = caches.get(name)
+        if cache is not None:
+            cache.maxsize = options.get('maxsize', cache.maxsize)
+            cache.ttl = options.get('ttl', cache.ttl)
+
+    event.listen(db.session, 'after_commit', _after_commit)
+    event.listen(db.session, 'after_rollback', _after_rollback)
+
+    manager = socketio.server.manager
+    if hasattr(manager, 'publish_control'):
+        _bus = manager
+        manager.on_control('cache_invalidate', _on_remote_invalidate)
+        # Listen right away rather than on the first socket connection, so
+        # workers that only serve HTTP still hear about invalidations
+        if not socketio.server.manager_initialized:
+            socketio.server.manager_initialized = True
+            manager.initialize()
@@ -2,6 +2,13 @@ from flask import Blueprint, request, jsonify, session, current_app
 from server.models import db, Message, Channel, User, Reaction
 from server.auth import require_login
 from server.utils import sanitize_text
+from server.message_writer import message_writer
+from server.encryption import message_encryption, channel_scope
+from server.conditional import conditional
+from server.queries import (
+    load_message_page, paginate_channel_messages, load_channel_unread_counts,
+    list_channels, record_channel_activity, refresh_channel_activity
+)
 from datetime import datetime
 import logging
 
@@ -13,34 +20,29 @@ channel_api = Blueprint('channel_api', __name__, url_prefix='/api/channels')
 
 @channel_api.route('/', methods=['GET'])
 @require_login
+@conditional('channels', 'channel:*', 'reads:{current_user}')
 def get_channels():
-    """Get all available channels"""
+    """Get all available channels, most recently active first"""
     try:
-        channels = Channel.query.all()
-        
+        channels = list_channels()
+
+        # Unread counts from the user's read watermarks, capped at UNREAD_COUNT_CAP
+        unread_counts = load_channel_unread_counts(session['user_id'], [channel["id"] for channel in channels])
+
         result = []
         for channel in channels:
-            # Get last message timestamp for sorting
-            last_message = Message.query.filter_by(channel_id=channel.id).order_by(Message.timestamp.desc()).first()
-            last_activity = last_message.timestamp if last_message else channel.created_at
-            
-            # Get unread message count
-            # In a real app, you'd track which messages each user has read
-            # This is a simplified example
-            
-            channel_data = {
-                "id": channel.id,
-                "name": channel.name,
-                "description": channel.description,
+            last_activity = channel["last_message_at"] or channel["created_at"]
+
+            result.append({
+                "id": channel["id"],
+                "name": channel["name"],
+                "description": channel["description"],
                 "last_activity": last_activity.isoformat(),
-                "created_at": channel.created_at.isoformat()
-            }
-            
-            result.append(channel_data)
-            
-        # Sort by last activity
-        result.sort(key=lambda x: x['last_activity'], reverse=True)
-        
+                "last_message_id": channel["last_message_id"],
+                "created_at": channel["created_at"].isoformat(),
+                "unread_count": unread_counts.get(channel["id"], 0)
+            })
+
         return jsonify(result)
         
     except Exception as e:
@@ -50,6 +52,7 @@ def get_channels():
 
 @channel_api.route('/<int:channel_id>', methods=['GET'])
 @require_login
+@conditional('channel:{channel_id}', 'authors', 'presence')
 def get_channel(channel_id):
     """Get details for a specific channel"""
     try:
@@ -89,7 +92,7 @@ def get_channel(channel_id):
 @channel_api.route('/<int:channel_id>/messages', methods=['GET'])
 @require_login
 def get_channel_messages(channel_id):
-    """Get messages for a specific channel with pagination"""
+    """Get messages for a specific channel with cursor pagination"""
     try:
         # Check if channel exists
         channel = Channel.query.get(channel_id)
@@ -97,74 +100,33 @@ def get_channel_messages(channel_id):
             return jsonify({"error": "Channel not found"}), 404
             
         # Get pagination parameters
-        page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 50, type=int)
+        include_total = request.args.get('include_total', 'false').lower() in ['true', 'yes', '1']
         
         # Limit per_page to avoid huge requests
         if per_page > 100:
             per_page = 100
             
-        # Get messages with pagination, ordered by timestamp
-        messages = Message.query.filter_by(channel_id=channel_id) \
-            .order_by(Message.timestamp.desc()) \
-            .paginate(page=page, per_page=per_page, error_out=False)
-
-        messages_data = []
-        for message in messages.items:
-            author = User.query.get(message.user_id)
-            if not author:
-                # Skip messages with missing authors
-                continue
-
-            # Handle encrypted content
-            content = message.content
-            if message.is_encrypted and current_app.config.get('ENCRYPTION_ENABLED'):
-                # In a real app with end-to-end encryption, the client would decrypt
-                # For this example, we're just acknowledging it's encrypted
-                pass
-
-            # Count reactions by type
-            reactions = {}
-            for reaction in message.reactions:
-                reaction_type = reaction.reaction_type
-                if reaction_type not in reactions:
-                    reactions[reaction_type] = 0
-                reactions[reaction_type] += 1
-                
-            # Check if current user has reacted to this message
-            user_reactions = []
-            for reaction in message.reactions:
-                if reaction.user_id == session['user_id']:
-                    user_reactions.append(reaction.reaction_type)
-
-            messages_data.append({
-                "id": message.id,
-                "content": content,
-                "timestamp": message.timestamp.isoformat(),
-                "author": {
-                    "id": author.id,
-                    "alias": author.alias,
-                    "avatar_color": author.avatar_color,
-                    "avatar_face": author.avatar_face
-                },
-                "reactions": reactions,
-                "user_reactions": user_reactions,
-                "is_encrypted": message.is_encrypted
-            })
+        # Get one page of messages, newest first, starting from the cursor
+        try:
+            messages, pagination = paginate_channel_messages(
+                channel_id, per_page,
+                before=request.args.get('before_id'),
+                after=request.args.get('after_id'),
+                include_total=include_total
+            )
+        except ValueError:
+            return jsonify({"error": "Invalid cursor"}), 400
+
+        # Load authors, reaction counts and the user's own reactions in bulk
+        messages_data = load_message_page(messages, user_id=session['user_id'])
 
         # Reverse for chronological order (oldest first)
         messages_data.reverse()
 
         return jsonify({
             "messages": messages_data,
-            "pagination": {
-                "page": page,
-                "per_page": per_page,
-                "total": messages.total,
-                "pages": messages.pages,
-                "has_next": messages.has_next,
-                "has_prev": messages.has_prev
-            }
+            "pagination": pagination
         })
         
     except Exception as e:
@@ -191,26 +153,35 @@ def create_message(channel_id):
         # Sanitize the content
         content = sanitize_text(data['content'])
         
-        # Apply encryption if enabled
+        # Encrypt the stored copy if enabled
         is_encrypted = False
-        if current_app.config.get('ENCRYPTION_ENABLED'):
-            from .utils import encrypt_message
-            encrypted_content, key, nonce = encrypt_message(content)
+        if message_encryption.enabled:
+            encrypted_content = message_encryption.encrypt(channel_scope(channel_id), content)
             is_encrypted = True
         else:
             encrypted_content = content
 
-        # Create new message
-        new_message = Message(
-            content=encrypted_content,
-            user_id=user_id,
-            channel_id=channel_id,
-            is_encrypted=is_encrypted,
-            timestamp=datetime.utcnow()
-        )
+        # Create new message, through the write-behind queue if it is enabled
+        if message_writer.enabled:
+            new_message = message_writer.write(
+                content=encrypted_content,
+                user_id=user_id,
+                channel_id=channel_id,
+                is_encrypted=is_encrypted
+            )
+        else:
+            new_message = Message(
+                content=encrypted_content,
+                user_id=user_id,
+                channel_id=channel_id,
+                is_encrypted=is_encrypted,
+                timestamp=datetime.utcnow()
+            )
 
-        db.session.add(new_message)
-        db.session.commit()
+            db.session.add(new_message)
+            db.session.flush()
+            record_channel_activity(channel_id, new_message.id, new_message.timestamp)
+            db.session.commit()
 
         # Get author data for response
         author = User.query.get(user_id)
@@ -258,6 +229,8 @@ def delete_message(channel_id, message_id):
 
         # Delete message and related reactions
         db.session.delete(message)
+        db.session.flush()
+        refresh_channel_activity(channel_id)
         db.session.commit()
 
         return jsonify({"status": "success", "message": "Message deleted"})
@@ -0,0 +1,111 @@
+import hashlib
+from functools import wraps
+from flask import request, session, current_app
+from sqlalchemy import select, update, insert, func, literal, union_all
+from sqlalchemy.exc import IntegrityError
+from server.app import db
+from server.models import ResourceVersion
+
+# Resource names bumped by the write paths:
+#   channels          channels being created, renamed or deleted
+#   channel:<id>      messages in one channel, and so its last activity
+#   reads:<user id>   a user's channel read watermarks
+#   posts             the social feed, its counters and images
+#   authors           any user's alias or avatar
+#   presence          anyone going online or offline
+#   user:<id>         one user's public profile
+
+
+def bump(*names):
+    """Mark resources as changed in the current transaction"""
+    names = set(names)
+    if not names:
+        return
+
+    matched = db.session.execute(
+        update(ResourceVersion).where(ResourceVersion.name.in_(names))
+        .values(version=ResourceVersion.version + 1)
+    ).rowcount
+    if matched == len(names):
+        return
+
+    existing = set(db.session.scalars(
+        select(ResourceVersion.name).where(ResourceVersion.name.in_(names))
+    ))
+    for name in names - existing:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(ResourceVersion).values(name=name, version=1))
+        except IntegrityError:
+            # Another request created the counter concurrently
+            db.session.execute(
+                update(ResourceVersion).where(ResourceVersion.name == name)
+                .values(version=ResourceVersion.version + 1)
+            )
+
+
+def load_versions(names):
+    """Get the current version of each resource name in a single query; unknown names are 0.
+
+    A name ending in ``*``, such as ``channel:*``, stands for every counter
+    with that prefix. Its version is their sum, which grows whenever any of
+    them is bumped or created.
+    """
+    names = set(names)
+    exact = [name for name in names if not name.endswith('*')]
+    statements = [
+        select(ResourceVersion.name, ResourceVersion.version).where(ResourceVersion.name.in_(exact))
+    ]
+    for pattern in names.difference(exact):
+        # A range on the primary key rather than LIKE, so the index is used
+        prefix = pattern[:-1]
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        statements.append(
+            select(literal(pattern), func.coalesce(func.sum(ResourceVersion.version), 0))
+            .where(ResourceVersion.name >= prefix, ResourceVersion.name < upper)
+        )
+
+    rows = db.session.execute(union_all(*statements)).all()
+    versions = dict.fromkeys(names, 0)
+    versions.update(rows)
+    return versions
+
+
+def conditional(*resources):
+    """Let clients revalidate a GET view with ``If-None-Match``.
+
+    ``resources`` are the names the view's output depends on, formatted with
+    the view arguments and ``current_user``, e.g. ``'channel:{channel_id}'``,
+    or a prefix pattern such as ``'channel:*'`` (see :func:`load_versions`).
+    Their versions are read with one primary key query before the view runs.
+    The weak ETag hashes them with the URL and the user, so while nothing
+    has been bumped the client gets a 304 without the view's queries or
+    serialization. Only 200 responses get an ETag.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(**kwargs):
+            if request.method != 'GET':
+                return view(**kwargs)
+
+            user_id = session.get('user_id')
+            names = [resource.format(current_user=user_id, **kwargs) for resource in resources]
+            versions = load_versions(names)
+            token = f"{request.full_path}|{user_id}|" + ",".join(f"{name}={versions[name]}" for name in names)
+            etag = hashlib.sha1(token.encode()).hexdigest()
+
+            # A bare "*" is not honoured: the view hasn't run, so it isn't known to exist
+            if etag in request.if_none_match.as_set(include_weak=True):
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(view(**kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag, weak=True)
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response
+
+        return wrapped
+    return decorator
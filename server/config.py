@@ -13,10 +13,63 @@ class Config:
     SOCKETIO_ASYNC_MODE = 'eventlet'
     SOCKETIO_CORS_ALLOWED_ORIGINS = '*'
 
+    # Message queue shared by all Socket.IO workers so room emits reach every process.
+    # Accepts sqlite:///path/to/bus.db (no broker needed) or any redis://, amqp:// URL.
+    # Leave unset to keep events inside a single process.
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+    SOCKETIO_CHANNEL = os.environ.get('SOCKETIO_CHANNEL', 'campus-connect')
+
+    # Write-behind persistence for chat messages sent over Socket.IO.
+    # Messages are broadcast immediately and batch-inserted by a background task;
+    # senders are only acknowledged once their batch is committed.
+    MESSAGE_WRITE_BEHIND = os.environ.get('MESSAGE_WRITE_BEHIND', 'false').lower() in ['true', 'yes', '1']
+    MESSAGE_FLUSH_BATCH_SIZE = 100
+    MESSAGE_FLUSH_INTERVAL = 0.05  # seconds
+    MESSAGE_FLUSH_MAX_ATTEMPTS = 5
+    MESSAGE_MAX_PENDING = 5000
+    MESSAGE_ACK_TIMEOUT = 5  # seconds
+    MESSAGE_SHUTDOWN_TIMEOUT = 10  # seconds
+    # Message ids reserved per worker at a time; None is 100, or 1 when SOCKETIO_MESSAGE_QUEUE
+    # is set so ids from several workers stay in time order
+    MESSAGE_ID_BLOCK_SIZE = None
+
+    # Presence: online/offline changes are broadcast and saved in batches
+    PRESENCE_BROADCAST_INTERVAL = 2  # seconds
+    PRESENCE_FLUSH_INTERVAL = 10  # seconds
+    PRESENCE_HEARTBEAT_INTERVAL = 10  # seconds between presence messages to other workers
+
+    # JSON encoder for API responses and Socket.IO packets:
+    # auto uses orjson when it is installed, stdlib always uses the json module
+    JSON_BACKEND = os.environ.get('JSON_BACKEND', 'auto')
+
+    # Process-local caches (see server/cache.py); ttl in seconds
+    CACHES = {
+        'author_cards': {'maxsize': 10000, 'ttl': 300},
+        'channel_list': {'maxsize': 1, 'ttl': 5},
+        'students': {'maxsize': 10000, 'ttl': 300},
+        'encryption_keys': {'maxsize': 10000, 'ttl': 3600}
+    }
+
+    # Typing indicators
+    TYPING_MIN_EVENT_INTERVAL = 0.5  # seconds between accepted keystroke events per user
+    TYPING_TIMEOUT = 3  # seconds without a keystroke before a user stops typing
+    TYPING_BROADCAST_INTERVAL = 0.5  # seconds
+
+    # Password hashing runs on native threads so it doesn't stall the hub
+    PASSWORD_HASH_THREADS = 4
+    PASSWORD_HASH_MAX_PENDING = 32  # waiting hashes before logins are refused
+
     # Upload settings
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static/uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max upload
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+    # Images are stored once per SHA-256 and resized in the background (needs Pillow)
+    UPLOAD_VARIANTS = {'thumb': 320, 'preview': 1280}  # name: longest edge in pixels
+    UPLOAD_VARIANT_WORKERS = 2  # 0 leaves variants to `flask upload-variants`
+    UPLOAD_CACHE_MAX_AGE = 365 * 24 * 3600  # seconds browsers keep content-addressed files
+    # Internal nginx location aliased to UPLOAD_FOLDER; when set nginx sends upload bodies.
+    # USE_X_SENDFILE = True does the same for Apache/lighttpd.
+    UPLOAD_ACCEL_REDIRECT = os.environ.get('UPLOAD_ACCEL_REDIRECT')
 
     # Avatar generation
     AVATAR_COLORS = ["blue", "pink", "yellow", "green", "purple", "orange", "teal", "red"]
@@ -25,6 +78,8 @@ class Config:
     # Encryption settings (for end-to-end encrypted chat)
     ENCRYPTION_ENABLED = True
     ENCRYPTION_ALGORITHM = 'AES-256-GCM'  # Advanced encryption for messages
+    # Base64 32-byte key that wraps the per-channel data keys; derived from SECRET_KEY if unset
+    ENCRYPTION_MASTER_KEY = os.environ.get('ENCRYPTION_MASTER_KEY')
 
     # Student verification settings
     VERIFY_STUDENT_IDS = True
@@ -37,6 +92,18 @@ class Config:
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME', '')
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD', '')
     MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER', 'noreply@campusconnect.com')
+
+    # Outbox sender, see server/mail_outbox.py
+    MAIL_OUTBOX_POLL_INTERVAL = 5  # seconds between checks for due emails
+    MAIL_OUTBOX_BATCH_SIZE = 50  # emails sent per SMTP connection
+    MAIL_OUTBOX_RETRY_DELAY = 30  # seconds before the first retry, doubled each time
+    MAIL_OUTBOX_MAX_RETRY_DELAY = 3600  # seconds
+    MAIL_OUTBOX_MAX_ATTEMPTS = 6
+    MAIL_OUTBOX_CLAIM_TIMEOUT = 300  # seconds before another worker may retry a claimed email
+
+    # Deleting expired and used verification codes
+    VERIFICATION_REAP_INTERVAL = 300  # seconds, 0 disables the reaper
+    VERIFICATION_REAP_BATCH_SIZE = 500  # rows deleted per statement
     
     # Security settings for password reset
     SECURITY_PASSWORD_SALT = os.environ.get('SECURITY_PASSWORD_SALT', 'precious-salt-for-dev')
@@ -60,7 +127,8 @@ class DevelopmentConfig(Config):
     
     # Or use a real SMTP server with these settings for development:
     # MAIL_SERVER = 'localhost'
-    # MAIL_PORT = 1025  # python -m smtpd -n -c DebuggingServer localhost:1025
+    # MAIL_PORT = 1025  # flask fake-smtp --port 1025
+    # MAIL_USE_TLS = False
 
 
 class TestingConfig(Config):
@@ -0,0 +1,74 @@
+from server.cache import author_cards
+from server.queries import load_author_cards
+
+
+class ConnectionProfiles:
+    """Author cards for connected sockets, loaded once at connect time.
+
+    Socket handlers read the sender's alias and avatar from here instead of
+    querying the User table on every event. Cards are dropped whenever the
+    ``author_cards`` cache is invalidated, on this process or another one,
+    and reloaded on the next event.
+    """
+
+    def __init__(self):
+        self._by_sid = {}      # socket id -> author card
+        self._sids = {}        # user_id -> set of socket ids
+        self._users = {}       # socket id -> user_id
+        author_cards.on_invalidate(self._drop)
+
+    @staticmethod
+    def card_for(user):
+        return {
+            "id": user.id,
+            "alias": user.alias,
+            "avatar_color": user.avatar_color,
+            "avatar_face": user.avatar_face
+        }
+
+    def add(self, sid, user):
+        """Cache the author card for a newly connected socket"""
+        card = self.card_for(user)
+        self._track(sid, user.id, card)
+        return card
+
+    def get(self, sid, user_id=None):
+        """Get the card for a socket, loading it if it is missing or was invalidated"""
+        card = self._by_sid.get(sid)
+        if card is None and user_id is not None:
+            card = load_author_cards([user_id]).get(user_id)
+            if card:
+                self._track(sid, user_id, card)
+        return card
+
+    def _track(self, sid, user_id, card):
+        self._by_sid[sid] = card
+        self._users[sid] = user_id
+        self._sids.setdefault(user_id, set()).add(sid)
+
+    def remove(self, sid):
+        self._by_sid.pop(sid, None)
+        user_id = self._users.pop(sid, None)
+        sids = self._sids.get(user_id)
+        if sids:
+            sids.discard(sid)
+            if not sids:
+                del self._sids[user_id]
+
+    def refresh(self, user):
+        """Replace the cached card on every socket the user has open"""
+        card = self.card_for(user)
+        for sid in self._sids.get(user.id, ()):
+            self._by_sid[sid] = card
+
+    def _drop(self, user_ids):
+        """Forget the cards of invalidated users, or every card if no ids are given"""
+        if not user_ids:
+            self._by_sid.clear()
+            return
+        for user_id in user_ids:
+            for sid in self._sids.get(user_id, ()):
+                self._by_sid.pop(sid, None)
+
+
+connection_profiles = ConnectionProfiles()
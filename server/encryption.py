@@ -0,0 +1,128 @@
+import os
+import base64
+import logging
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from sqlalchemy import select, insert
+from sqlalchemy.exc import IntegrityError
+from server.app import db
+from server.cache import encryption_keys
+from server.models import EncryptionKey
+
+logger = logging.getLogger('api')
+
+NONCE_SIZE = 12
+
+
+def channel_scope(channel_id):
+    return f"channel:{channel_id}"
+
+
+def dm_scope(user_id, other_id):
+    low, high = sorted((user_id, other_id))
+    return f"dm:{low}:{high}"
+
+
+class MessageEncryption:
+    """Encrypts message content at rest with one data key per channel or DM pair.
+
+    Data keys are random AES-256 keys stored in the ``encryption_key`` table,
+    wrapped with the master key from ``ENCRYPTION_MASTER_KEY`` (derived from
+    ``SECRET_KEY`` if unset). Their ``AESGCM`` objects are kept in the
+    ``encryption_keys`` cache so a message costs one nonce, one AES-GCM call
+    and one base64 encoding. The scope is bound in as associated data, so a
+    ciphertext can't be replayed into another channel.
+
+    Stored content is ``base64(nonce + ciphertext)``.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._master = None
+
+    def init_app(self, app):
+        self.enabled = app.config.get('ENCRYPTION_ENABLED', False)
+
+        master_key = app.config.get('ENCRYPTION_MASTER_KEY')
+        if master_key:
+            master_key = base64.b64decode(master_key)
+        else:
+            if self.enabled:
+                logger.warning("ENCRYPTION_MASTER_KEY is not set, deriving it from SECRET_KEY")
+            master_key = HKDF(
+                algorithm=hashes.SHA256(), length=32, salt=None, info=b"campus-connect message keys"
+            ).derive(app.config['SECRET_KEY'].encode())
+        self._master = AESGCM(master_key)
+
+    def cipher(self, scope):
+        """Get the AESGCM object for a scope, creating its data key on first use"""
+        return encryption_keys.get_or_load(scope, lambda: AESGCM(self._load_key(scope)))
+
+    def _load_key(self, scope):
+        wrapped = db.session.execute(
+            select(EncryptionKey.wrapped_key).where(EncryptionKey.scope == scope)
+        ).scalar()
+
+        if wrapped is None:
+            # Created in its own transaction so the key survives even if the
+            # caller's transaction is rolled back
+            key = AESGCM.generate_key(bit_length=256)
+            nonce = os.urandom(NONCE_SIZE)
+            try:
+                with db.engine.begin() as conn:
+                    conn.execute(insert(EncryptionKey).values(
+                        scope=scope,
+                        wrapped_key=nonce + self._master.encrypt(nonce, key, scope.encode())
+                    ))
+                return key
+            except IntegrityError:
+                # Another worker created the key first, use theirs
+                with db.engine.connect() as conn:
+                    wrapped = conn.execute(
+                        select(EncryptionKey.wrapped_key).where(EncryptionKey.scope == scope)
+                    ).scalar()
+
+        return self._master.decrypt(wrapped[:NONCE_SIZE], wrapped[NONCE_SIZE:], scope.encode())
+
+    def encrypt(self, scope, plaintext):
+        nonce = os.urandom(NONCE_SIZE)
+        ciphertext = self.cipher(scope).encrypt(nonce, plaintext.encode(), scope.encode())
+        return base64.b64encode(nonce + ciphertext).decode()
+
+    def decrypt(self, scope, token):
+        raw = base64.b64decode(token)
+        return self.cipher(scope).decrypt(raw[:NONCE_SIZE], raw[NONCE_SIZE:], scope.encode()).decode()
+
+    def encrypt_many(self, scope, texts):
+        """Encrypt several messages for one scope"""
+        cipher, aad = self.cipher(scope), scope.encode()
+        tokens = []
+        for text in texts:
+            nonce = os.urandom(NONCE_SIZE)
+            tokens.append(base64.b64encode(nonce + cipher.encrypt(nonce, text.encode(), aad)).decode())
+        return tokens
+
+    def decrypt_many(self, items):
+        """Decrypt ``(scope, token)`` pairs, e.g. a page of history.
+
+        Each scope's key is looked up once. Content that can't be decrypted,
+        such as messages written before data keys were stored, is returned
+        as stored.
+        """
+        ciphers = {}
+        plaintexts = []
+        for scope, token in items:
+            cipher = ciphers.get(scope)
+            if cipher is None:
+                cipher = ciphers[scope] = self.cipher(scope)
+            try:
+                raw = base64.b64decode(token)
+                plaintexts.append(cipher.decrypt(raw[:NONCE_SIZE], raw[NONCE_SIZE:], scope.encode()).decode())
+            except (InvalidTag, ValueError):
+                plaintexts.append(token)
+        return plaintexts
+
+
+message_encryption = MessageEncryption()
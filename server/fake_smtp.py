@@ -0,0 +1,94 @@
+import time
+import threading
+import socketserver
+from email import message_from_bytes
+
+
+class FakeSMTPServer:
+    """Minimal in-process SMTP server that keeps what it receives.
+
+    Speaks just enough SMTP for smtplib (EHLO/HELO, MAIL, RCPT, DATA, RSET,
+    NOOP, QUIT) without TLS or auth, so point MAIL_SERVER/MAIL_PORT at it
+    with MAIL_USE_TLS off. ``delay`` slows every reply down, like a distant
+    relay, and the next ``fail_next`` messages are refused with a 451 so
+    retries can be exercised.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, delay=0.0):
+        self.delay = delay
+        self.fail_next = 0
+        self.messages = []      # (envelope sender, recipients, email.message.Message)
+        self.connections = 0
+        self._lock = threading.Lock()
+
+        fake = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line):
+                if fake.delay:
+                    time.sleep(fake.delay)
+                self.wfile.write(line.encode() + b"\r\n")
+
+            def handle(self):
+                with fake._lock:
+                    fake.connections += 1
+                self.reply("220 fake-smtp ready")
+                sender, recipients = None, []
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    command = line.decode(errors='replace').strip()
+                    verb = command[:4].upper()
+
+                    if verb == 'EHLO':
+                        self.reply("250 fake-smtp")
+                    elif verb == 'HELO':
+                        self.reply("250 fake-smtp")
+                    elif verb == 'MAIL':
+                        sender, recipients = command.split(':', 1)[1].strip(' <>'), []
+                        self.reply("250 OK")
+                    elif verb == 'RCPT':
+                        recipients.append(command.split(':', 1)[1].strip(' <>'))
+                        self.reply("250 OK")
+                    elif verb == 'DATA':
+                        self.reply("354 End data with <CR><LF>.<CR><LF>")
+                        data = []
+                        for chunk in iter(self.rfile.readline, b''):
+                            if chunk == b".\r\n":
+                                break
+                            data.append(chunk[1:] if chunk.startswith(b"..") else chunk)
+                        with fake._lock:
+                            refuse = fake.fail_next > 0
+                            if refuse:
+                                fake.fail_next -= 1
+                            else:
+                                fake.messages.append((sender, recipients, message_from_bytes(b"".join(data))))
+                        self.reply("451 Try again later" if refuse else "250 OK")
+                    elif verb in ('RSET', 'NOOP'):
+                        self.reply("250 OK")
+                    elif verb == 'QUIT':
+                        self.reply("221 Bye")
+                        return
+                    else:
+                        self.reply("502 Command not implemented")
+
+        self._server = socketserver.ThreadingTCPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.host, self.port = self._server.server_address
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,107 @@
+import json
+import logging
+from datetime import date
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the json module is used without it
+    orjson = None
+
+logger = logging.getLogger('api')
+
+# Keyword arguments the fast path understands; anything else goes to the json module
+_FAST_KWARGS = {'indent', 'separators', 'sort_keys'}
+# The only separators the fast path writes (python-socketio asks for these)
+_COMPACT = (',', ':')
+
+
+def _fast_kwargs(kwargs):
+    """Whether :meth:`JSONCodec.encode` writes what these ``dumps`` arguments ask for"""
+    if set(kwargs) - _FAST_KWARGS:
+        return False
+    indent = kwargs.get('indent')
+    if indent not in (None, 2):
+        return False  # orjson only indents by two spaces
+    separators = kwargs.get('separators')
+    return separators is None or (tuple(separators) == _COMPACT and not indent)
+
+
+def _default(o):
+    """Encode what JSON has no type for; dates become ISO 8601, as orjson writes them"""
+    if isinstance(o, date):
+        return o.isoformat()
+    return DefaultJSONProvider.default(o)
+
+
+class JSONCodec:
+    """``dumps``/``loads`` pair backed by orjson when it is installed.
+
+    Both encoders write UTF-8 (no ``\\u`` escapes), dates and datetimes as
+    ISO 8601 and non-string dict keys as strings, so output only differs in
+    whitespace. Values orjson can't encode, such as integers over 64 bits,
+    are retried with the json module. Usable as the ``json`` module of
+    python-socketio.
+    """
+
+    def __init__(self, fast=True):
+        self.fast = fast and orjson is not None
+
+    def encode(self, obj, sort_keys=False, indent=None):
+        """Encode ``obj`` to JSON bytes"""
+        if self.fast:
+            option = orjson.OPT_NON_STR_KEYS
+            if sort_keys:
+                option |= orjson.OPT_SORT_KEYS
+            if indent:
+                option |= orjson.OPT_INDENT_2
+            try:
+                return orjson.dumps(obj, default=_default, option=option)
+            except TypeError:
+                pass
+
+        separators = None if indent else (',', ':')
+        return json.dumps(obj, default=_default, sort_keys=sort_keys, indent=indent,
+                          separators=separators, ensure_ascii=False).encode()
+
+    def dumps(self, obj, **kwargs):
+        if not _fast_kwargs(kwargs):
+            return json.dumps(obj, **kwargs)
+        return self.encode(obj, kwargs.get('sort_keys', False), kwargs.get('indent')).decode()
+
+    def loads(self, s, **kwargs):
+        if self.fast and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that encodes through :class:`JSONCodec`.
+
+    ``JSON_BACKEND`` picks the encoder: ``auto`` uses orjson when installed,
+    ``stdlib`` always uses the json module. Responses keep the default
+    provider's sorted keys and compact output (indented when debugging).
+    """
+
+    def __init__(self, app):
+        super().__init__(app)
+        backend = app.config.get('JSON_BACKEND', 'auto')
+        if backend == 'orjson' and orjson is None:
+            logger.warning("JSON_BACKEND is orjson but it is not installed, using the json module")
+        self.codec = JSONCodec(fast=backend in ('auto', 'orjson'))
+
+    def dumps(self, obj, **kwargs):
+        if not _fast_kwargs(kwargs):
+            return super().dumps(obj, **kwargs)
+        return self.codec.encode(obj, kwargs.get('sort_keys', self.sort_keys), kwargs.get('indent')).decode()
+
+    def loads(self, s, **kwargs):
+        return self.codec.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = 2 if (self.compact is None and self._app.debug) or self.compact is False else None
+        return self._app.response_class(
+            self.codec.encode(obj, sort_keys=self.sort_keys, indent=indent) + b"\n",
+            mimetype=self.mimetype
+        )
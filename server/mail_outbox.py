@@ -0,0 +1,183 @@
+import atexit
+import uuid
+import smtplib
+import logging
+from datetime import datetime, timedelta
+from flask_mail import Message as MailMessage
+from sqlalchemy import update, select
+from server.app import db, mail, socketio
+from server.models import OutboundEmail
+
+logger = logging.getLogger('mail')
+
+
+class MailOutbox:
+    """Persistent outbox for transactional email.
+
+    :meth:`enqueue` stores the email and returns immediately; a background
+    task delivers due emails every ``MAIL_OUTBOX_POLL_INTERVAL`` seconds (or
+    as soon as one is enqueued on this process), sending up to
+    ``MAIL_OUTBOX_BATCH_SIZE`` over a single SMTP connection.
+
+    Rows are claimed with one UPDATE before sending, so several workers can
+    share the outbox; a claim expires after ``MAIL_OUTBOX_CLAIM_TIMEOUT``
+    seconds in case its worker dies mid-batch. Failed sends are retried
+    after ``MAIL_OUTBOX_RETRY_DELAY`` seconds, doubling each time, and are
+    marked failed after ``MAIL_OUTBOX_MAX_ATTEMPTS`` tries.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.enabled = False
+        self._wakeup = None
+        self._stopping = False
+        self._task = None
+        self.sent = 0
+        self.failed = 0
+        self.connections = 0
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get('MAIL_OUTBOX_ENABLED', True)
+        self.batch_size = app.config.get('MAIL_OUTBOX_BATCH_SIZE', 50)
+        self.poll_interval = app.config.get('MAIL_OUTBOX_POLL_INTERVAL', 5)
+        self.retry_delay = app.config.get('MAIL_OUTBOX_RETRY_DELAY', 30)
+        self.max_retry_delay = app.config.get('MAIL_OUTBOX_MAX_RETRY_DELAY', 3600)
+        self.max_attempts = app.config.get('MAIL_OUTBOX_MAX_ATTEMPTS', 6)
+        self.claim_timeout = app.config.get('MAIL_OUTBOX_CLAIM_TIMEOUT', 300)
+
+        if self.enabled:
+            self._wakeup = socketio.server.eio.create_event()
+            self._task = socketio.start_background_task(self._run)
+            atexit.register(self.stop)
+
+    def enqueue(self, recipient, subject, html, sender=None):
+        """Store an email for delivery and commit it"""
+        email = OutboundEmail(
+            recipient=recipient,
+            sender=sender or self.app.config.get('MAIL_DEFAULT_SENDER', 'noreply@campusconnect.com'),
+            subject=subject,
+            html=html,
+            next_attempt_at=datetime.utcnow()
+        )
+        db.session.add(email)
+        db.session.commit()
+
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return email
+
+    def claim(self, now=None):
+        """Take up to a batch of due emails for this worker. Returns the claimed rows."""
+        now = now or datetime.utcnow()
+        token = uuid.uuid4().hex
+
+        due = select(OutboundEmail.id).where(
+            OutboundEmail.status == 'pending',
+            OutboundEmail.next_attempt_at <= now
+        ).order_by(OutboundEmail.next_attempt_at).limit(self.batch_size).scalar_subquery()
+
+        # Push the claimed rows into the future so no other worker picks them
+        # up while they are being sent
+        claimed = db.session.execute(
+            update(OutboundEmail).where(
+                OutboundEmail.id.in_(due),
+                OutboundEmail.status == 'pending'
+            ).values(
+                claimed_by=token,
+                next_attempt_at=now + timedelta(seconds=self.claim_timeout)
+            )
+        ).rowcount
+        db.session.commit()
+
+        if not claimed:
+            return []
+        return OutboundEmail.query.filter_by(claimed_by=token, status='pending') \
+            .order_by(OutboundEmail.id).all()
+
+    def deliver(self):
+        """Send one batch of due emails. Returns the number sent."""
+        batch = self.claim()
+        if not batch:
+            return 0
+
+        sent = 0
+        try:
+            with mail.connect() as connection:
+                self.connections += 1
+                for position, email in enumerate(batch):
+                    try:
+                        connection.send(MailMessage(
+                            subject=email.subject,
+                            recipients=[email.recipient],
+                            html=email.html,
+                            sender=email.sender
+                        ))
+                    except (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError) as e:
+                        # The session is gone; the rest of the batch goes back untried
+                        self._retry(email, e)
+                        self._release(batch[position + 1:])
+                        break
+                    except Exception as e:
+                        self._retry(email, e)
+                    else:
+                        email.status = 'sent'
+                        email.sent_at = datetime.utcnow()
+                        email.claimed_by = None
+                        sent += 1
+        except Exception as e:
+            # Could not open or close the session
+            for email in batch:
+                if email.status == 'pending' and email.claimed_by is not None:
+                    self._retry(email, e)
+
+        db.session.commit()
+        self.sent += sent
+        return sent
+
+    def _retry(self, email, error):
+        email.attempts += 1
+        email.claimed_by = None
+        email.last_error = str(error)[:200]
+        if email.attempts >= self.max_attempts:
+            email.status = 'failed'
+            self.failed += 1
+            logger.error(f"Giving up on email {email.id} to {email.recipient}: {error}")
+        else:
+            delay = min(self.retry_delay * 2 ** (email.attempts - 1), self.max_retry_delay)
+            email.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+            logger.warning(f"Email {email.id} failed (attempt {email.attempts}), retrying in {delay}s: {error}")
+
+    def _release(self, emails):
+        for email in emails:
+            email.claimed_by = None
+            email.next_attempt_at = datetime.utcnow()
+
+    def flush(self):
+        """Deliver batches until nothing is due. Returns the number sent."""
+        sent = 0
+        with self.app.app_context():
+            while True:
+                try:
+                    delivered = self.deliver()
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"Error delivering outbox: {str(e)}")
+                    break
+                if not delivered:
+                    break
+                sent += delivered
+        return sent
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def stop(self):
+        """Stop polling; unsent emails stay in the outbox for the next start"""
+        self._stopping = True
+
+
+mail_outbox = MailOutbox()
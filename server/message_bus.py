@@ -0,0 +1,166 @@
+import sqlite3
+import threading
+import time
+import logging
+from socketio import PubSubManager
+from server.json_provider import JSONCodec
+
+logger = logging.getLogger('socketio')
+
+
+def _native_lock():
+    # The lock is taken on tpool threads, so it must not be a green lock if
+    # eventlet has patched the threading module
+    try:
+        from eventlet.patcher import original
+    except ImportError:
+        return threading.Lock()
+    return original('threading').Lock()
+
+
+class SQLiteManager(PubSubManager):
+    """Socket.IO client manager that fans events out through a SQLite file.
+
+    Every worker process on the host appends the events it emits to a shared
+    table and polls it for events written by the others, so ``emit(..., to=room)``
+    reaches clients attached to any worker without needing Redis::
+
+        SOCKETIO_MESSAGE_QUEUE = 'sqlite:////var/run/campus_connect/socketio.db'
+
+    :param url: ``sqlite:///`` URL of the bus database file.
+    :param channel: Name shared by all workers that should see each other's events.
+    :param write_only: Only publish events, never listen (for auxiliary processes).
+    :param poll_interval: Seconds to wait between polls when the bus is idle.
+    :param retention: Seconds published events are kept before being pruned.
+
+    Besides Socket.IO events the bus carries control messages between
+    workers, such as cache invalidations; see :meth:`on_control`.
+
+    Payloads are stored as JSON, so event data must be JSON serializable,
+    as it already is to reach a client. All access goes through one
+    connection guarded by a lock; under eventlet the queries run on native
+    threads through ``eventlet.tpool`` so polling never blocks the hub.
+    """
+    name = 'sqlite'
+
+    def __init__(self, url='sqlite:///socketio_bus.db', channel='socketio',
+                 write_only=False, logger=None, poll_interval=0.02, retention=60):
+        if not url.startswith('sqlite:///'):
+            raise ValueError(f"Unexpected SQLite message queue URL: {url}")
+
+        self.path = url[len('sqlite:///'):]
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._codec = JSONCodec()
+        self._control_handlers = {}
+        super(SQLiteManager, self).__init__(channel=channel, write_only=write_only, logger=logger)
+
+        # Used from whichever native thread runs the query, one at a time
+        self._conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+        self._lock = _native_lock()
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS socketio_events ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+            'channel TEXT NOT NULL, '
+            'created_at REAL NOT NULL, '
+            'payload BLOB NOT NULL)'
+        )
+
+    def _execute(self, sql, params=()):
+        """Run one statement and return its rows, off the hub under eventlet"""
+        if self.server is not None and self.server.async_mode == 'eventlet':
+            from eventlet import tpool
+            return tpool.execute(self._execute_locked, sql, params)
+        return self._execute_locked(sql, params)
+
+    def _execute_locked(self, sql, params):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _publish(self, data):
+        if data.get('method') == 'emit' and isinstance(data['data'], tuple):
+            # Several event arguments; JSON would turn them into a single list
+            data = dict(data, data=list(data['data']), args=True)
+        self._execute(
+            'INSERT INTO socketio_events (channel, created_at, payload) VALUES (?, ?, ?)',
+            (self.channel, time.time(), self._codec.encode(data))
+        )
+
+    def _decode(self, payload):
+        data = self._codec.loads(payload)
+        if data.pop('args', False):
+            data['data'] = tuple(data['data'])
+        return data
+
+    def on_control(self, method, handler):
+        """Call ``handler(data)`` for control messages published by other workers"""
+        self._control_handlers[method] = handler
+
+    def publish_control(self, method, **data):
+        """Send a control message to every other worker on the bus"""
+        data.update(method=method, host_id=self.host_id)
+        self._publish(data)
+
+    def _prune(self):
+        self._execute('DELETE FROM socketio_events WHERE created_at < ?',
+                      (time.time() - self.retention,))
+
+    def _listen(self):
+        # Only deliver events published after this worker started listening
+        last_id = self._execute('SELECT COALESCE(MAX(id), 0) FROM socketio_events')[0][0]
+        next_prune = time.time() + self.retention
+
+        while True:
+            try:
+                rows = self._execute(
+                    'SELECT id, channel, payload FROM socketio_events WHERE id > ? ORDER BY id',
+                    (last_id,)
+                )
+
+                if time.time() >= next_prune:
+                    self._prune()
+                    next_prune = time.time() + self.retention
+            except sqlite3.Error as e:
+                logger.error(f"Error polling SQLite message queue: {str(e)}")
+                rows = []
+
+            for event_id, channel, payload in rows:
+                last_id = event_id
+                if channel != self.channel:
+                    continue
+
+                try:
+                    data = self._decode(payload)
+                except ValueError:
+                    logger.error(f"Skipping unreadable message queue event {event_id}")
+                    continue
+                handler = self._control_handlers.get(data.get('method'))
+                if handler is None:
+                    yield data
+                elif data.get('host_id') != self.host_id:
+                    try:
+                        handler(data)
+                    except Exception as e:
+                        logger.error(f"Error handling {data['method']} message: {str(e)}")
+
+            if not rows:
+                self.server.sleep(self.poll_interval)
+
+
+def get_queue_options(config):
+    """Build the Socket.IO server options for the configured message queue.
+
+    ``sqlite:///`` URLs use :class:`SQLiteManager`. Any other URL (redis://,
+    amqp://, ...) is handed to Flask-SocketIO, which picks the matching
+    python-socketio manager. With no URL events stay in the local process.
+    """
+    url = config.get('SOCKETIO_MESSAGE_QUEUE')
+    if not url:
+        return {}
+
+    channel = config.get('SOCKETIO_CHANNEL', 'flask-socketio')
+    if url.startswith('sqlite:///'):
+        return {'client_manager': SQLiteManager(url, channel=channel)}
+
+    return {'message_queue': url, 'channel': channel}
@@ -0,0 +1,253 @@
+import atexit
+import time
+import logging
+from collections import deque
+from datetime import datetime
+from sqlalchemy import insert, update, select, func, case
+from sqlalchemy.exc import IntegrityError
+from server.app import db, socketio
+from server.models import Message, IdSequence
+from server.queries import record_channel_activity
+
+logger = logging.getLogger('socketio')
+
+
+class MessageIdAllocator:
+    """Hands out message ids from blocks reserved in the id_sequence table.
+
+    Each process reserves ``block_size`` ids at a time with a single UPDATE,
+    so ids are unique across workers without a round trip per message. The
+    sequence is always moved past the current MAX(message.id), which keeps it
+    safe to switch between write-behind and synchronous inserts.
+
+    Read watermarks, unread counts and channel activity all assume a newer
+    message has a higher id. Blocks only keep that true within one process:
+    with several workers, one still using an older block would give a newer
+    message a lower id. :class:`MessageWriter` therefore uses a block size
+    of 1 when a Socket.IO message queue is configured, so every id comes
+    from the shared counter in order, at the cost of one small transaction
+    per message.
+    """
+
+    def __init__(self, name='message', block_size=100):
+        self.name = name
+        self.block_size = block_size
+        self._next = 0
+        self._limit = 0
+
+    def allocate(self):
+        if self._next >= self._limit:
+            self._reserve()
+        message_id = self._next
+        self._next += 1
+        return message_id
+
+    def _reserve(self, attempts=2):
+        floor = select(func.coalesce(func.max(Message.id), 0) + 1).scalar_subquery()
+        for _ in range(attempts):
+            try:
+                with db.engine.begin() as conn:
+                    updated = conn.execute(
+                        update(IdSequence).where(IdSequence.name == self.name).values(
+                            next_id=case(
+                                (IdSequence.next_id > floor, IdSequence.next_id),
+                                else_=floor
+                            ) + self.block_size
+                        )
+                    ).rowcount
+                    if not updated:
+                        conn.execute(insert(IdSequence).values(
+                            name=self.name,
+                            next_id=floor + self.block_size
+                        ))
+                    limit = conn.execute(
+                        select(IdSequence.next_id).where(IdSequence.name == self.name)
+                    ).scalar()
+            except IntegrityError:
+                # Another worker created the sequence row first, retry as an update
+                continue
+
+            self._next = limit - self.block_size
+            self._limit = limit
+            return
+
+        raise RuntimeError(f"Could not reserve {self.name} ids after {attempts} attempts")
+
+
+class PendingMessage:
+    """A message that has been broadcast but may not be durable yet.
+
+    Exposes the same column attributes as :class:`Message` so callers can
+    build their response from either.
+    """
+
+    def __init__(self, fields, durable):
+        self.fields = fields
+        self.id = fields['id']
+        self.content = fields['content']
+        self.user_id = fields['user_id']
+        self.channel_id = fields['channel_id']
+        self.is_encrypted = fields['is_encrypted']
+        self.timestamp = fields['timestamp']
+        self.durable = durable
+        self.error = None
+        self.attempts = 0
+
+
+class MessageWriter:
+    """Write-behind queue for channel messages.
+
+    When ``MESSAGE_WRITE_BEHIND`` is enabled, messages get an id from
+    :class:`MessageIdAllocator` immediately so they can be broadcast, and a
+    background task batch-inserts them every ``MESSAGE_FLUSH_INTERVAL``
+    seconds or as soon as ``MESSAGE_FLUSH_BATCH_SIZE`` are queued. Callers
+    must only acknowledge a message once :meth:`wait` returns True.
+
+    A submitted message is broadcast before it is written, which is what
+    keeps the insert off the send path. Other clients can therefore see a
+    message that is later lost: if its batch keeps failing, or the process
+    dies before a flush, the sender gets an error ack (or none) but the
+    broadcast is not retracted, and the message is gone on reload.
+
+    Loss is bounded: at most ``MESSAGE_MAX_PENDING`` unacknowledged messages
+    are held in memory (submitters flush inline once the queue is full), a
+    batch that keeps failing is reported back to its senders after
+    ``MESSAGE_FLUSH_MAX_ATTEMPTS`` tries, and shutdown drains the queue for at
+    most ``MESSAGE_SHUTDOWN_TIMEOUT`` seconds.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.enabled = False
+        self.allocator = MessageIdAllocator()
+        self._queue = deque()
+        self._wakeup = None
+        self._stopping = False
+        self._task = None
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get('MESSAGE_WRITE_BEHIND', False)
+        self.batch_size = app.config.get('MESSAGE_FLUSH_BATCH_SIZE', 100)
+        self.flush_interval = app.config.get('MESSAGE_FLUSH_INTERVAL', 0.05)
+        self.max_pending = app.config.get('MESSAGE_MAX_PENDING', 5000)
+        self.max_attempts = app.config.get('MESSAGE_FLUSH_MAX_ATTEMPTS', 5)
+        self.ack_timeout = app.config.get('MESSAGE_ACK_TIMEOUT', 5)
+        self.shutdown_timeout = app.config.get('MESSAGE_SHUTDOWN_TIMEOUT', 10)
+
+        block_size = app.config.get('MESSAGE_ID_BLOCK_SIZE')
+        if block_size is None:
+            # Several workers must take ids from the shared counter one at a time
+            block_size = 1 if app.config.get('SOCKETIO_MESSAGE_QUEUE') else 100
+        self.allocator.block_size = block_size
+
+        if self.enabled:
+            self._wakeup = socketio.server.eio.create_event()
+            self._task = socketio.start_background_task(self._run)
+            atexit.register(self.stop)
+            app.logger.info("Write-behind message persistence enabled")
+
+    def submit(self, content, user_id, channel_id, is_encrypted=False):
+        """Queue a message for insertion and return it with its final id"""
+        if len(self._queue) >= self.max_pending:
+            # Apply backpressure instead of growing the queue without bound
+            self.flush()
+
+        with self.app.app_context():
+            message_id = self.allocator.allocate()
+
+        pending = PendingMessage({
+            "id": message_id,
+            "content": content,
+            "user_id": user_id,
+            "channel_id": channel_id,
+            "is_encrypted": is_encrypted,
+            "timestamp": datetime.utcnow()
+        }, socketio.server.eio.create_event())
+
+        self._queue.append(pending)
+        if len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+
+        return pending
+
+    def wait(self, pending, timeout=None):
+        """Block until a submitted message is durable. Returns False on failure or timeout."""
+        if not pending.durable.wait(timeout or self.ack_timeout):
+            return False
+        return pending.error is None
+
+    def write(self, content, user_id, channel_id, is_encrypted=False):
+        """Submit a message and wait for it to be durable, for request/response callers"""
+        pending = self.submit(content, user_id, channel_id, is_encrypted)
+        if not self.wait(pending):
+            raise RuntimeError(f"Message {pending.id} could not be saved")
+        return pending
+
+    def flush(self):
+        """Insert everything currently queued. Returns the number of messages saved."""
+        saved = 0
+        while self._queue:
+            batch = []
+            while self._queue and len(batch) < self.batch_size:
+                batch.append(self._queue.popleft())
+
+            with self.app.app_context():
+                try:
+                    db.session.execute(insert(Message), [pending.fields for pending in batch])
+
+                    # Move each channel's last message pointer once per batch
+                    latest = {}
+                    for pending in batch:
+                        if pending.id > latest.get(pending.channel_id, (0, None))[0]:
+                            latest[pending.channel_id] = (pending.id, pending.timestamp)
+                    for channel_id, (message_id, timestamp) in latest.items():
+                        record_channel_activity(channel_id, message_id, timestamp)
+
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"Error flushing {len(batch)} messages: {str(e)}")
+                    self._requeue(batch, e)
+                    return saved
+
+            for pending in batch:
+                pending.durable.set()
+            saved += len(batch)
+
+        return saved
+
+    def _requeue(self, batch, error):
+        retry = []
+        for pending in batch:
+            pending.attempts += 1
+            if pending.attempts >= self.max_attempts:
+                pending.error = error
+                pending.durable.set()
+            else:
+                retry.append(pending)
+        self._queue.extendleft(reversed(retry))
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if self._queue:
+                self.flush()
+
+    def stop(self, timeout=None):
+        """Stop the flusher and drain the queue, giving up after the shutdown timeout"""
+        if not self.enabled or self._stopping:
+            return
+
+        self._stopping = True
+        deadline = time.monotonic() + (timeout or self.shutdown_timeout)
+        while self._queue and time.monotonic() < deadline:
+            if not self.flush():
+                time.sleep(min(self.flush_interval, max(0, deadline - time.monotonic())))
+
+        if self._queue:
+            logger.error(f"Dropped {len(self._queue)} unsaved messages at shutdown")
+
+
+message_writer = MessageWriter()
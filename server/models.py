@@ -1,8 +1,8 @@
 from datetime import datetime
 import json
 from sqlalchemy.orm import foreign
-from werkzeug.security import generate_password_hash, check_password_hash
 from server.app import db
+from server.passwords import password_hasher
 
 
 class User(db.Model):
@@ -14,7 +14,7 @@ class User(db.Model):
     avatar_color = db.Column(db.String(20), nullable=False)
     avatar_face = db.Column(db.String(20), nullable=False)
     settings = db.Column(db.Text, default='{}')
-    is_online = db.Column(db.Boolean, default=False)
+    is_online = db.Column(db.Boolean, default=False, index=True)
     last_seen = db.Column(db.DateTime, default=datetime.utcnow)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     student_id = db.Column(db.String(20), db.ForeignKey('student.id'), unique=True, nullable=True)
@@ -30,12 +30,10 @@ class User(db.Model):
         
     @password.setter
     def password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
         
     def verify_password(self, password):
-        if self.password_hash:
-            return check_password_hash(self.password_hash, password)
-        return False
+        return password_hasher.verify(self.password_hash, password)
 
     def get_settings(self):
         return json.loads(self.settings)
@@ -60,6 +58,10 @@ class Channel(db.Model):
     description = db.Column(db.String(200))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Most recent message, kept up to date by the message write paths
+    last_message_id = db.Column(db.Integer)
+    last_message_at = db.Column(db.DateTime)
+
     messages = db.relationship('Message', backref='channel', lazy=True)
 
     def to_dict(self):
@@ -81,6 +83,13 @@ class Message(db.Model):
     reactions = db.relationship('Reaction', backref='message', lazy=True,
                                 cascade='all, delete-orphan')
 
+    # Channel history is paged by (timestamp, id) within a channel, and
+    # unread counts walk the ids above a read watermark
+    __table_args__ = (
+        db.Index('ix_message_channel_timestamp_id', 'channel_id', 'timestamp', 'id'),
+        db.Index('ix_message_channel_id', 'channel_id', 'id'),
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -92,6 +101,29 @@ class Message(db.Model):
         }
 
 
+class IdSequence(db.Model):
+    """Next free id per sequence name, reserved in blocks by the message writer"""
+    name = db.Column(db.String(50), primary_key=True)
+    next_id = db.Column(db.Integer, nullable=False)
+
+
+class ResourceVersion(db.Model):
+    """Change counter per resource name, bumped by write paths for conditional GETs"""
+    name = db.Column(db.String(50), primary_key=True)  # e.g. posts, channel:<id>, user:<id>
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ChannelReadState(db.Model):
+    """How far a user has read a channel.
+
+    Direct message threads keep the same watermark on their
+    :class:`Conversation` rows.
+    """
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    channel_id = db.Column(db.Integer, db.ForeignKey('channel.id'), primary_key=True)
+    last_read_message_id = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+
 class DirectMessage(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
@@ -104,14 +136,43 @@ class DirectMessage(db.Model):
     sender = db.relationship('User', foreign_keys=[sender_id], backref='sent_messages')
     recipient = db.relationship('User', foreign_keys=[recipient_id], backref='received_messages')
 
+    # Conversations are looked up by (sender, recipient) pair in both directions
+    __table_args__ = (
+        db.Index('ix_direct_message_pair_timestamp', 'sender_id', 'recipient_id', 'timestamp'),
+    )
+
+
+class Conversation(db.Model):
+    """One user's view of a direct message thread with a partner.
+
+    Each pair of users has two rows, one per side, kept up to date by the
+    DM write path so the inbox can be listed without scanning messages.
+    """
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    partner_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    last_message_id = db.Column(db.Integer, db.ForeignKey('direct_message.id'))
+    last_message_at = db.Column(db.DateTime)
+    unread_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # The user has read every message in the thread up to and including this id
+    last_read_message_id = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    __table_args__ = (
+        db.Index('ix_conversation_user_last_message_at', 'user_id', 'last_message_at'),
+    )
+
 
 class Post(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
     image_url = db.Column(db.String(200))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    upload_sha256 = db.Column(db.String(64), db.ForeignKey('upload.sha256'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
 
+    # Denormalized counters, kept in sync by the reaction and comment write paths
+    like_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    comment_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
     comments = db.relationship('Comment', backref='post', lazy=True,
                               cascade='all, delete-orphan')
     reactions = db.relationship(
@@ -129,12 +190,8 @@ class Post(db.Model):
             'image_url': self.image_url,
             'created_at': self.created_at.isoformat(),
             'user_id': self.user_id,
-            'comment_count': Comment.query.filter_by(post_id=self.id).count(),
-            'like_count': Reaction.query.filter_by(
-                target_id=self.id,
-                target_type='post',
-                reaction_type='like'
-            ).count()
+            'comment_count': self.comment_count,
+            'like_count': self.like_count
         }
 
 
@@ -145,6 +202,9 @@ class Comment(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     post_id = db.Column(db.Integer, db.ForeignKey('post.id'), nullable=False)
 
+    # Denormalized counter, kept in sync by the reaction write path
+    like_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
     reactions = db.relationship(
         'Reaction',
         primaryjoin="and_(Comment.id==foreign(Reaction.target_id), Reaction.target_type=='comment')",
@@ -153,6 +213,11 @@ class Comment(db.Model):
         viewonly=True
     )
 
+    # Comments are listed per post in creation order
+    __table_args__ = (
+        db.Index('ix_comment_post_created_at', 'post_id', 'created_at'),
+    )
+
 
 class Reaction(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -168,6 +233,8 @@ class Reaction(db.Model):
     # Define a unique constraint to prevent duplicate reactions
     __table_args__ = (
         db.UniqueConstraint('user_id', 'target_id', 'target_type', 'reaction_type'),
+        db.Index('ix_reaction_target', 'target_type', 'target_id', 'reaction_type'),
+        db.Index('ix_reaction_message_type', 'message_id', 'reaction_type'),
     )
 
 
@@ -192,4 +259,63 @@ class VerificationCode(db.Model):
     type = db.Column(db.String(20), nullable=False)  # 'registration' or 'password_reset'
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     expires_at = db.Column(db.DateTime, nullable=False)
-    used = db.Column(db.Boolean, default=False)
\ No newline at end of file
+    used = db.Column(db.Boolean, default=False)
+
+    # Codes are looked up by student, email, purpose and code, and reaped by expiry
+    __table_args__ = (
+        db.Index('ix_verification_code_lookup', 'student_id', 'email', 'type', 'code'),
+        db.Index('ix_verification_code_expires_at', 'expires_at'),
+        db.Index('ix_verification_code_used', 'used'),
+    )
+
+
+class OutboundEmail(db.Model):
+    """An email waiting in the outbox for the background sender.
+
+    Requests only insert a row; :mod:`server.mail_outbox` delivers due rows
+    in batches and reschedules failures with exponential backoff.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(100), nullable=False)
+    sender = db.Column(db.String(100), nullable=False)
+    subject = db.Column(db.String(200), nullable=False)
+    html = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='pending')  # pending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    claimed_by = db.Column(db.String(32))  # sender batch that currently holds the row
+    last_error = db.Column(db.String(200))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+    # The sender polls for pending rows that are due
+    __table_args__ = (
+        db.Index('ix_outbound_email_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
+
+class EncryptionKey(db.Model):
+    """Data key for one channel or DM pair, wrapped with the master key"""
+    scope = db.Column(db.String(50), primary_key=True)  # channel:<id> or dm:<low id>:<high id>
+    wrapped_key = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class Upload(db.Model):
+    """An uploaded image, stored once per distinct content.
+
+    ``variants`` is JSON mapping each variant name from ``UPLOAD_VARIANTS``
+    to ``{"url", "width", "height"}``. It is filled in by the background
+    resizer, which sets ``status`` from pending to ready (or failed).
+    """
+    sha256 = db.Column(db.String(64), primary_key=True)
+    url = db.Column(db.String(200), nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    width = db.Column(db.Integer, nullable=True)
+    height = db.Column(db.Integer, nullable=True)
+    variants = db.Column(db.Text, nullable=False, default='{}', server_default='{}')
+    status = db.Column(db.String(10), nullable=False, default='pending', server_default='pending')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def get_variants(self):
+        return json.loads(self.variants or '{}')
@@ -0,0 +1,103 @@
+import time
+import logging
+import threading
+from collections import deque
+from werkzeug.security import generate_password_hash, check_password_hash
+
+logger = logging.getLogger('api')
+
+
+class HasherBusy(Exception):
+    """Raised when too many password hashes are already waiting for a worker"""
+
+
+class PasswordHasher:
+    """Runs password hashing and verification off the eventlet hub.
+
+    PBKDF2/scrypt are CPU bound; called inline from a greenlet they freeze
+    every socket on the process until they finish. Under eventlet each call
+    is handed to a native thread through ``eventlet.tpool`` and the calling
+    greenlet waits without blocking the hub. At most
+    ``PASSWORD_HASH_THREADS`` hashes run at once and at most
+    ``PASSWORD_HASH_MAX_PENDING`` more may wait; beyond that :class:`HasherBusy`
+    is raised so a login storm is shed instead of queueing without bound.
+
+    In threading mode requests already run on their own threads, so the
+    hash runs inline (still subject to the same limits).
+    """
+
+    def __init__(self, threads=4, max_pending=32, offload=False):
+        self.threads = threads
+        self.max_pending = max_pending
+        self.offload = offload
+        self._slots = None
+        self._in_flight = 0    # running plus waiting for a slot
+        self._lock = threading.Lock()   # guards _in_flight and the counters below
+        self._latencies = deque(maxlen=1000)   # seconds from call to result, most recent calls
+        self.completed = 0
+        self.rejected = 0
+
+    def init_app(self, app):
+        self.threads = app.config.get('PASSWORD_HASH_THREADS', self.threads)
+        self.max_pending = app.config.get('PASSWORD_HASH_MAX_PENDING', self.max_pending)
+        self.offload = app.config.get('SOCKETIO_ASYNC_MODE') == 'eventlet'
+        self._slots = None
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password)
+
+    def verify(self, pwhash, password):
+        if not pwhash:
+            return False
+        return self._run(check_password_hash, pwhash, password)
+
+    def _run(self, func, *args):
+        with self._lock:
+            if self._slots is None:
+                if self.offload:
+                    from eventlet.semaphore import BoundedSemaphore
+                    self._slots = BoundedSemaphore(self.threads)
+                else:
+                    self._slots = threading.BoundedSemaphore(self.threads)
+
+            busy = self._in_flight >= self.threads + self.max_pending
+            if busy:
+                self.rejected += 1
+            else:
+                self._in_flight += 1
+        if busy:
+            logger.warning("Password hasher busy, rejected a request")
+            raise HasherBusy()
+
+        started = time.monotonic()
+        try:
+            with self._slots:
+                if self.offload:
+                    from eventlet import tpool
+                    return tpool.execute(func, *args)
+                return func(*args)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self.completed += 1
+                self._latencies.append(time.monotonic() - started)
+
+    def stats(self):
+        latencies = sorted(self._latencies)
+
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+        return {
+            "in_flight": self._in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95),
+            "max_ms": latencies[-1] * 1000 if latencies else 0.0
+        }
+
+
+password_hasher = PasswordHasher()
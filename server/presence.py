@@ -0,0 +1,197 @@
+import time
+import logging
+from datetime import datetime
+from sqlalchemy import update
+from server.app import db, socketio
+from server.models import User
+from server.conditional import bump
+
+logger = logging.getLogger('socketio')
+
+
+class PresenceRegistry:
+    """In-memory record of which users are connected, across worker processes.
+
+    Each worker counts its own sockets per user, so a student with several
+    tabs open only leaves a worker when the last one disconnects. When the
+    Socket.IO message queue is the SQLite bus, every worker also publishes
+    the users connected to it whenever that set changes (and at least every
+    ``PRESENCE_HEARTBEAT_INTERVAL`` seconds), and a user is online while any
+    worker lists them. A worker that stays silent for three heartbeats, such
+    as one that crashed, is forgotten.
+
+    Online/offline transitions are coalesced and sent to this worker's
+    clients as a single ``presence_update`` event every
+    ``PRESENCE_BROADCAST_INTERVAL`` seconds. Going offline waits for one
+    more interval, so moving between workers (a page reload) doesn't flicker.
+    ``is_online`` / ``last_seen`` are written back in one batch every
+    ``PRESENCE_FLUSH_INTERVAL`` seconds by a single worker, the live one
+    with the lowest host id.
+
+    With another message queue (Redis, ...) each worker only sees its own sockets.
+    """
+
+    def __init__(self):
+        self.app = None
+        self._connections = {}   # user_id -> number of open sockets on this worker
+        self._aliases = {}       # user_id -> alias, for broadcasts
+        self._peers = {}         # host_id -> ({user_id: alias}, expires_at) of other workers
+        self._reported = set()   # user_ids last broadcast as online
+        self._leaving = set()    # user_ids found offline at the last broadcast, not yet reported
+        self._dirty = {}         # user_id -> (is_online, last_seen) not yet saved
+        self._bus = None
+        self._publish_due = True
+        self._next_heartbeat = 0
+        self._task = None
+
+    def init_app(self, app):
+        self.app = app
+        self.broadcast_interval = app.config.get('PRESENCE_BROADCAST_INTERVAL', 2)
+        self.flush_interval = app.config.get('PRESENCE_FLUSH_INTERVAL', 10)
+        self.heartbeat_interval = app.config.get('PRESENCE_HEARTBEAT_INTERVAL', 10)
+
+        manager = socketio.server.manager
+        if hasattr(manager, 'publish_control'):
+            self._bus = manager
+            manager.on_control('presence', self._on_remote_presence)
+        self._task = socketio.start_background_task(self._run)
+
+    @property
+    def host_id(self):
+        return self._bus.host_id if self._bus is not None else None
+
+    def connect(self, user_id, alias):
+        """Record a new socket for a user. Returns True if it is their first on this worker."""
+        count = self._connections.get(user_id, 0) + 1
+        self._connections[user_id] = count
+        self._aliases[user_id] = alias
+        if count == 1:
+            self._publish_due = True
+        return count == 1
+
+    def disconnect(self, user_id):
+        """Record a closed socket for a user. Returns True if it was their last on this worker."""
+        count = self._connections.get(user_id, 0) - 1
+        if count > 0:
+            self._connections[user_id] = count
+            return False
+
+        self._connections.pop(user_id, None)
+        self._publish_due = True
+        return True
+
+    def is_online(self, user_id):
+        return user_id in self._connections or any(
+            user_id in users for users, _ in self._peers.values()
+        )
+
+    def online_user_ids(self):
+        online = set(self._connections)
+        for users, _ in self._peers.values():
+            online.update(users)
+        return online
+
+    def publish(self, now=None):
+        """Send this worker's connected users to the others, if changed or a heartbeat is due"""
+        now = time.monotonic() if now is None else now
+        if self._bus is None or not (self._publish_due or now >= self._next_heartbeat):
+            return
+
+        users = [[user_id, self._aliases.get(user_id)] for user_id in self._connections]
+        self._bus.publish_control('presence', users=users)
+        self._publish_due = False
+        self._next_heartbeat = now + self.heartbeat_interval
+
+    def _on_remote_presence(self, data):
+        host_id = data['host_id']
+        if host_id not in self._peers:
+            # A worker that just started: let it know who is here without waiting for a heartbeat
+            self._publish_due = True
+        users = {user_id: alias for user_id, alias in data.get('users', ())}
+        self._peers[host_id] = (users, time.monotonic() + 3 * self.heartbeat_interval)
+
+    def _expire_peers(self, now):
+        for host_id in [h for h, (_, expires_at) in self._peers.items() if expires_at <= now]:
+            logger.warning(f"No presence from worker {host_id}, treating its users as offline")
+            del self._peers[host_id]
+
+    def _is_writer(self):
+        return not self._peers or self.host_id <= min(self._peers)
+
+    def broadcast(self, now=None):
+        """Publish this worker's users, then emit the net online/offline changes since the last broadcast"""
+        now = time.monotonic() if now is None else now
+        self.publish(now)
+        self._expire_peers(now)
+
+        current = set(self._connections)
+        for users, _ in self._peers.values():
+            current.update(users)
+            for user_id, alias in users.items():
+                self._aliases[user_id] = alias
+
+        gone = self._reported - current
+        going = gone & self._leaving
+        self._leaving = gone - going
+        coming = current - self._reported
+        self._reported = (self._reported | coming) - going
+
+        writer = self._is_writer()
+        seen_at = datetime.utcnow()
+        online = []
+        for user_id in coming:
+            online.append({"user_id": user_id, "alias": self._aliases.get(user_id)})
+            if writer:
+                self._dirty[user_id] = (True, seen_at)
+        offline = []
+        for user_id in going:
+            offline.append({"user_id": user_id, "alias": self._aliases.pop(user_id, None)})
+            if writer:
+                self._dirty[user_id] = (False, seen_at)
+
+        if online or offline:
+            # Every worker sends the same changes to its own clients
+            socketio.emit('presence_update', {"online": online, "offline": offline},
+                          ignore_queue=True)
+
+    def flush(self):
+        """Write pending is_online/last_seen changes in a single batch"""
+        if not self._dirty:
+            return 0
+
+        dirty, self._dirty = self._dirty, {}
+        rows = [
+            {"id": user_id, "is_online": is_online, "last_seen": last_seen}
+            for user_id, (is_online, last_seen) in dirty.items()
+        ]
+
+        with self.app.app_context():
+            try:
+                db.session.execute(update(User), rows)
+                bump('presence', *(f"user:{user_id}" for user_id in dirty))
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Error saving presence for {len(rows)} users: {str(e)}")
+                # Keep the newest state for the next attempt
+                for user_id, state in dirty.items():
+                    self._dirty.setdefault(user_id, state)
+                return 0
+
+        return len(rows)
+
+    def _run(self):
+        elapsed = 0
+        while True:
+            socketio.sleep(self.broadcast_interval)
+            elapsed += self.broadcast_interval
+            try:
+                self.broadcast()
+                if elapsed >= self.flush_interval:
+                    elapsed = 0
+                    self.flush()
+            except Exception as e:
+                logger.error(f"Error in presence loop: {str(e)}")
+
+
+presence = PresenceRegistry()
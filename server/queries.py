@@ -0,0 +1,754 @@
+import base64
+from datetime import datetime
+from sqlalchemy import func, tuple_, select, update, insert, case, and_, or_, union_all
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+from server.cache import author_cards, channel_list, students, invalidate_on_commit
+from server.encryption import message_encryption, channel_scope, dm_scope
+from server.conditional import bump
+from server.models import (
+    db, User, Message, Channel, Reaction, DirectMessage, Conversation, ChannelReadState,
+    Post, Comment, VerificationCode, Student, Upload
+)
+
+
+# Batch loaders used to render pages of messages without per-row queries
+def load_author_cards(user_ids):
+    """Load the public author card for each user id.
+
+    Cards come from the ``author_cards`` cache; the misses are loaded with a
+    single query.
+    """
+    user_ids = set(user_ids)
+    if not user_ids:
+        return {}
+
+    def load(missing):
+        rows = db.session.query(
+            User.id, User.alias, User.avatar_color, User.avatar_face
+        ).filter(User.id.in_(missing)).all()
+
+        return {
+            row.id: {
+                "id": row.id,
+                "alias": row.alias,
+                "avatar_color": row.avatar_color,
+                "avatar_face": row.avatar_face
+            }
+            for row in rows
+        }
+
+    return author_cards.get_many(user_ids, load)
+
+
+def load_uploads(sha256s):
+    """Load the image card (url, size hints and variants) for each upload in a single query"""
+    sha256s = set(sha256s) - {None}
+    if not sha256s:
+        return {}
+
+    return {
+        upload.sha256: {
+            "url": upload.url,
+            "width": upload.width,
+            "height": upload.height,
+            "variants": upload.get_variants()
+        }
+        for upload in Upload.query.filter(Upload.sha256.in_(sha256s))
+    }
+
+
+def load_student(student_id):
+    """Get a student's registration status as a dict, or None if the id is unknown.
+
+    Cached in ``students``; unknown ids are not cached so newly imported
+    students are found right away.
+    """
+    def load():
+        student = Student.query.get(student_id)
+        if not student:
+            return None
+        return {"student_id": student.id, "is_registered": student.is_registered}
+
+    return students.get_or_load(student_id, load)
+
+
+def load_reaction_counts(message_ids):
+    """Count reactions by type for each message id in a single grouped query"""
+    message_ids = set(message_ids)
+    if not message_ids:
+        return {}
+
+    rows = db.session.query(
+        Reaction.message_id, Reaction.reaction_type, func.count(Reaction.id)
+    ).filter(
+        Reaction.message_id.in_(message_ids)
+    ).group_by(Reaction.message_id, Reaction.reaction_type).all()
+
+    counts = {}
+    for message_id, reaction_type, count in rows:
+        counts.setdefault(message_id, {})[reaction_type] = count
+    return counts
+
+
+def load_user_reactions(message_ids, user_id):
+    """Get the reaction types the given user left on each message id"""
+    message_ids = set(message_ids)
+    if not message_ids or user_id is None:
+        return {}
+
+    rows = db.session.query(Reaction.message_id, Reaction.reaction_type).filter(
+        Reaction.message_id.in_(message_ids),
+        Reaction.user_id == user_id
+    ).all()
+
+    result = {}
+    for message_id, reaction_type in rows:
+        result.setdefault(message_id, []).append(reaction_type)
+    return result
+
+
+def decrypt_channel_messages(messages):
+    """Decrypt the encrypted messages in a list in one pass. Returns {message_id: content}."""
+    encrypted = [message for message in messages if message.is_encrypted]
+    if not encrypted:
+        return {}
+    plaintexts = message_encryption.decrypt_many(
+        (channel_scope(message.channel_id), message.content) for message in encrypted
+    )
+    return {message.id: content for message, content in zip(encrypted, plaintexts)}
+
+
+def decrypt_direct_messages(messages):
+    """Decrypt the encrypted direct messages in a list in one pass. Returns {message_id: content}."""
+    encrypted = [message for message in messages if message.is_encrypted]
+    if not encrypted:
+        return {}
+    plaintexts = message_encryption.decrypt_many(
+        (dm_scope(message.sender_id, message.recipient_id), message.content) for message in encrypted
+    )
+    return {message.id: content for message, content in zip(encrypted, plaintexts)}
+
+
+def load_message_page(messages, user_id=None, include_channel=False):
+    """Serialize a list of channel messages with authors and reactions.
+
+    Runs a fixed number of queries regardless of how many messages are
+    passed in. Messages whose author no longer exists are skipped. When
+    ``user_id`` is given, each entry also lists that user's own reactions.
+    """
+    message_ids = [message.id for message in messages]
+    authors = load_author_cards(message.user_id for message in messages)
+    reactions = load_reaction_counts(message_ids)
+    own_reactions = load_user_reactions(message_ids, user_id) if user_id is not None else None
+    contents = decrypt_channel_messages(messages)
+
+    messages_data = []
+    for message in messages:
+        author = authors.get(message.user_id)
+        if not author:
+            continue
+
+        message_data = {
+            "id": message.id,
+            "content": contents.get(message.id, message.content),
+            "timestamp": message.timestamp.isoformat(),
+            "author": author,
+            "reactions": reactions.get(message.id, {}),
+            "is_encrypted": message.is_encrypted
+        }
+        if include_channel:
+            message_data["channel_id"] = message.channel_id
+        if own_reactions is not None:
+            message_data["user_reactions"] = own_reactions.get(message.id, [])
+
+        messages_data.append(message_data)
+
+    return messages_data
+
+
+# Keyset pagination for channel history
+def encode_cursor(message):
+    """Build an opaque cursor pointing at a message's (timestamp, id) position"""
+    raw = f"{message.timestamp.isoformat()}|{message.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(value, model=Message):
+    """Turn a cursor (or a plain message id) back into a (timestamp, id) key.
+
+    Raises ValueError if the value is malformed or the message id is unknown.
+    """
+    if value.isdigit():
+        row = db.session.query(model.timestamp, model.id).filter(model.id == int(value)).first()
+        if not row:
+            raise ValueError("Unknown message id")
+        return row.timestamp, row.id
+
+    try:
+        padded = value + '=' * (-len(value) % 4)
+        timestamp, message_id = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        return datetime.fromisoformat(timestamp), int(message_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+MAX_PAGE_SIZE = 100
+
+
+def clamp_page_size(size):
+    """Bound a client supplied page size to 1..MAX_PAGE_SIZE"""
+    return min(max(size, 1), MAX_PAGE_SIZE)
+
+
+def paginate_channel_messages(channel_id, per_page, before=None, after=None, include_total=False):
+    """Fetch one page of channel history using keyset pagination.
+
+    ``before``/``after`` are cursors from a previous response. Messages are
+    returned newest first; the query walks the (channel_id, timestamp, id)
+    index so latency does not depend on how far back the page is. Returns
+    the messages and a pagination dict with next (older) and prev (newer)
+    cursors. The total count is only computed when ``include_total`` is set.
+    ``per_page`` is clamped to 1..MAX_PAGE_SIZE.
+    """
+    per_page = clamp_page_size(per_page)
+    key = tuple_(Message.timestamp, Message.id)
+    query = Message.query.filter(Message.channel_id == channel_id)
+
+    if after is not None:
+        # Walk forwards from the cursor, then flip back to newest first
+        messages = query.filter(key > decode_cursor(after)) \
+            .order_by(Message.timestamp.asc(), Message.id.asc()) \
+            .limit(per_page + 1).all()
+        has_newer = len(messages) > per_page
+        messages = list(reversed(messages[:per_page]))
+        has_older = True
+    else:
+        if before is not None:
+            query = query.filter(key < decode_cursor(before))
+        messages = query.order_by(Message.timestamp.desc(), Message.id.desc()) \
+            .limit(per_page + 1).all()
+        has_older = len(messages) > per_page
+        messages = messages[:per_page]
+        has_newer = before is not None
+
+    pagination = {
+        "per_page": per_page,
+        "next_cursor": encode_cursor(messages[-1]) if messages and has_older else None,
+        "prev_cursor": encode_cursor(messages[0]) if messages and has_newer else None,
+        "has_next": has_older,
+        "has_prev": has_newer
+    }
+
+    if include_total:
+        pagination["total"] = db.session.query(func.count(Message.id)) \
+            .filter(Message.channel_id == channel_id).scalar()
+
+    return messages, pagination
+
+
+# Channel list with last activity
+def record_channel_activity(channel_id, message_id, timestamp):
+    """Point a channel at its newest message in the current transaction"""
+    newer = Channel.last_message_id.is_(None) | (Channel.last_message_id < message_id)
+    db.session.execute(
+        update(Channel).where(Channel.id == channel_id).values(
+            last_message_id=case((newer, message_id), else_=Channel.last_message_id),
+            last_message_at=case((newer, timestamp), else_=Channel.last_message_at)
+        )
+    )
+    # Other workers pick up new activity when their short TTL runs out,
+    # rather than every message also publishing an invalidation
+    invalidate_on_commit('channel_list', broadcast=False)
+    bump(f"channel:{channel_id}")
+
+
+def refresh_channel_activity(channel_id):
+    """Recompute a channel's newest message, e.g. after one is deleted"""
+    last = db.session.query(Message.id, Message.timestamp) \
+        .filter(Message.channel_id == channel_id) \
+        .order_by(Message.id.desc()).first()
+
+    db.session.execute(
+        update(Channel).where(Channel.id == channel_id).values(
+            last_message_id=last.id if last else None,
+            last_message_at=last.timestamp if last else None
+        )
+    )
+    invalidate_on_commit('channel_list')
+    bump(f"channel:{channel_id}")
+
+
+def list_channels():
+    """Get every channel as a dict, most recently active first.
+
+    Built with a single query and kept in the ``channel_list`` cache.
+    """
+    def load():
+        rows = Channel.query.order_by(
+            func.coalesce(Channel.last_message_at, Channel.created_at).desc(),
+            Channel.id
+        ).all()
+        return [
+            {
+                "id": channel.id,
+                "name": channel.name,
+                "description": channel.description,
+                "created_at": channel.created_at,
+                "last_message_id": channel.last_message_id,
+                "last_message_at": channel.last_message_at
+            }
+            for channel in rows
+        ]
+
+    return channel_list.get_or_load('all', load)
+
+
+# Denormalized like/comment counters on posts and comments
+COUNTED_TARGETS = {'post': Post, 'comment': Comment}
+
+
+def adjust_like_count(target_type, target_id, delta):
+    """Add delta to the like counter of a post or comment in the current transaction"""
+    model = COUNTED_TARGETS.get(target_type)
+    if model is None:
+        return
+
+    db.session.execute(
+        update(model).where(model.id == target_id)
+        .values(like_count=model.like_count + delta)
+    )
+    if target_type == 'post':
+        bump('posts')
+
+
+def adjust_comment_count(post_id, delta):
+    """Add delta to a post's comment counter in the current transaction"""
+    db.session.execute(
+        update(Post).where(Post.id == post_id)
+        .values(comment_count=Post.comment_count + delta)
+    )
+    bump('posts')
+
+
+def load_liked_targets(target_type, target_ids, user_id):
+    """Get the subset of target ids the user has liked in a single query"""
+    target_ids = set(target_ids)
+    if not target_ids:
+        return set()
+
+    rows = db.session.query(Reaction.target_id).filter(
+        Reaction.target_type == target_type,
+        Reaction.reaction_type == 'like',
+        Reaction.user_id == user_id,
+        Reaction.target_id.in_(target_ids)
+    ).all()
+    return {row.target_id for row in rows}
+
+
+def rebuild_counters():
+    """Recompute every post and comment counter from the source tables.
+
+    Returns the number of posts and comments updated.
+    """
+    def like_count_of(model, target_type):
+        return select(func.count(Reaction.id)).where(
+            Reaction.target_type == target_type,
+            Reaction.target_id == model.id,
+            Reaction.reaction_type == 'like'
+        ).scalar_subquery()
+
+    post_comments = select(func.count(Comment.id)) \
+        .where(Comment.post_id == Post.id).scalar_subquery()
+
+    posts = db.session.execute(update(Post).values(
+        like_count=like_count_of(Post, 'post'),
+        comment_count=post_comments
+    )).rowcount
+    comments = db.session.execute(update(Comment).values(
+        like_count=like_count_of(Comment, 'comment')
+    )).rowcount
+
+    db.session.commit()
+    return posts, comments
+
+
+# Per-user conversation summaries for direct messages
+def record_direct_message(dm):
+    """Update both sides' conversation rows for a new DM in the current transaction.
+
+    The message must already be flushed so it has an id and timestamp.
+    """
+    sides = [(dm.sender_id, dm.recipient_id, 0)]
+    if dm.recipient_id != dm.sender_id:
+        sides.append((dm.recipient_id, dm.sender_id, 1))
+
+    for user_id, partner_id, unread in sides:
+        newer = Conversation.last_message_id.is_(None) | (Conversation.last_message_id < dm.id)
+        changes = dict(
+            last_message_id=case((newer, dm.id), else_=Conversation.last_message_id),
+            last_message_at=case((newer, dm.timestamp), else_=Conversation.last_message_at),
+            unread_count=Conversation.unread_count + unread
+        )
+        match = update(Conversation).where(
+            Conversation.user_id == user_id,
+            Conversation.partner_id == partner_id
+        ).values(**changes)
+
+        if db.session.execute(match).rowcount:
+            continue
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(Conversation).values(
+                    user_id=user_id,
+                    partner_id=partner_id,
+                    last_message_id=dm.id,
+                    last_message_at=dm.timestamp,
+                    unread_count=unread
+                ))
+        except IntegrityError:
+            # The first message from the other side created the row concurrently
+            db.session.execute(match)
+
+
+def unread_after(user_id, partner_id, watermark):
+    """Count the partner's messages to the user with an id above the watermark"""
+    return select(func.count(DirectMessage.id)).where(
+        DirectMessage.sender_id == partner_id,
+        DirectMessage.recipient_id == user_id,
+        DirectMessage.id > watermark
+    ).scalar_subquery()
+
+
+def advance_read_watermark(user_id, partner_id, message_id):
+    """Mark a conversation read up to a message id in the current transaction.
+
+    The watermark only moves forwards, and the unread counter is recounted
+    from the messages above it.
+    """
+    watermark = case(
+        (Conversation.last_read_message_id < message_id, message_id),
+        else_=Conversation.last_read_message_id
+    )
+    db.session.execute(
+        update(Conversation).where(
+            Conversation.user_id == user_id,
+            Conversation.partner_id == partner_id
+        ).values(
+            last_read_message_id=watermark,
+            unread_count=unread_after(user_id, partner_id, watermark)
+        )
+    )
+
+
+def load_read_watermarks(user_id, partner_id):
+    """Get how far the user and the partner have read their conversation, in one query"""
+    rows = db.session.query(Conversation.user_id, Conversation.last_read_message_id).filter(
+        tuple_(Conversation.user_id, Conversation.partner_id).in_(
+            [(user_id, partner_id), (partner_id, user_id)]
+        )
+    ).all()
+    watermarks = dict(rows)
+    return watermarks.get(user_id, 0), watermarks.get(partner_id, 0)
+
+
+def paginate_direct_messages(user_id, partner_id, limit, before=None):
+    """Fetch one page of a DM conversation, newest first.
+
+    Each direction is read separately so both walk the
+    (sender_id, recipient_id, timestamp) index, and the two short lists are
+    merged. ``before`` is a cursor or message id from a previous page.
+    ``limit`` is clamped to 1..MAX_PAGE_SIZE.
+    """
+    limit = clamp_page_size(limit)
+    key = tuple_(DirectMessage.timestamp, DirectMessage.id)
+    position = decode_cursor(before, DirectMessage) if before is not None else None
+
+    messages = []
+    for sender_id, recipient_id in ((user_id, partner_id), (partner_id, user_id)):
+        query = DirectMessage.query.filter(
+            DirectMessage.sender_id == sender_id,
+            DirectMessage.recipient_id == recipient_id
+        )
+        if position is not None:
+            query = query.filter(key < position)
+        messages.extend(query.order_by(DirectMessage.timestamp.desc(), DirectMessage.id.desc())
+                        .limit(limit + 1).all())
+        if user_id == partner_id:
+            break
+
+    messages.sort(key=lambda dm: (dm.timestamp, dm.id), reverse=True)
+    has_older = len(messages) > limit
+    messages = messages[:limit]
+
+    pagination = {
+        "limit": limit,
+        "next_cursor": encode_cursor(messages[-1]) if messages and has_older else None,
+        "has_next": has_older
+    }
+    return messages, pagination
+
+
+def load_conversations(user_id, limit=50, before=None):
+    """Get a user's conversations, most recent first, in a single query.
+
+    Returns a list of ``(conversation, partner, last_message)`` tuples.
+    ``before`` is a ``last_message_at`` timestamp to page further back.
+    ``limit`` is clamped to 1..MAX_PAGE_SIZE.
+    """
+    limit = clamp_page_size(limit)
+    Partner = aliased(User)
+    LastMessage = aliased(DirectMessage)
+
+    query = (
+        select(Conversation, Partner, LastMessage)
+        .join(Partner, Partner.id == Conversation.partner_id)
+        .outerjoin(LastMessage, LastMessage.id == Conversation.last_message_id)
+        .where(Conversation.user_id == user_id)
+    )
+    if before is not None:
+        query = query.where(Conversation.last_message_at < before)
+
+    query = query.order_by(Conversation.last_message_at.desc()).limit(limit)
+    return db.session.execute(query).all()
+
+
+def rebuild_conversations():
+    """Recompute every conversation row from the direct_message table.
+
+    Read watermarks are kept; rows for threads without one are added.
+    Returns the number of conversation rows written.
+    """
+    sides = union_all(
+        select(DirectMessage.sender_id.label('user_id'), DirectMessage.recipient_id.label('partner_id')),
+        select(DirectMessage.recipient_id, DirectMessage.sender_id)
+    ).subquery()
+    missing = select(sides.c.user_id, sides.c.partner_id).distinct().where(
+        ~select(Conversation.user_id).where(
+            Conversation.user_id == sides.c.user_id,
+            Conversation.partner_id == sides.c.partner_id
+        ).exists()
+    )
+    db.session.execute(insert(Conversation).from_select(['user_id', 'partner_id'], missing))
+
+    in_thread = or_(
+        and_(DirectMessage.sender_id == Conversation.user_id,
+             DirectMessage.recipient_id == Conversation.partner_id),
+        and_(DirectMessage.sender_id == Conversation.partner_id,
+             DirectMessage.recipient_id == Conversation.user_id)
+    )
+    written = db.session.execute(update(Conversation).values(
+        last_message_id=select(func.max(DirectMessage.id)).where(in_thread).scalar_subquery(),
+        unread_count=unread_after(Conversation.user_id, Conversation.partner_id,
+                                  Conversation.last_read_message_id)
+    )).rowcount
+    db.session.execute(update(Conversation).values(
+        last_message_at=select(DirectMessage.timestamp)
+        .where(DirectMessage.id == Conversation.last_message_id).scalar_subquery()
+    ))
+    db.session.commit()
+    return written
+
+
+# Read watermarks for channels
+# Unread badges stop counting here, so a count never returns more than this many rows
+UNREAD_COUNT_CAP = 100
+
+
+def advance_channel_read_watermark(user_id, channel_id, message_id):
+    """Mark a channel read up to a message id in the current transaction.
+
+    The watermark only moves forwards.
+    """
+    match = update(ChannelReadState).where(
+        ChannelReadState.user_id == user_id,
+        ChannelReadState.channel_id == channel_id
+    ).values(last_read_message_id=case(
+        (ChannelReadState.last_read_message_id < message_id, message_id),
+        else_=ChannelReadState.last_read_message_id
+    ))
+    bump(f"reads:{user_id}")
+
+    if db.session.execute(match).rowcount:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(ChannelReadState).values(
+                user_id=user_id,
+                channel_id=channel_id,
+                last_read_message_id=message_id
+            ))
+    except IntegrityError:
+        # Another tab created the row concurrently
+        db.session.execute(match)
+
+
+def channel_unread_count(user_id, channel_id, cap=UNREAD_COUNT_CAP):
+    """Build a scalar subquery counting a user's unread messages in a channel, up to ``cap``.
+
+    The user's own messages are never unread. ``channel_id`` may be a column
+    so the count can be correlated with a channel query. Messages past the
+    watermark are found by id, which relies on ids following time order
+    across workers (see :class:`~server.message_writer.MessageIdAllocator`).
+    """
+    watermark = func.coalesce(
+        select(ChannelReadState.last_read_message_id).where(
+            ChannelReadState.user_id == user_id,
+            ChannelReadState.channel_id == channel_id
+        ).correlate_except(ChannelReadState).scalar_subquery(),
+        0
+    )
+    unread = select(Message.id).where(
+        Message.channel_id == channel_id,
+        Message.id > watermark,
+        Message.user_id != user_id
+    ).correlate_except(Message).limit(cap).subquery()
+    return select(func.count()).select_from(unread).scalar_subquery()
+
+
+def load_channel_unread_counts(user_id, channel_ids):
+    """Get the user's capped unread count for each channel in a single query"""
+    channel_ids = set(channel_ids)
+    if not channel_ids:
+        return {}
+
+    rows = db.session.query(
+        Channel.id, channel_unread_count(user_id, Channel.id)
+    ).filter(Channel.id.in_(channel_ids)).all()
+    return dict(rows)
+
+
+# Registry of hot query shapes, checked with EXPLAIN QUERY PLAN by `flask check-query-plans`
+HOT_QUERIES = {}
+
+
+def hot_query(name):
+    """Register a function returning a representative statement for a hot path"""
+    def decorator(f):
+        HOT_QUERIES[name] = f
+        return f
+    return decorator
+
+
+@hot_query('channel_history_page')
+def _channel_history_page():
+    return select(Message).where(
+        Message.channel_id == 1,
+        tuple_(Message.timestamp, Message.id) < (datetime.utcnow(), 1)
+    ).order_by(Message.timestamp.desc(), Message.id.desc()).limit(50)
+
+
+@hot_query('channel_last_message')
+def _channel_last_message():
+    return select(Message).where(Message.channel_id == 1) \
+        .order_by(Message.timestamp.desc()).limit(1)
+
+
+@hot_query('message_reaction_counts')
+def _message_reaction_counts():
+    return select(Reaction.message_id, Reaction.reaction_type, func.count(Reaction.id)) \
+        .where(Reaction.message_id.in_([1, 2, 3])) \
+        .group_by(Reaction.message_id, Reaction.reaction_type)
+
+
+@hot_query('target_reactions')
+def _target_reactions():
+    return select(func.count(Reaction.id)).where(
+        Reaction.target_type == 'post',
+        Reaction.target_id == 1,
+        Reaction.reaction_type == 'like'
+    )
+
+
+@hot_query('direct_message_history')
+def _direct_message_history():
+    return select(DirectMessage).where(
+        DirectMessage.sender_id == 1,
+        DirectMessage.recipient_id == 2
+    ).order_by(DirectMessage.timestamp.desc(), DirectMessage.id.desc()).limit(51)
+
+
+@hot_query('unread_direct_messages')
+def _unread_direct_messages():
+    return select(func.count(DirectMessage.id)).where(
+        DirectMessage.sender_id == 2,
+        DirectMessage.recipient_id == 1,
+        DirectMessage.id > 10
+    )
+
+
+@hot_query('conversation_list')
+def _conversation_list():
+    return select(Conversation).where(Conversation.user_id == 1) \
+        .order_by(Conversation.last_message_at.desc()).limit(50)
+
+
+@hot_query('channel_unread_count')
+def _channel_unread_count():
+    return select(channel_unread_count(1, 1))
+
+
+@hot_query('social_feed_page')
+def _social_feed_page():
+    return select(Post).order_by(Post.created_at.desc()).limit(20)
+
+
+@hot_query('post_comments')
+def _post_comments():
+    return select(Comment).where(Comment.post_id == 1).order_by(Comment.created_at)
+
+
+@hot_query('verification_code_lookup')
+def _verification_code_lookup():
+    return select(VerificationCode).where(
+        VerificationCode.student_id == 'S1234567',
+        VerificationCode.email == 'student@example.com',
+        VerificationCode.code == '123456',
+        VerificationCode.type == 'registration'
+    ).limit(1)
+
+
+@hot_query('verification_code_reap')
+def _verification_code_reap():
+    from server.verification_reaper import reapable
+    return select(VerificationCode.id).where(reapable(datetime(2026, 1, 1))).limit(500)
+
+
+@hot_query('online_users')
+def _online_users():
+    return select(User).where(User.is_online == True, User.id != 1)
+
+
+def explain_query_plan(statement):
+    """Run EXPLAIN QUERY PLAN for a statement and return the plan detail lines"""
+    connection = db.session.connection()
+    compiled = statement.compile(
+        dialect=connection.dialect,
+        compile_kwargs={"render_postcompile": True}
+    )
+    values = compiled.construct_params()
+    params = tuple(values[name] for name in compiled.positiontup or [])
+    rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params).all()
+    return [row[-1] for row in rows]
+
+
+def is_full_table_scan(detail):
+    """Check whether a plan line is a scan of a whole table without an index.
+
+    Scans of subqueries and constant rows are not table scans.
+    """
+    if not detail.startswith('SCAN ') or 'USING' in detail:
+        return False
+    return detail.split()[1] in db.metadata.tables
+
+
+def check_hot_queries():
+    """Explain every registered hot query.
+
+    Returns a dict mapping query name to (plan lines, has_full_scan).
+    """
+    results = {}
+    for name, build in HOT_QUERIES.items():
+        plan = explain_query_plan(build())
+        results[name] = (plan, any(is_full_table_scan(detail) for detail in plan))
+    return results
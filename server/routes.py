@@ -1,6 +1,8 @@
 from flask import Blueprint, render_template, redirect, url_for, request, jsonify, session
 from server.models import db, User, Channel, Message, Post, Comment, Reaction
 from server.auth import require_login
+from server.queries import load_liked_targets, list_channels
+from server.presence import presence
 from datetime import datetime, timedelta
 
 routes = Blueprint('routes', __name__)
@@ -26,17 +28,13 @@ def chat():
         session.clear()
         return redirect(url_for('auth.login'))
 
-    # Get all available channels
-    channels = Channel.query.all()
+    # Get all available channels with their recent activity, most recent first
+    channels = list_channels()
+    channel_activity = {channel["id"]: channel["last_message_at"] for channel in channels}
 
-    # Get recent activity for each channel
-    channel_activity = {}
-    for channel in channels:
-        last_message = Message.query.filter_by(channel_id=channel.id).order_by(Message.timestamp.desc()).first()
-        channel_activity[channel.id] = last_message.timestamp if last_message else None
-
-    # Get online users (excluding current user)
-    online_users = User.query.filter(User.is_online == True, User.id != user_id).all()
+    # Get online users (excluding current user) from the presence registry
+    online_ids = presence.online_user_ids() - {user_id}
+    online_users = User.query.filter(User.id.in_(online_ids)).all() if online_ids else []
 
     return render_template('chat.html',
                            user=user,
@@ -59,23 +57,19 @@ def social_feed():
     # Get recent posts (pagination could be added)
     posts = Post.query.order_by(Post.created_at.desc()).limit(20).all()
 
-    # For each post, get author and like count
+    # Load authors and the user's likes for all posts at once
+    author_ids = {post.user_id for post in posts}
+    authors = {author.id: author for author in User.query.filter(User.id.in_(author_ids)).all()}
+    liked = load_liked_targets('post', [post.id for post in posts], user_id)
+
     post_data = []
     for post in posts:
-        author = User.query.get(post.user_id)
-        like_count = Reaction.query.filter_by(
-            target_id=post.id,
-            target_type='post',
-            reaction_type='like'
-        ).count()
-
-        comment_count = Comment.query.filter_by(post_id=post.id).count()
-
         post_data.append({
             'post': post,
-            'author': author,
-            'like_count': like_count,
-            'comment_count': comment_count
+            'author': authors.get(post.user_id),
+            'like_count': post.like_count,
+            'comment_count': post.comment_count,
+            'user_liked': post.id in liked
         })
 
     return render_template('social_feed.html',
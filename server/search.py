@@ -0,0 +1,114 @@
+import re
+from sqlalchemy import select, func, table, column, literal_column
+from server.models import db, Message
+
+# FTS5 index over message content. It is an external content table, so the
+# text itself is only stored once in ``message``. Encrypted messages hold
+# ciphertext and are never indexed.
+SEARCH_TABLE = 'message_fts'
+
+SEARCH_INDEX_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE}
+        USING fts5(content, content='message', content_rowid='id', tokenize='unicode61 remove_diacritics 2')""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_ai AFTER INSERT ON message
+        WHEN new.is_encrypted = 0 BEGIN
+            INSERT INTO {SEARCH_TABLE}(rowid, content) VALUES (new.id, new.content);
+        END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_ad AFTER DELETE ON message
+        WHEN old.is_encrypted = 0 BEGIN
+            INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, content) VALUES ('delete', old.id, old.content);
+        END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_au AFTER UPDATE OF content, is_encrypted ON message BEGIN
+            INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, content)
+                SELECT 'delete', old.id, old.content WHERE old.is_encrypted = 0;
+            INSERT INTO {SEARCH_TABLE}(rowid, content)
+                SELECT new.id, new.content WHERE new.is_encrypted = 0;
+        END""",
+]
+
+SEARCH_INDEX_DROP = [
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_au",
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_ai",
+    f"DROP TABLE IF EXISTS {SEARCH_TABLE}",
+]
+
+message_fts = table(SEARCH_TABLE, column('rowid'), column('rank'))
+
+
+def search_supported(connection):
+    return connection.dialect.name == 'sqlite'
+
+
+def create_search_index(connection):
+    """Create the FTS table and the triggers that keep it in sync with ``message``"""
+    if not search_supported(connection):
+        return False
+    for statement in SEARCH_INDEX_DDL:
+        connection.exec_driver_sql(statement)
+    return True
+
+
+def drop_search_index(connection):
+    if not search_supported(connection):
+        return
+    for statement in SEARCH_INDEX_DROP:
+        connection.exec_driver_sql(statement)
+
+
+def rebuild_search_index():
+    """Re-index every unencrypted message. Returns the number of rows indexed."""
+    with db.engine.begin() as conn:
+        if not create_search_index(conn):
+            return 0
+        # 'rebuild' would also index encrypted rows, so repopulate by hand
+        conn.exec_driver_sql(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('delete-all')")
+        indexed = conn.exec_driver_sql(
+            f"INSERT INTO {SEARCH_TABLE}(rowid, content) "
+            f"SELECT id, content FROM message WHERE is_encrypted = 0"
+        ).rowcount
+        conn.exec_driver_sql(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('optimize')")
+        return indexed
+
+
+def build_match_query(query):
+    """Turn free text into an FTS5 query that matches all of its words.
+
+    Every word is quoted so user input can never be parsed as FTS5 syntax.
+    A trailing ``*`` on a word is kept as a prefix search.
+    """
+    terms = []
+    for word in re.findall(r'[\w*]+', query):
+        prefix = word.endswith('*')
+        word = word.strip('*')
+        if word:
+            terms.append(f'"{word}"*' if prefix else f'"{word}"')
+    return ' '.join(terms)
+
+
+def search_messages(query, channel_ids=None, since=None, until=None, limit=20, offset=0, session=None):
+    """Rank unencrypted channel messages against a search query.
+
+    Returns a list of ``(message, snippet, rank)`` tuples, best match first.
+    Matches in the snippet are wrapped in ``<mark>`` tags.
+    """
+    match = build_match_query(query)
+    if not match:
+        return []
+
+    snippet = func.snippet(literal_column(SEARCH_TABLE), 0, '<mark>', '</mark>', '…', 12)
+    stmt = (
+        select(Message, snippet, message_fts.c.rank)
+        .join_from(message_fts, Message, Message.id == message_fts.c.rowid)
+        .where(literal_column(SEARCH_TABLE).op('MATCH')(match))
+        .where(Message.is_encrypted == False)
+    )
+    if channel_ids:
+        stmt = stmt.where(Message.channel_id.in_(channel_ids))
+    if since is not None:
+        stmt = stmt.where(Message.timestamp >= since)
+    if until is not None:
+        stmt = stmt.where(Message.timestamp < until)
+
+    stmt = stmt.order_by(message_fts.c.rank, Message.id.desc()).limit(limit).offset(offset)
+    return (session or db.session).execute(stmt).all()
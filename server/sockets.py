@@ -1,10 +1,23 @@
-from flask import session, current_app
+from flask import session, current_app, request
 from flask_socketio import emit, join_room, leave_room
 from datetime import datetime
+import logging
+from sqlalchemy import func, or_, and_
 from .models import db, User, Message, DirectMessage, Channel, Reaction
-from .utils import sanitize_text, encrypt_message, decrypt_message
+from .utils import sanitize_text
+from .encryption import message_encryption, channel_scope, dm_scope
+from .queries import (
+    load_message_page, record_direct_message, advance_read_watermark, advance_channel_read_watermark,
+    record_channel_activity
+)
+from .message_writer import message_writer
+from .presence import presence
+from .connection_profiles import connection_profiles
+from .typing_indicators import typing_tracker
 from .app import socketio
 
+logger = logging.getLogger('socketio')
+
 @socketio.on('connect')
 def handle_connect():
     """Handle client connection"""
@@ -19,15 +32,12 @@ def handle_connect():
         return False
 
     print(f"User {user.id} ({user.alias}) connected")
-    user.is_online = True
-    user.last_seen = datetime.utcnow()
-    db.session.commit()
 
-    # Broadcast to all users that this user is online
-    emit('user_online', {
-        "user_id": user.id,
-        "alias": user.alias
-    }, broadcast=True)
+    # Cache the author card for this connection so handlers need no user lookups
+    connection_profiles.add(request.sid, user)
+
+    # Presence is tracked in memory; the change is broadcast and saved in batches
+    presence.connect(user.id, user.alias)
 
     # Join user's personal room for direct messages
     join_room(f"user_{user.id}")
@@ -40,18 +50,13 @@ def handle_disconnect():
     """Handle client disconnection"""
     print("Client disconnected")
     if 'user_id' in session:
-        user = User.query.get(session['user_id'])
-        if user:
-            print(f"User {user.id} ({user.alias}) disconnected")
-            user.is_online = False
-            user.last_seen = datetime.utcnow()
-            db.session.commit()
+        user_id = session['user_id']
+        print(f"User {user_id} disconnected")
 
-            # Broadcast to all users that this user is offline
-            emit('user_offline', {
-                "user_id": user.id,
-                "alias": user.alias
-            }, broadcast=True)
+        # Goes offline in a later presence broadcast once no worker has a socket for them
+        if presence.disconnect(user_id):
+            typing_tracker.stop_all(user_id)
+        connection_profiles.remove(request.sid)
 
 
 @socketio.on('join')
@@ -72,21 +77,24 @@ def on_join(data):
     join_room(room)
     print(f"User {user_id} joined room: {room}")
 
+    # Frames only carry typing changes, so send who is already typing
+    typing_tracker.sync(channel_id, request.sid)
+
     # Let others know someone has joined
-    user = User.query.get(user_id)
+    user = connection_profiles.get(request.sid, user_id)
     channel = Channel.query.get(channel_id)
 
     if user and channel:
         # Notify others in the channel
         emit('user_joined_channel', {
             "user_id": user_id,
-            "alias": user.alias,
+            "alias": user["alias"],
             "channel_id": channel_id
         }, to=room, include_self=False)
 
         # Send system message
         emit('system_message', {
-            "content": f"{user.alias} has joined #{channel.name}",
+            "content": f"{user['alias']} has joined #{channel.name}",
             "timestamp": datetime.utcnow().isoformat(),
             "channel_id": channel_id
         }, to=room)
@@ -108,20 +116,20 @@ def on_leave(data):
     leave_room(room)
 
     # Let others know someone has left
-    user = User.query.get(user_id)
+    user = connection_profiles.get(request.sid, user_id)
     channel = Channel.query.get(channel_id)
 
     if user and channel:
         # Notify others in the channel
         emit('user_left_channel', {
             "user_id": user_id,
-            "alias": user.alias,
+            "alias": user["alias"],
             "channel_id": channel_id
         }, to=room)
 
         # Send system message
         emit('system_message', {
-            "content": f"{user.alias} has left #{channel.name}",
+            "content": f"{user['alias']} has left #{channel.name}",
             "timestamp": datetime.utcnow().isoformat(),
             "channel_id": channel_id
         }, to=room)
@@ -151,14 +159,12 @@ def handle_send_message(data):
         print(f"Channel {channel_id} not found")
         return {"error": "Channel not found"}, 404
 
-    # Apply end-to-end encryption if enabled
-    if current_app.config.get('ENCRYPTION_ENABLED', False):
-        encrypted_content, key, nonce = encrypt_message(content)
+    # Encrypt the stored copy if enabled
+    if message_encryption.enabled:
+        encrypted_content = message_encryption.encrypt(channel_scope(channel_id), content)
         is_encrypted = True
     else:
         encrypted_content = content
-        key = None
-        nonce = None
         is_encrypted = False
 
     # Create and save the message
@@ -171,35 +177,25 @@ def handle_send_message(data):
         )
 
         db.session.add(new_message)
+        db.session.flush()
+        record_channel_activity(channel_id, new_message.id, new_message.timestamp)
         db.session.commit()
         print(f"Message saved with ID: {new_message.id}")
 
-        # Get user for response
-        user = User.query.get(user_id)
+        # Get the cached author card for the response
+        author = connection_profiles.get(request.sid, user_id)
 
         # Prepare the message data for broadcasting
         message_data = {
             "id": new_message.id,
             "content": content,  # Send original content to clients
             "timestamp": new_message.timestamp.isoformat(),
-            "author": {
-                "id": user.id,
-                "alias": user.alias,
-                "avatar_color": user.avatar_color,
-                "avatar_face": user.avatar_face
-            },
+            "author": author,
             "channel_id": channel_id,
             "is_encrypted": is_encrypted,
             "reactions": {}
         }
 
-        # If message is encrypted, add encryption data
-        if is_encrypted and key and nonce:
-            message_data["encryption"] = {
-                "key": key,
-                "nonce": nonce
-            }
-
         # Broadcast to the channel room
         room = f"channel_{channel_id}"
         print(f"Broadcasting message to room: {room}")
@@ -222,19 +218,22 @@ def handle_typing(data):
     user_id = session['user_id']
     channel_id = data['channel_id']
 
-    user = User.query.get(user_id)
+    user = connection_profiles.get(request.sid, user_id)
     if not user:
         return
 
-    # Get the room name
-    room = f"channel_{channel_id}"
+    # The tracker rate limits keystrokes and tells the room who started or
+    # stopped typing in one typing_state frame
+    typing_tracker.typing(user_id, user["alias"], channel_id)
+
 
-    # Emit to everyone in the room except the sender
-    emit('user_typing', {
-        "user_id": user_id,
-        "alias": user.alias,
-        "channel_id": channel_id
-    }, to=room, include_self=False)
+@socketio.on('stop_typing')
+def handle_stop_typing(data):
+    """Handle a client clearing its typing indicator"""
+    if 'channel_id' not in data or 'user_id' not in session:
+        return
+
+    typing_tracker.stop(session['user_id'], data['channel_id'])
 
 
 @socketio.on('direct_message')
@@ -251,14 +250,12 @@ def handle_direct_message(data):
 
     print(f"Processing direct message from user {sender_id} to user {recipient_id}")
 
-    # Apply end-to-end encryption if enabled
-    if current_app.config.get('ENCRYPTION_ENABLED', False):
-        encrypted_content, key, nonce = encrypt_message(content)
+    # Encrypt the stored copy if enabled
+    if message_encryption.enabled:
+        encrypted_content = message_encryption.encrypt(dm_scope(sender_id, recipient_id), content)
         is_encrypted = True
     else:
         encrypted_content = content
-        key = None
-        nonce = None
         is_encrypted = False
 
     # Create and save the direct message
@@ -272,11 +269,13 @@ def handle_direct_message(data):
         )
 
         db.session.add(new_dm)
+        db.session.flush()
+        record_direct_message(new_dm)
         db.session.commit()
         print(f"Direct message saved with ID: {new_dm.id}")
 
-        # Get user data for response
-        sender = User.query.get(sender_id)
+        # Get the cached author card for the response
+        sender = connection_profiles.get(request.sid, sender_id)
 
         # Create a unique room for the conversation between these two users
         # We sort the IDs to ensure the same room name regardless of who sends the message
@@ -288,38 +287,25 @@ def handle_direct_message(data):
             "id": new_dm.id,
             "content": content,  # Send original content
             "timestamp": new_dm.timestamp.isoformat(),
-            "sender": {
-                "id": sender.id,
-                "alias": sender.alias,
-                "avatar_color": sender.avatar_color,
-                "avatar_face": sender.avatar_face
-            },
+            "sender": sender,
             "recipient_id": recipient_id,
             "is_read": False,
             "is_encrypted": is_encrypted
         }
 
-        # Add encryption data if applicable
-        if is_encrypted and key and nonce:
-            message_data["encryption"] = {
-                "key": key,
-                "nonce": nonce
-            }
-
         # Broadcast to the DM room
         emit('new_direct_message', message_data, to=room)
 
-        # Also emit to the recipient's personal room if they're online
-        recipient = User.query.get(recipient_id)
-        if recipient and recipient.is_online:
-            emit('dm_notification', {
-                "dm_id": new_dm.id,
-                "sender": {
-                    "id": sender.id,
-                    "alias": sender.alias
-                },
-                "timestamp": new_dm.timestamp.isoformat()
-            }, to=f"user_{recipient_id}")
+        # Also notify the recipient's personal room; this is a no-op if they are
+        # not connected, and reaches them on any worker without a presence lookup
+        emit('dm_notification', {
+            "dm_id": new_dm.id,
+            "sender": {
+                "id": sender["id"],
+                "alias": sender["alias"]
+            },
+            "timestamp": new_dm.timestamp.isoformat()
+        }, to=f"user_{recipient_id}")
 
         return message_data
 
@@ -331,7 +317,7 @@ def handle_direct_message(data):
 
 @socketio.on('mark_read')
 def handle_mark_read(data):
-    """Mark messages as read"""
+    """Mark messages as read (kept for clients that send explicit message ids)"""
     print(f"Marking messages as read: {data}")
     if 'message_ids' not in data or 'user_id' not in session:
         print("Invalid mark read data")
@@ -340,12 +326,19 @@ def handle_mark_read(data):
     recipient_id = session['user_id']
     message_ids = data['message_ids']
 
-    # Update read status for these messages
+    # Move each affected conversation's read watermark up to the newest marked message
     try:
-        updated = DirectMessage.query.filter(
+        newest = db.session.query(
+            DirectMessage.sender_id, func.max(DirectMessage.id), func.count(DirectMessage.id)
+        ).filter(
             DirectMessage.id.in_(message_ids),
             DirectMessage.recipient_id == recipient_id
-        ).update({DirectMessage.is_read: True}, synchronize_session=False)
+        ).group_by(DirectMessage.sender_id).all()
+
+        updated = 0
+        for partner_id, message_id, count in newest:
+            advance_read_watermark(recipient_id, partner_id, message_id)
+            updated += count
 
         db.session.commit()
         print(f"Marked {updated} messages as read")
@@ -358,6 +351,56 @@ def handle_mark_read(data):
         return {"error": "Failed to mark messages as read"}, 500
 
 
+@socketio.on('mark_read_upto')
+def handle_mark_read_upto(data):
+    """Mark a channel or a DM conversation read up to and including a message id"""
+    if 'message_id' not in data or 'user_id' not in session:
+        return {"error": "Invalid mark read data"}
+
+    user_id = session['user_id']
+    message_id = data['message_id']
+    if 'channel_id' in data:
+        target_id = data['channel_id']
+    elif 'partner_id' in data:
+        target_id = data['partner_id']
+    else:
+        return {"error": "channel_id or partner_id required"}
+    if not all(type(value) is int for value in (message_id, target_id)):
+        return {"error": "Invalid mark read data"}
+
+    try:
+        if 'channel_id' in data:
+            # Only move the watermark to a message that is in the channel
+            if not Message.query.filter_by(id=message_id, channel_id=target_id).count():
+                return {"error": "Message not found"}
+            advance_channel_read_watermark(user_id, target_id, message_id)
+            db.session.commit()
+        else:
+            partner_id = target_id
+            in_conversation = DirectMessage.query.filter(
+                DirectMessage.id == message_id,
+                or_(and_(DirectMessage.sender_id == partner_id, DirectMessage.recipient_id == user_id),
+                    and_(DirectMessage.sender_id == user_id, DirectMessage.recipient_id == partner_id))
+            ).count()
+            if not in_conversation:
+                return {"error": "Message not found"}
+            advance_read_watermark(user_id, partner_id, message_id)
+            db.session.commit()
+
+            # Let the other side update its read receipts
+            emit('read_receipt', {
+                "reader_id": user_id,
+                "read_up_to": message_id
+            }, to=f"user_{partner_id}")
+
+        return {"status": "success"}
+
+    except Exception as e:
+        logger.error(f"Error advancing read watermark: {str(e)}")
+        db.session.rollback()
+        return {"error": "Failed to mark messages as read"}
+
+
 @socketio.on('reaction')
 def handle_reaction(data):
     """Add or remove a reaction to a message"""
@@ -465,49 +508,11 @@ def handle_sync_messages(data):
         
         logger.info(f"Found {len(messages)} missed messages for channel {channel_id} since {since_timestamp}")
         
-        # Prepare messages data
-        messages_data = []
-        for message in messages:
-            # Skip the user's own messages as they should already have them
-            if message.user_id == user_id:
-                continue
-                
-            # Get author data
-            from server.models import User
-            author = User.query.get(message.user_id)
-            if not author:
-                continue
-            
-            # Get reactions data
-            reactions = {}
-            for reaction in message.reactions:
-                if reaction.reaction_type not in reactions:
-                    reactions[reaction.reaction_type] = 0
-                reactions[reaction.reaction_type] += 1
-            
-            # Prepare message data
-            content = message.content
-            if message.is_encrypted and current_app.config.get('ENCRYPTION_ENABLED'):
-                # In a real app, we would handle end-to-end encryption appropriately
-                # For this example, we're just acknowledging it's encrypted
-                pass
-                
-            message_data = {
-                "id": message.id,
-                "content": content,
-                "timestamp": message.timestamp.isoformat(),
-                "author": {
-                    "id": author.id,
-                    "alias": author.alias,
-                    "avatar_color": author.avatar_color,
-                    "avatar_face": author.avatar_face
-                },
-                "channel_id": message.channel_id,
-                "reactions": reactions,
-                "is_encrypted": message.is_encrypted
-            }
-            
-            messages_data.append(message_data)
+        # Skip the user's own messages as they should already have them
+        messages = [message for message in messages if message.user_id != user_id]
+
+        # Prepare messages data with authors and reactions loaded in bulk
+        messages_data = load_message_page(messages, include_channel=True)
         
         # Send the missed messages to the client
         if messages_data:
@@ -566,15 +571,13 @@ def handle_send_message(data, callback=None):
             callback({"error": "Channel not found"})
         return
 
-    # Apply end-to-end encryption if enabled
+    # Encrypt the stored copy if enabled
     is_encrypted = False
-    encryption_data = None
     
-    if current_app.config.get('ENCRYPTION_ENABLED', False):
+    if message_encryption.enabled:
         try:
-            encrypted_content, key, nonce = encrypt_message(content)
+            encrypted_content = message_encryption.encrypt(channel_scope(channel_id), content)
             is_encrypted = True
-            encryption_data = {"key": key, "nonce": nonce}
         except Exception as e:
             logger.error(f"Encryption error: {str(e)}")
             encrypted_content = content
@@ -583,52 +586,68 @@ def handle_send_message(data, callback=None):
 
     # Create and save the message
     try:
-        new_message = Message(
-            content=encrypted_content,
-            user_id=user_id,
-            channel_id=channel_id,
-            is_encrypted=is_encrypted,
-            timestamp=datetime.utcnow()
-        )
+        if message_writer.enabled:
+            # Take an id now and let the background flusher insert the row
+            new_message = message_writer.submit(
+                content=encrypted_content,
+                user_id=user_id,
+                channel_id=channel_id,
+                is_encrypted=is_encrypted
+            )
+            logger.info(f"Message queued with ID: {new_message.id}")
+        else:
+            new_message = Message(
+                content=encrypted_content,
+                user_id=user_id,
+                channel_id=channel_id,
+                is_encrypted=is_encrypted,
+                timestamp=datetime.utcnow()
+            )
 
-        db.session.add(new_message)
-        db.session.commit()
-        logger.info(f"Message saved with ID: {new_message.id}")
+            db.session.add(new_message)
+            db.session.flush()
+            record_channel_activity(channel_id, new_message.id, new_message.timestamp)
+            db.session.commit()
+            logger.info(f"Message saved with ID: {new_message.id}")
 
-        # Get user for response
-        user = User.query.get(user_id)
+        # Get the cached author card for the response
+        author = connection_profiles.get(request.sid, user_id)
 
         # Prepare the message data for broadcasting
         message_data = {
             "id": new_message.id,
             "content": content,  # Send original content to clients
             "timestamp": new_message.timestamp.isoformat(),
-            "author": {
-                "id": user.id,
-                "alias": user.alias,
-                "avatar_color": user.avatar_color,
-                "avatar_face": user.avatar_face
-            },
+            "author": author,
             "channel_id": channel_id,
             "is_encrypted": is_encrypted,
             "reactions": {}
         }
 
-        # If message is encrypted, add encryption data
-        if is_encrypted and encryption_data:
-            message_data["encryption"] = encryption_data
-
-        # Broadcast to the channel room
+        # Broadcast to the channel room. With write-behind this happens before
+        # the row is written, so a message that then fails to save has already
+        # been seen; only the sender's ack reports it (see MessageWriter).
         room = f"channel_{channel_id}"
         logger.info(f"Broadcasting message to room: {room}")
         emit('new_message', message_data, to=room)
+        typing_tracker.stop(user_id, channel_id)
+
+        # Only acknowledge a queued message once it has been written
+        if message_writer.enabled and not message_writer.wait(new_message):
+            logger.error(f"Message {new_message.id} was broadcast but could not be saved")
+            response = {"error": "Failed to save message"}
+        else:
+            response = {"status": "success", "message_id": new_message.id}
 
-        # Send success response to sender with the message ID
+        # Send the response to the sender with the message ID
         if callback:
-            callback({"status": "success", "message_id": new_message.id})
+            callback(response)
+        return response
 
     except Exception as e:
         logger.error(f"Error saving message: {str(e)}")
         db.session.rollback()
+        response = {"error": "Failed to save message"}
         if callback:
-            callback({"error": "Failed to save message"})
\ No newline at end of file
+            callback(response)
+        return response
\ No newline at end of file
@@ -24,6 +24,7 @@ document.addEventListener('DOMContentLoaded', function() {
     const channelItems = document.querySelectorAll('.channel');
     const typingIndicator = document.querySelector('.typing-indicator');
     let currentChannel = 1; // Default channel ID
+    const channelTypers = new Map(); // user_id -> alias of others typing in currentChannel
 
     console.log("Chat.js initialized");
 
@@ -49,6 +50,8 @@ document.addEventListener('DOMContentLoaded', function() {
         console.log(`Joining channel: ${channelId}`);
         socket.emit('join', { channel_id: channelId });
         currentChannel = channelId;
+        channelTypers.clear();
+        hideTypingIndicator();
 
         // Update UI to show active channel
         channelItems.forEach(channel => {
@@ -281,16 +284,23 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
-    // Listen for typing indicator
-    socket.on('user_typing', (data) => {
-        if (data.channel_id === currentChannel) {
-            // Show typing indicator
-            showTypingIndicator(data.alias);
-
-            // Hide after 3 seconds
-            setTimeout(() => {
-                hideTypingIndicator();
-            }, 3000);
+    // Listen for typing indicator. Each server worker sends who started and
+    // stopped typing among its own users, and who is already typing when we
+    // join, so the frames are merged here; no client-side timer is needed.
+    socket.on('typing_state', (data) => {
+        if (data.channel_id !== currentChannel) return;
+
+        // Frames also reach the typer's own sockets
+        const ownId = typeof USER_ID !== 'undefined' ? USER_ID : null;
+        data.stopped.forEach(typer => channelTypers.delete(typer.user_id));
+        data.started
+            .filter(typer => typer.user_id !== ownId)
+            .forEach(typer => channelTypers.set(typer.user_id, typer.alias));
+
+        if (channelTypers.size) {
+            showTypingIndicator([...channelTypers.values()].join(', '));
+        } else {
+            hideTypingIndicator();
         }
     });
 
@@ -346,22 +356,29 @@ document.addEventListener('DOMContentLoaded', function() {
     });
 
     // User online/offline events
+    function setUserStatus(userId, online) {
+        document.querySelectorAll(`.dm-item[data-user-id="${userId}"] .status-indicator`).forEach(indicator => {
+            indicator.classList.remove(online ? 'offline' : 'online');
+            indicator.classList.add(online ? 'online' : 'offline');
+        });
+    }
+
     socket.on('user_online', (data) => {
         console.log('User online event:', data);
         // Update UI to show user is online
-        document.querySelectorAll(`.dm-item[data-user-id="${data.user_id}"] .status-indicator`).forEach(indicator => {
-            indicator.classList.remove('offline');
-            indicator.classList.add('online');
-        });
+        setUserStatus(data.user_id, true);
     });
 
     socket.on('user_offline', (data) => {
         console.log('User offline event:', data);
         // Update UI to show user is offline
-        document.querySelectorAll(`.dm-item[data-user-id="${data.user_id}"] .status-indicator`).forEach(indicator => {
-            indicator.classList.remove('online');
-            indicator.classList.add('offline');
-        });
+        setUserStatus(data.user_id, false);
+    });
+
+    // Batched presence changes sent by the server every few seconds
+    socket.on('presence_update', (data) => {
+        data.online.forEach(user => setUserStatus(user.user_id, true));
+        data.offline.forEach(user => setUserStatus(user.user_id, false));
     });
 });
 
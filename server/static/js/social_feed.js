@@ -83,7 +83,7 @@ function createPostElement(post) {
         </div>
         <div class="post-content">
             <p class="post-text">${post.content}</p>
-            ${post.image_url ? `<img src="${post.image_url}" alt="Posted image" class="post-image">` : ''}
+            ${postImage(post)}
         </div>
         <div class="post-stats">
             <div class="post-likes">
@@ -141,6 +141,16 @@ function createPostElement(post) {
     return div;
 }
 
+// Render a post's image, preferring the resized preview with its size so the layout doesn't jump
+function postImage(post) {
+    if (post.image) {
+        const image = post.image.variants.preview || post.image;
+        const size = image.width ? `width="${image.width}" height="${image.height}"` : '';
+        return `<img src="${image.url}" ${size} loading="lazy" alt="Posted image" class="post-image">`;
+    }
+    return post.image_url ? `<img src="${post.image_url}" alt="Posted image" class="post-image">` : '';
+}
+
 // Setup event listeners for a post element
 function setupPostEventListeners(postElement, post) {
     // Like button
@@ -0,0 +1,98 @@
+import csv
+from itertools import islice
+from sqlalchemy import select, insert
+from server.app import db
+from server.models import Student
+
+# Header names recognised as the student id column in CSV rosters
+ID_COLUMNS = ('student_id', 'id', 'student id', 'studentid')
+
+MAX_ID_LENGTH = Student.__table__.c.id.type.length
+
+
+def read_student_ids(f, column=None):
+    """Yield student ids from a roster file, one row at a time.
+
+    Plain text files have one id per line. CSV files (any line with a comma)
+    may have extra columns; the id is taken from ``column`` (a header name or
+    0-based index), else from a header named like ``student_id``, else from
+    the first column. The first row is skipped when it is a header.
+    """
+    first = f.readline()
+    if not first:
+        return
+
+    if ',' not in first:
+        if first.strip().lower() not in ID_COLUMNS:
+            yield first.strip()
+        for line in f:
+            yield line.strip()
+        return
+
+    first_row = next(csv.reader([first]))
+    names = [name.strip().lower() for name in first_row]
+    wanted = str(column).strip().lower() if column is not None else None
+
+    if wanted is not None and wanted.isdigit():
+        index = int(wanted)
+    elif wanted is not None:
+        if wanted not in names:
+            raise ValueError(f"Column {column!r} not found in header")
+        index = names.index(wanted)
+    else:
+        index = next((names.index(name) for name in ID_COLUMNS if name in names), 0)
+
+    # The first row is a header if it names an id column, otherwise it is data
+    if wanted not in names and not any(name in ID_COLUMNS for name in names):
+        yield first_row[index].strip() if len(first_row) > index else ''
+
+    for row in csv.reader(f):
+        yield row[index].strip() if len(row) > index else ''
+
+
+def import_students(student_ids, batch_size=1000, dry_run=False, progress=None):
+    """Insert the ids that aren't in the student table yet, a batch at a time.
+
+    Each batch costs one ``IN`` query to find existing ids and one
+    multi-row INSERT, and is committed on its own unless ``dry_run`` is set.
+    ``progress(counts)`` is called after every batch. Returns a dict with
+    ``read``, ``inserted``, ``skipped`` (already present or repeated) and
+    ``invalid`` (blank or too long) counts.
+    """
+    counts = {"read": 0, "inserted": 0, "skipped": 0, "invalid": 0}
+    seen = set()
+    student_ids = iter(student_ids)
+
+    while True:
+        chunk = list(islice(student_ids, batch_size))
+        if not chunk:
+            break
+        counts["read"] += len(chunk)
+
+        batch = []
+        for student_id in chunk:
+            if not student_id or len(student_id) > MAX_ID_LENGTH:
+                counts["invalid"] += 1
+            elif student_id in seen:
+                counts["skipped"] += 1
+            else:
+                seen.add(student_id)
+                batch.append(student_id)
+
+        existing = set(db.session.scalars(
+            select(Student.id).where(Student.id.in_(batch))
+        )) if batch else set()
+        new_ids = [student_id for student_id in batch if student_id not in existing]
+        counts["skipped"] += len(existing)
+        counts["inserted"] += len(new_ids)
+
+        if new_ids and not dry_run:
+            db.session.execute(insert(Student), [{"id": student_id, "is_registered": False} for student_id in new_ids])
+            db.session.commit()
+
+        if progress:
+            progress(counts)
+
+    if dry_run:
+        db.session.rollback()
+    return counts
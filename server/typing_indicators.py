@@ -0,0 +1,142 @@
+import time
+import logging
+from server.app import socketio
+
+logger = logging.getLogger('socketio')
+
+
+class TypingTracker:
+    """Server-side typing state per (user, channel).
+
+    Keystroke events from a client are rate limited to one every
+    ``TYPING_MIN_EVENT_INTERVAL`` seconds; each accepted event keeps the user
+    marked as typing for ``TYPING_TIMEOUT`` seconds. Rooms only hear about
+    start/stop transitions, sent together in one ``typing_state`` frame at
+    most once per ``TYPING_BROADCAST_INTERVAL``.
+
+    Each worker only knows the typers whose sockets it serves, so frames
+    carry ``started``/``stopped`` changes rather than the full list, and
+    clients merge the frames of every worker. A client joining a channel is
+    sent who is already typing there by :meth:`sync`, which asks the other
+    workers to do the same when the message queue is the SQLite bus. Frames
+    include the typer's own sockets; clients skip their own user id.
+    """
+
+    def __init__(self, emit=None):
+        self.min_event_interval = 0.5
+        self.timeout = 3
+        self.broadcast_interval = 0.5
+        self._emit = emit
+        self._typers = {}    # channel_id -> {user_id: [alias, last_event, expires_at]}
+        self._dirty = set()  # channel_ids whose typer set changed since the last frame
+        self._announced = {}  # channel_id -> {user_id: alias} in the last frames sent
+        self._bus = None
+        self._task = None
+        self.frames_emitted = 0
+
+    def init_app(self, app):
+        self.min_event_interval = app.config.get('TYPING_MIN_EVENT_INTERVAL', self.min_event_interval)
+        self.timeout = app.config.get('TYPING_TIMEOUT', self.timeout)
+        self.broadcast_interval = app.config.get('TYPING_BROADCAST_INTERVAL', self.broadcast_interval)
+
+        manager = socketio.server.manager
+        if hasattr(manager, 'publish_control'):
+            self._bus = manager
+            manager.on_control('typing_sync', self._on_remote_sync)
+        self._task = socketio.start_background_task(self._run)
+
+    def typing(self, user_id, alias, channel_id, now=None):
+        """Record a keystroke event. Returns False if it was dropped by the rate limit."""
+        now = time.monotonic() if now is None else now
+        typers = self._typers.setdefault(channel_id, {})
+        state = typers.get(user_id)
+
+        if state is None:
+            typers[user_id] = [alias, now, now + self.timeout]
+            self._dirty.add(channel_id)
+            return True
+
+        if now - state[1] < self.min_event_interval:
+            return False
+
+        state[1] = now
+        state[2] = now + self.timeout
+        return True
+
+    def stop(self, user_id, channel_id):
+        """Mark a user as no longer typing, e.g. once their message is sent"""
+        typers = self._typers.get(channel_id)
+        if typers and typers.pop(user_id, None) is not None:
+            self._dirty.add(channel_id)
+            if not typers:
+                del self._typers[channel_id]
+
+    def stop_all(self, user_id):
+        """Clear a user from every channel, e.g. on disconnect"""
+        for channel_id in [c for c, typers in self._typers.items() if user_id in typers]:
+            self.stop(user_id, channel_id)
+
+    def tick(self, now=None):
+        """Expire idle typers and send one frame per room whose typer set changed"""
+        now = time.monotonic() if now is None else now
+
+        for channel_id, typers in list(self._typers.items()):
+            for user_id in [u for u, state in typers.items() if state[2] <= now]:
+                self.stop(user_id, channel_id)
+
+        dirty, self._dirty = self._dirty, set()
+        for channel_id in dirty:
+            typers = self._typers.get(channel_id, {})
+            announced = self._announced.pop(channel_id, {})
+            started = [
+                {"user_id": user_id, "alias": state[0]}
+                for user_id, state in typers.items() if user_id not in announced
+            ]
+            stopped = [
+                {"user_id": user_id, "alias": alias}
+                for user_id, alias in announced.items() if user_id not in typers
+            ]
+            if typers:
+                self._announced[channel_id] = {user_id: state[0] for user_id, state in typers.items()}
+            if not started and not stopped:
+                continue  # Started and stopped again between two frames
+
+            self.emit('typing_state', {
+                "channel_id": channel_id,
+                "started": started,
+                "stopped": stopped
+            }, to=f"channel_{channel_id}")
+
+    def sync(self, channel_id, sid):
+        """Send a client that just joined a channel everyone already typing there"""
+        self._send_announced(channel_id, sid)
+        if self._bus is not None:
+            self._bus.publish_control('typing_sync', channel_id=channel_id, sid=sid)
+
+    def _on_remote_sync(self, data):
+        self._send_announced(data['channel_id'], data['sid'])
+
+    def _send_announced(self, channel_id, sid):
+        # What the room has been told so far; later changes reach the client with the room's frames
+        announced = self._announced.get(channel_id)
+        if announced:
+            self.emit('typing_state', {
+                "channel_id": channel_id,
+                "started": [{"user_id": user_id, "alias": alias} for user_id, alias in announced.items()],
+                "stopped": []
+            }, to=sid)
+
+    def emit(self, event, data, to):
+        self.frames_emitted += 1
+        (self._emit or socketio.emit)(event, data, to=to)
+
+    def _run(self):
+        while True:
+            socketio.sleep(self.broadcast_interval)
+            try:
+                self.tick()
+            except Exception as e:
+                logger.error(f"Error sending typing state: {str(e)}")
+
+
+typing_tracker = TypingTracker()
@@ -0,0 +1,269 @@
+import os
+import re
+import json
+import hashlib
+import logging
+import tempfile
+import mimetypes
+from flask import Blueprint, current_app, request, send_from_directory, abort
+from werkzeug.security import safe_join
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from server.app import db, socketio
+from server.models import Upload
+from server.conditional import bump
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional; without it images are stored but not resized
+    Image = None
+
+logger = logging.getLogger('api')
+
+CHUNK_SIZE = 64 * 1024
+URL_PREFIX = '/uploads'
+
+# <sha[:2]>/<sha256>[_<edge>].<ext>; the name identifies the content, so it never changes
+CONTENT_ADDRESSED = re.compile(r'^[0-9a-f]{2}/([0-9a-f]{64}(?:_\d+)?)\.\w+$')
+
+uploads = Blueprint('uploads', __name__, url_prefix=URL_PREFIX)
+
+
+class InvalidUpload(ValueError):
+    """Raised when an uploaded file is not a readable image"""
+
+
+def render_variants(path, sizes):
+    """Write resized copies of the image at ``path``, one per ``{name: longest edge}``.
+
+    Variants are written next to the original as ``<sha>_<edge>.jpg`` (or
+    ``.png`` when the image has transparency), so changing a size gives new URLs. A variant that would not be
+    smaller than the original is left out. Returns ``{name: (path, width, height)}``.
+    Pure file work, so it can run on a native thread.
+    """
+    folder, filename = os.path.split(path)
+    stem = filename.rsplit('.', 1)[0]
+    rendered = {}
+
+    with Image.open(path) as image:
+        # Let JPEG decode at a reduced scale when even the largest variant is much smaller
+        image.draft('RGB', (max(sizes.values()), max(sizes.values())))
+        transparent = image.mode in ('RGBA', 'LA') or 'transparency' in image.info
+        image = image.convert('RGBA' if transparent else 'RGB')
+
+        # Largest first, so each smaller variant is resized from the previous one
+        for name, edge in sorted(sizes.items(), key=lambda item: item[1], reverse=True):
+            if max(image.size) <= edge:
+                continue
+            image = image.copy()
+            image.thumbnail((edge, edge))
+            variant_path = os.path.join(folder, f"{stem}_{edge}.{'png' if transparent else 'jpg'}")
+            if transparent:
+                image.save(variant_path, 'PNG', optimize=False)
+            else:
+                image.save(variant_path, 'JPEG', quality=85)
+            rendered[name] = (variant_path, image.width, image.height)
+
+    return rendered
+
+
+class UploadStore:
+    """Stores uploaded images by content and makes resized variants.
+
+    :meth:`save` streams the upload to a temp file while hashing it and moves
+    it to ``<UPLOAD_FOLDER>/<sha[:2]>/<sha>.<ext>``, so re-posting the same
+    image reuses the stored file and its :class:`Upload` row. New images are
+    queued for ``UPLOAD_VARIANT_WORKERS`` background tasks, which write the
+    ``UPLOAD_VARIANTS`` sizes. Under eventlet the resizing runs on native
+    threads through ``eventlet.tpool`` so it never stalls the hub.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.folder = None
+        self.sizes = {}
+        self.workers = 0
+        self.offload = False
+        self._queue = None
+        self.stored = 0
+        self.deduplicated = 0
+        self.resized = 0
+        self.failed = 0
+
+    def init_app(self, app):
+        self.app = app
+        self.folder = app.config['UPLOAD_FOLDER']
+        self.sizes = app.config.get('UPLOAD_VARIANTS', {'thumb': 320, 'preview': 1280})
+        self.workers = app.config.get('UPLOAD_VARIANT_WORKERS', 2)
+        self.offload = app.config.get('SOCKETIO_ASYNC_MODE') == 'eventlet'
+        os.makedirs(self.folder, exist_ok=True)
+
+        if Image is None:
+            logger.warning("Pillow is not installed, uploaded images will not be resized")
+        elif self.workers:
+            self._queue = socketio.server.eio.create_queue()
+            for _ in range(self.workers):
+                socketio.start_background_task(self._run)
+
+    def save(self, file):
+        """Store an uploaded image and return its :class:`Upload` row.
+
+        Raises :class:`InvalidUpload` if Pillow is available and can't read it.
+        """
+        extension = file.filename.rsplit('.', 1)[1].lower()
+        digest = hashlib.sha256()
+        size = 0
+
+        fd, temp_path = tempfile.mkstemp(dir=self.folder, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in iter(lambda: file.stream.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+            sha256 = digest.hexdigest()
+
+            upload = db.session.get(Upload, sha256)
+            if upload is not None:
+                self.deduplicated += 1
+                return upload
+
+            width = height = None
+            if Image is not None:
+                try:
+                    with Image.open(temp_path) as image:
+                        width, height = image.size  # Only reads the header
+                except Exception as e:
+                    raise InvalidUpload(str(e))
+
+            relative = f"{sha256[:2]}/{sha256}.{extension}"
+            path = os.path.join(self.folder, relative)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        # The file is on disk whether or not the caller commits, so the row
+        # is committed on its own
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(insert(Upload).values(
+                    sha256=sha256,
+                    url=f"{URL_PREFIX}/{relative}",
+                    size=size,
+                    width=width,
+                    height=height,
+                    status='pending' if Image is not None else 'ready'
+                ))
+        except IntegrityError:
+            # The same image was uploaded concurrently
+            self.deduplicated += 1
+            return db.session.get(Upload, sha256)
+
+        self.stored += 1
+        if self._queue is not None:
+            self._queue.put(sha256)
+        return db.session.get(Upload, sha256)
+
+    def path(self, upload):
+        return os.path.join(self.folder, upload.url[len(URL_PREFIX) + 1:])
+
+    def process(self, sha256):
+        """Write the variants for one upload and mark it ready. Returns True on success."""
+        upload = db.session.get(Upload, sha256)
+        if upload is None:
+            return False
+
+        try:
+            if self.offload:
+                from eventlet import tpool
+                rendered = tpool.execute(render_variants, self.path(upload), self.sizes)
+            else:
+                rendered = render_variants(self.path(upload), self.sizes)
+        except Exception as e:
+            upload.status = 'failed'
+            db.session.commit()
+            self.failed += 1
+            logger.error(f"Error resizing upload {sha256}: {str(e)}")
+            return False
+
+        # Sizes the image is already within are served by the original
+        variants = {
+            name: {"url": upload.url, "width": upload.width, "height": upload.height}
+            for name in self.sizes
+        }
+        for name, (path, width, height) in rendered.items():
+            variants[name] = {
+                "url": f"{URL_PREFIX}/{os.path.relpath(path, self.folder).replace(os.sep, '/')}",
+                "width": width,
+                "height": height
+            }
+
+        upload.variants = json.dumps(variants)
+        upload.status = 'ready'
+        bump('posts')
+        db.session.commit()
+        self.resized += 1
+        return True
+
+    def _run(self):
+        while True:
+            sha256 = self._queue.get()
+            with self.app.app_context():
+                try:
+                    self.process(sha256)
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"Error processing upload {sha256}: {str(e)}")
+
+
+upload_store = UploadStore()
+
+
+@uploads.route('/<path:filename>')
+def serve_upload(filename):
+    """Serve an uploaded file.
+
+    Content-addressed files get their hash as a strong ETag and are cached
+    as immutable for ``UPLOAD_CACHE_MAX_AGE``; older uploads with random
+    names are revalidated by size and modification time. Range requests are
+    supported. With ``UPLOAD_ACCEL_REDIRECT`` (nginx) or ``USE_X_SENDFILE``
+    set, the front proxy sends the file and the worker only writes headers.
+    """
+    match = CONTENT_ADDRESSED.match(filename)
+    etag = match.group(1) if match else True
+    max_age = current_app.config.get('UPLOAD_CACHE_MAX_AGE', 31536000) if match else None
+
+    def cache_forever(response):
+        if match:
+            response.set_etag(etag)
+            response.cache_control.public = True
+            response.cache_control.no_cache = None
+            response.cache_control.max_age = max_age
+            response.cache_control.immutable = True
+        return response
+
+    # Answer revalidations of immutable files without touching the disk
+    if match and etag in request.if_none_match:
+        return cache_forever(current_app.response_class(status=304))
+
+    accel = current_app.config.get('UPLOAD_ACCEL_REDIRECT')
+    if accel:
+        path = safe_join(upload_store.folder, filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        response = current_app.response_class(
+            mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        )
+        response.headers['X-Accel-Redirect'] = f"{accel.rstrip('/')}/{filename}"
+        return cache_forever(response)
+
+    response = send_from_directory(upload_store.folder, filename, etag=etag, max_age=max_age)
+    response.headers.setdefault('Accept-Ranges', 'bytes')
+    return cache_forever(response)
+
+
+@uploads.errorhandler(404)
+def upload_not_found(error):
+    return "Not found", 404
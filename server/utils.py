@@ -2,12 +2,10 @@ import os
 import secrets
 import random
 import re
-import base64
 import json
 from datetime import datetime
 from flask import current_app
 from werkzeug.utils import secure_filename
-from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 
@@ -94,19 +92,57 @@ def is_valid_student_id(student_id):
 
 
 # Content sanitization
+_BLOCK_TAGS = [
+    ('<script', re.compile(r'<script\b'), '</script>'),
+    ('<iframe', re.compile(r'<iframe\b'), '</iframe>'),
+]
+
+
+def _strip_blocks(text, opener, closer):
+    """Remove every ``<tag ...>...</tag>`` block, first closing tag wins"""
+    pieces = []
+    position = 0
+    while True:
+        match = opener.search(text, position)
+        if match is None:
+            break
+        end = text.find(closer, match.end())
+        if end == -1:
+            # No closing tag after this one, so none after any later opener either
+            break
+        pieces.append(text[position:match.start()])
+        position = end + len(closer)
+
+    if not pieces:
+        return text
+    pieces.append(text[position:])
+    return ''.join(pieces)
+
+
 def sanitize_text(text):
-    """Basic sanitization for user input"""
+    """Basic sanitization for user input.
+
+    Removes ``<script>`` and ``<iframe>`` blocks and escapes ``<`` and ``>``.
+    Runs in linear time; text without angle brackets is returned as is.
+    """
     if not text:
         return ""
 
+    if '<' not in text:
+        return text.replace('>', '&gt;') if '>' in text else text
+
     # Remove script tags and other potentially dangerous HTML
-    text = re.sub(r'<script\b[^<]*(?:(?!<\/script>)<[^<]*)*<\/script>', '', text)
-    text = re.sub(r'<iframe\b[^<]*(?:(?!<\/iframe>)<[^<]*)*<\/iframe>', '', text)
+    for prefix, opener, closer in _BLOCK_TAGS:
+        if prefix in text:
+            text = _strip_blocks(text, opener, closer)
 
     # Handle basic HTML encoding
-    text = text.replace('<', '&lt;').replace('>', '&gt;')
+    return text.replace('<', '&lt;').replace('>', '&gt;')
+
 
-    return text
+def sanitize_many(texts):
+    """Sanitize a batch of texts, e.g. rows being imported"""
+    return [sanitize_text(text) for text in texts]
 
 
 # Encryption utilities for end-to-end encrypted chat
@@ -131,46 +167,6 @@ def derive_key(password, salt=None):
     return key, salt
 
 
-def encrypt_message(message, key=None):
-    """Encrypt a message using AES-256-GCM"""
-    if not current_app.config.get('ENCRYPTION_ENABLED', False):
-        return message, None, None
-
-    if key is None:
-        key = generate_encryption_key()
-
-    # Generate a random nonce
-    nonce = secrets.token_bytes(12)
-
-    # Encrypt the message
-    aesgcm = AESGCM(key)
-    ciphertext = aesgcm.encrypt(nonce, message.encode(), None)
-
-    # Encode binary data as base64 for storage
-    return (
-        base64.b64encode(ciphertext).decode(),
-        base64.b64encode(key).decode(),
-        base64.b64encode(nonce).decode()
-    )
-
-
-def decrypt_message(encrypted_message, key, nonce):
-    """Decrypt a message using AES-256-GCM"""
-    if not current_app.config.get('ENCRYPTION_ENABLED', False):
-        return encrypted_message
-
-    # Decode from base64
-    ciphertext = base64.b64decode(encrypted_message)
-    key_bytes = base64.b64decode(key)
-    nonce_bytes = base64.b64decode(nonce)
-
-    # Decrypt the message
-    aesgcm = AESGCM(key_bytes)
-    plaintext = aesgcm.decrypt(nonce_bytes, ciphertext, None)
-
-    return plaintext.decode()
-
-
 # Datetime formatting
 def format_timestamp(timestamp, format_string="%b %d, %Y at %H:%M"):
     """Format a datetime object or ISO string to a human-readable string"""
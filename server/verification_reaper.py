@@ -0,0 +1,80 @@
+import time
+import logging
+from datetime import datetime
+from sqlalchemy import select, delete, or_
+from server.app import db, socketio
+from server.models import VerificationCode
+
+logger = logging.getLogger('auth')
+
+
+def reapable(now=None):
+    """Condition matching verification codes that can never be used again"""
+    now = now or datetime.utcnow()
+    return or_(VerificationCode.expires_at < now, VerificationCode.used == True)
+
+
+class VerificationReaper:
+    """Background task that deletes expired and used verification codes.
+
+    Codes were only removed when they were used or resent, so abandoned
+    registrations piled up forever. Every ``VERIFICATION_REAP_INTERVAL``
+    seconds the reaper deletes them ``VERIFICATION_REAP_BATCH_SIZE`` rows at
+    a time, yielding between batches so a large backlog never holds the
+    database lock for long.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.interval = 300
+        self.batch_size = 500
+        self._task = None
+        self.reaped = 0
+        self.runs = 0
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = app.config.get('VERIFICATION_REAP_INTERVAL', self.interval)
+        self.batch_size = app.config.get('VERIFICATION_REAP_BATCH_SIZE', self.batch_size)
+        if self.interval:
+            self._task = socketio.start_background_task(self._run)
+
+    def reap_batch(self, now=None):
+        """Delete one batch of dead codes. Returns the number deleted."""
+        batch = select(VerificationCode.id).where(reapable(now)).limit(self.batch_size).scalar_subquery()
+        deleted = db.session.execute(
+            delete(VerificationCode).where(VerificationCode.id.in_(batch))
+        ).rowcount
+        db.session.commit()
+        return deleted
+
+    def reap(self, now=None, pause=0.0):
+        """Delete every dead code, a batch at a time. Returns the number deleted."""
+        now = now or datetime.utcnow()
+        total = 0
+        while True:
+            deleted = self.reap_batch(now)
+            total += deleted
+            if deleted < self.batch_size:
+                break
+            socketio.sleep(pause)
+
+        self.reaped += total
+        self.runs += 1
+        return total
+
+    def _run(self):
+        while True:
+            socketio.sleep(self.interval)
+            with self.app.app_context():
+                try:
+                    began = time.monotonic()
+                    deleted = self.reap(pause=0.05)
+                    if deleted:
+                        logger.info(f"Reaped {deleted} verification codes in {time.monotonic() - began:.2f}s")
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"Error reaping verification codes: {str(e)}")
+
+
+verification_reaper = VerificationReaper()
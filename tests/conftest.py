@@ -0,0 +1,94 @@
+import os
+import sys
+import shutil
+import itertools
+import tempfile
+from contextlib import contextmanager
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TMP = tempfile.mkdtemp(prefix='campus-connect-tests-')
+
+# The app is created when server.app is imported, so point it at a
+# throwaway database and keep it in a single process first
+os.environ['DEV_DATABASE_URL'] = f"sqlite:///{os.path.join(TMP, 'app.db')}"
+os.environ.pop('FLASK_ENV', None)
+os.environ.pop('SOCKETIO_MESSAGE_QUEUE', None)
+sys.path.insert(0, ROOT)
+
+from sqlalchemy import event  # noqa: E402
+from server.app import app as flask_app, db  # noqa: E402
+from server.models import User, Channel  # noqa: E402
+from server import cache  # noqa: E402
+
+_names = itertools.count(1)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(TMP, ignore_errors=True)
+
+
+@pytest.fixture
+def app():
+    with flask_app.app_context():
+        yield flask_app
+        db.session.remove()
+    for named in cache.caches.values():
+        named.invalidate()
+
+
+@pytest.fixture
+def make_user(app):
+    def make_user(**fields):
+        fields.setdefault('alias', f"tester{next(_names)}")
+        fields.setdefault('avatar_color', 'blue')
+        fields.setdefault('avatar_face', 'blue')
+        user = User(**fields)
+        db.session.add(user)
+        db.session.commit()
+        return user
+
+    return make_user
+
+
+@pytest.fixture
+def make_channel(app):
+    def make_channel(name=None):
+        channel = Channel(name=name or f"channel{next(_names)}", description="Test channel")
+        db.session.add(channel)
+        db.session.commit()
+        return channel
+
+    return make_channel
+
+
+@pytest.fixture
+def client_for(app):
+    """Get a test client logged in as a user"""
+    def client_for(user):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['user_id'] = user.id
+        return client
+
+    return client_for
+
+
+@pytest.fixture
+def count_queries(app):
+    """Count the SQL statements run inside a ``with count_queries() as counter`` block"""
+    @contextmanager
+    def count_queries():
+        counter = {'queries': 0}
+
+        def before_cursor_execute(*args):
+            counter['queries'] += 1
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield counter
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+    return count_queries
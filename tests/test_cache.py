@@ -0,0 +1,69 @@
+from server.app import db
+from server.models import Student
+from server import cache
+from server.cache import Cache, invalidate_on_commit
+from server.queries import load_student
+
+
+def test_cache_evicts_least_recently_used_and_expired_entries():
+    lru = Cache('test_lru', maxsize=2)
+    lru.set('a', 1)
+    lru.set('b', 2)
+    lru.get('a')
+    lru.set('c', 3)
+    assert (lru.get('a'), lru.get('b'), lru.get('c')) == (1, None, 3)
+    assert lru.evictions == 1
+
+    expiring = Cache('test_ttl', ttl=0)
+    expiring.set('a', 1)
+    assert expiring.get('a') is None
+    assert (expiring.hits, expiring.misses) == (0, 1)
+
+
+def test_invalidations_from_other_workers_drop_keys(app):
+    cache.students.set('S-remote', {"student_id": 'S-remote', "is_registered": False})
+    cache._on_remote_invalidate({'cache': 'students', 'keys': ['S-remote']})
+    assert cache.students.get('S-remote') is None
+
+
+def test_student_is_reloaded_after_commit_but_not_after_rollback(app):
+    db.session.add(Student(id='S-cached'))
+    db.session.commit()
+    assert load_student('S-cached')["is_registered"] is False
+
+    # What registration does
+    db.session.get(Student, 'S-cached').is_registered = True
+    invalidate_on_commit('students', 'S-cached')
+    db.session.commit()
+    assert load_student('S-cached')["is_registered"] is True
+
+    db.session.get(Student, 'S-cached').is_registered = False
+    invalidate_on_commit('students', 'S-cached')
+    db.session.rollback()
+    assert cache.students.get('S-cached') == {"student_id": 'S-cached', "is_registered": True}
+
+
+def test_author_card_is_not_stale_after_settings_change(make_user, make_channel, client_for):
+    user = make_user(avatar_color='blue')
+    channel = make_channel()
+    client = client_for(user)
+    url = f"/api/channels/{channel.id}/messages"
+    assert client.post(url, json={"content": "hello"}).status_code == 201
+
+    assert client.get(url).get_json()["messages"][0]["author"]["avatar_color"] == 'blue'
+    assert client.put('/api/users/settings', json={"avatar_color": 'red'}).status_code == 200
+    assert client.get(url).get_json()["messages"][0]["author"]["avatar_color"] == 'red'
+
+
+def test_channel_list_is_not_stale_after_new_message(make_user, make_channel, client_for):
+    user = make_user()
+    channel = make_channel()
+    client = client_for(user)
+
+    def last_message_id():
+        channels = client.get('/api/channels/').get_json()
+        return next(entry["last_message_id"] for entry in channels if entry["id"] == channel.id)
+
+    assert last_message_id() is None
+    created = client.post(f"/api/channels/{channel.id}/messages", json={"content": "hello"})
+    assert last_message_id() == created.get_json()["id"]
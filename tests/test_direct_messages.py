@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from server.app import db
+from server.models import DirectMessage
+
+
+@pytest.fixture
+def conversation(make_user):
+    """Two users with five DMs between them, one minute apart"""
+    sender, recipient = make_user(), make_user()
+    start = datetime(2024, 1, 1)
+    db.session.add_all(
+        DirectMessage(content=f"dm {i}", sender_id=sender.id, recipient_id=recipient.id,
+                      timestamp=start + timedelta(minutes=i))
+        for i in range(5)
+    )
+    db.session.commit()
+    return sender, recipient
+
+
+@pytest.mark.parametrize('limit', [-5, 0, 1])
+def test_direct_message_pages_hold_at_least_one_message(conversation, client_for, limit):
+    sender, recipient = conversation
+    page = client_for(sender).get(f"/api/direct-messages?user_id={recipient.id}&limit={limit}").get_json()
+
+    assert [message["content"] for message in page["messages"]] == ["dm 4"]
+    assert page["pagination"]["has_next"] is True
+    assert page["pagination"]["next_cursor"] is not None
+
+
+def test_direct_message_pages_are_capped(conversation, client_for):
+    sender, recipient = conversation
+    page = client_for(sender).get(f"/api/direct-messages?user_id={recipient.id}&limit=1000").get_json()
+
+    assert page["pagination"]["limit"] == 100
+    assert len(page["messages"]) == 5
+
+
+@pytest.mark.parametrize('limit, expected', [(-1, 1), (0, 1), (1000, 3)])
+def test_conversation_pages_are_clamped(make_user, client_for, limit, expected):
+    user = make_user()
+    client = client_for(user)
+    for _ in range(3):
+        partner = make_user()
+        assert client.post('/api/direct-messages', json={"recipient_id": partner.id, "content": "hi"}).status_code == 201
+
+    page = client.get(f"/api/direct-messages/conversations?limit={limit}").get_json()
+    assert len(page["conversations"]) == expected
+    assert page["pagination"]["limit"] == min(max(limit, 1), 100)
@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from server.app import db
+from server.models import OutboundEmail
+from server.mail_outbox import MailOutbox
+from server.fake_smtp import FakeSMTPServer
+
+
+@pytest.fixture
+def smtp(app, monkeypatch):
+    """A fake SMTP server that the app's mail connections go to"""
+    OutboundEmail.query.delete()
+    db.session.commit()
+    with FakeSMTPServer() as server:
+        state = app.extensions['mail']
+        for name, value in dict(server=server.host, port=server.port, use_tls=False, use_ssl=False,
+                                username=None, password=None, suppress=False).items():
+            monkeypatch.setattr(state, name, value)
+        yield server
+
+
+def make_outbox(app, **config):
+    """A worker's outbox without its background task"""
+    outbox = MailOutbox()
+    outbox.init_app(SimpleNamespace(config=dict(app.config, MAIL_OUTBOX_ENABLED=False, **config)))
+    return outbox
+
+
+def test_two_workers_send_each_email_once(app, smtp):
+    first = make_outbox(app, MAIL_OUTBOX_BATCH_SIZE=2)
+    second = make_outbox(app, MAIL_OUTBOX_BATCH_SIZE=2)
+    recipients = [f"student{i}@example.com" for i in range(5)]
+    for recipient in recipients:
+        first.enqueue(recipient, "Your code", "<p>123456</p>")
+
+    # Rows claimed by one worker are not due for the other
+    claimed = {email.id for email in first.claim()}
+    assert len(claimed) == 2
+    assert claimed.isdisjoint(email.id for email in second.claim())
+    OutboundEmail.query.update({"claimed_by": None, "next_attempt_at": datetime.utcnow()})
+    db.session.commit()
+
+    sent = []
+    while True:
+        batches = first.deliver(), second.deliver()
+        sent.extend(batches)
+        if not any(batches):
+            break
+
+    assert sent == [2, 2, 1, 0, 0, 0]
+    assert sorted(recipient for _, (recipient,), _ in smtp.messages) == recipients
+    assert {email.status for email in OutboundEmail.query} == {'sent'}
+
+
+def test_failed_send_is_retried_with_backoff(app, smtp):
+    outbox = make_outbox(app, MAIL_OUTBOX_RETRY_DELAY=30)
+    email_id = outbox.enqueue("retry@example.com", "Your code", "<p>123456</p>").id
+    smtp.fail_next = 2
+
+    for attempt, delay in ((1, 30), (2, 60)):
+        started = datetime.utcnow()
+        assert outbox.deliver() == 0
+        email = db.session.get(OutboundEmail, email_id)
+        assert (email.status, email.attempts, email.claimed_by) == ('pending', attempt, None)
+        assert started + timedelta(seconds=delay - 1) <= email.next_attempt_at <= datetime.utcnow() + timedelta(seconds=delay)
+
+        # Not due again until the backoff has passed
+        assert outbox.deliver() == 0
+        email.next_attempt_at = datetime.utcnow()
+        db.session.commit()
+
+    assert outbox.deliver() == 1
+    assert db.session.get(OutboundEmail, email_id).status == 'sent'
+    assert [recipients for _, recipients, _ in smtp.messages] == [["retry@example.com"]]
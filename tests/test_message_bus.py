@@ -0,0 +1,114 @@
+import os
+import sys
+import time
+import socket
+import subprocess
+
+import pytest
+import socketio
+
+from conftest import ROOT, flask_app
+
+# Runs the app as an eventlet worker on the port given as argument
+WORKER = """
+import eventlet
+eventlet.monkey_patch()
+import sys
+from server.app import app, socketio
+socketio.run(app, port=int(sys.argv[1]), log_output=False, use_reloader=False)
+"""
+
+# Creates the database before the workers start, and two users
+SETUP = """
+from server.app import app, db
+from server.models import User
+with app.app_context():
+    users = [User(alias=alias, avatar_color='blue', avatar_face='blue') for alias in ('sender', 'receiver')]
+    db.session.add_all(users)
+    db.session.commit()
+    print(*(user.id for user in users))
+"""
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Worker on port {port} exited with {process.returncode}")
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError(f"Worker on port {port} did not start")
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return condition()
+
+
+@pytest.fixture
+def workers(tmp_path):
+    """Start two worker processes sharing a database and a SQLite message bus"""
+    env = dict(
+        os.environ,
+        DEV_DATABASE_URL=f"sqlite:///{tmp_path / 'app.db'}",
+        SOCKETIO_MESSAGE_QUEUE=f"sqlite:///{tmp_path / 'bus.db'}",
+        PYTHONPATH=ROOT
+    )
+    setup = subprocess.run([sys.executable, '-c', SETUP], cwd=ROOT, env=env,
+                           capture_output=True, text=True, check=True)
+    user_ids = [int(user_id) for user_id in setup.stdout.split()[-2:]]
+
+    ports, processes = [free_port(), free_port()], []
+    try:
+        for port in ports:
+            log = open(tmp_path / f"worker-{port}.log", 'w')
+            processes.append(subprocess.Popen([sys.executable, '-c', WORKER, str(port)],
+                                              cwd=ROOT, env=env, stdout=log, stderr=log))
+        for port, process in zip(ports, processes):
+            wait_for_port(port, process)
+        yield ports, user_ids
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=10)
+
+
+def connect(port, user_id):
+    """Connect a Socket.IO client logged in as ``user_id`` and collect its new messages"""
+    cookie = flask_app.session_interface.get_signing_serializer(flask_app).dumps({'user_id': user_id})
+    client = socketio.Client()
+    client.received = []
+    client.on('new_message', lambda data: client.received.append(data['content']))
+    client.connect(f"http://127.0.0.1:{port}", headers={'Cookie': f"session={cookie}"},
+                   transports=['websocket'])
+    return client
+
+
+def test_room_messages_reach_clients_on_other_workers(workers):
+    (first_port, second_port), (sender_id, receiver_id) = workers
+    sender = connect(first_port, sender_id)
+    receiver = connect(second_port, receiver_id)
+    try:
+        for client in (sender, receiver):
+            client.call('join', {'channel_id': 1}, timeout=10)
+
+        sender.emit('send_message', {'channel_id': 1, 'content': 'hello from the first worker'})
+        assert wait_for(lambda: 'hello from the first worker' in receiver.received)
+
+        receiver.emit('send_message', {'channel_id': 1, 'content': 'hello from the second worker'})
+        assert wait_for(lambda: 'hello from the second worker' in sender.received)
+    finally:
+        sender.disconnect()
+        receiver.disconnect()
@@ -0,0 +1,36 @@
+from types import SimpleNamespace
+
+import pytest
+
+from server.message_writer import MessageIdAllocator, MessageWriter
+
+
+def allocate_interleaved(block_size):
+    """Ids handed out in turn by two allocators, as two workers would"""
+    first, second = MessageIdAllocator(block_size=block_size), MessageIdAllocator(block_size=block_size)
+    first.allocate()
+    second.allocate()
+    return [allocator.allocate() for allocator in (first, second, first, second)]
+
+
+def test_single_id_blocks_follow_allocation_order(app):
+    ids = allocate_interleaved(1)
+    assert ids == sorted(ids)
+    assert len(set(ids)) == len(ids)
+
+
+def test_larger_blocks_do_not(app):
+    ids = allocate_interleaved(100)
+    assert ids != sorted(ids)
+    assert len(set(ids)) == len(ids)
+
+
+@pytest.mark.parametrize('config, block_size', [
+    ({}, 100),
+    ({'SOCKETIO_MESSAGE_QUEUE': 'sqlite:////tmp/bus.db'}, 1),
+    ({'SOCKETIO_MESSAGE_QUEUE': 'sqlite:////tmp/bus.db', 'MESSAGE_ID_BLOCK_SIZE': 20}, 20),
+])
+def test_block_size_follows_the_message_queue(config, block_size):
+    writer = MessageWriter()
+    writer.init_app(SimpleNamespace(config=config))
+    assert writer.allocator.block_size == block_size
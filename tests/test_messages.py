@@ -0,0 +1,36 @@
+from server.app import db
+from server.models import Message, Reaction
+
+
+def test_channel_messages_query_count_does_not_grow_with_page_size(
+        make_user, make_channel, client_for, count_queries):
+    authors = [make_user() for _ in range(10)]
+    channel = make_channel()
+    messages = [
+        Message(content=f"message {i}", user_id=authors[i % len(authors)].id, channel_id=channel.id)
+        for i in range(60)
+    ]
+    db.session.add_all(messages)
+    db.session.flush()
+    db.session.add_all(
+        Reaction(reaction_type=reaction_type, target_id=message.id, target_type='message',
+                 user_id=author.id, message_id=message.id)
+        for message in messages
+        for author, reaction_type in zip(authors[:3], ('like', 'heart', 'like'))
+    )
+    db.session.commit()
+    client = client_for(authors[0])
+    url = f"/api/channels/{channel.id}/messages?per_page="
+
+    counts = {}
+    for per_page in (5, 50):
+        db.session.remove()
+        with count_queries() as counter:
+            response = client.get(f"{url}{per_page}")
+        assert response.status_code == 200
+        page = response.get_json()["messages"]
+        assert len(page) == per_page
+        assert page[-1]["reactions"] == {"like": 2, "heart": 1}
+        counts[per_page] = counter['queries']
+
+    assert counts[5] == counts[50]
@@ -0,0 +1,93 @@
+import pytest
+
+from server.app import db, socketio
+from server.models import Message
+from server.queries import UNREAD_COUNT_CAP
+
+
+def post(channel, author, count):
+    messages = [Message(content=f"message {i}", user_id=author.id, channel_id=channel.id) for i in range(count)]
+    db.session.add_all(messages)
+    db.session.commit()
+    return [message.id for message in messages]
+
+
+@pytest.fixture
+def reader(make_user, client_for, app):
+    """A user with an HTTP client and a Socket.IO client sharing its session"""
+    user = make_user()
+    client = client_for(user)
+    sio = socketio.test_client(app, flask_test_client=client)
+    yield user, client, sio
+    sio.disconnect()
+
+
+def unread_count(client, channel_id):
+    channels = client.get('/api/channels/').get_json()
+    return next(channel["unread_count"] for channel in channels if channel["id"] == channel_id)
+
+
+def mark_read(sio, **data):
+    return sio.emit('mark_read_upto', data, callback=True)
+
+
+def test_own_messages_are_never_unread(reader, make_user, make_channel):
+    user, client, _ = reader
+    channel = make_channel()
+    post(channel, make_user(), 5)
+    post(channel, user, 2)
+
+    assert unread_count(client, channel.id) == 5
+
+
+def test_watermark_only_moves_forwards(reader, make_user, make_channel):
+    _, client, sio = reader
+    channel = make_channel()
+    ids = post(channel, make_user(), 5)
+
+    assert mark_read(sio, channel_id=channel.id, message_id=ids[2]) == {"status": "success"}
+    assert unread_count(client, channel.id) == 2
+
+    assert mark_read(sio, channel_id=channel.id, message_id=ids[0]) == {"status": "success"}
+    assert unread_count(client, channel.id) == 2
+
+    assert mark_read(sio, channel_id=channel.id, message_id=ids[4]) == {"status": "success"}
+    assert unread_count(client, channel.id) == 0
+
+
+def test_watermark_must_point_into_the_channel(reader, make_user, make_channel):
+    _, client, sio = reader
+    channel, other = make_channel(), make_channel()
+    post(channel, make_user(), 3)
+    elsewhere = post(other, make_user(), 1)
+
+    assert mark_read(sio, channel_id=channel.id, message_id=elsewhere[0]) == {"error": "Message not found"}
+    assert mark_read(sio, channel_id=channel.id, message_id=str(elsewhere[0])) == {"error": "Invalid mark read data"}
+    assert mark_read(sio, message_id=elsewhere[0]) == {"error": "channel_id or partner_id required"}
+    assert unread_count(client, channel.id) == 3
+
+
+def test_unread_count_is_capped(reader, make_user, make_channel):
+    _, client, _ = reader
+    channel = make_channel()
+    post(channel, make_user(), UNREAD_COUNT_CAP + 20)
+
+    assert unread_count(client, channel.id) == UNREAD_COUNT_CAP
+
+
+def test_direct_message_watermark_clears_unread_count(reader, make_user, client_for):
+    user, client, sio = reader
+    partner = make_user()
+    sent = [
+        client_for(partner).post('/api/direct-messages', json={"recipient_id": user.id, "content": f"dm {i}"})
+        .get_json()["id"]
+        for i in range(3)
+    ]
+
+    def conversation_unread():
+        conversations = client.get('/api/direct-messages/conversations').get_json()["conversations"]
+        return next(entry["unread_count"] for entry in conversations if entry["partner"]["id"] == partner.id)
+
+    assert conversation_unread() == 3
+    assert mark_read(sio, partner_id=partner.id, message_id=sent[1]) == {"status": "success"}
+    assert conversation_unread() == 1
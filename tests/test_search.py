@@ -0,0 +1,22 @@
+import pytest
+
+from server.app import db
+from server.models import Message
+
+
+@pytest.mark.parametrize('limit, expected', [(-1, 1), (0, 1), (3, 3), (1000, 100)])
+def test_search_page_size_is_clamped(make_user, make_channel, client_for, limit, expected):
+    user = make_user()
+    channel = make_channel()
+    db.session.add_all(
+        Message(content=f"hello number {i}", user_id=user.id, channel_id=channel.id)
+        for i in range(120)
+    )
+    db.session.commit()
+    client = client_for(user)
+
+    response = client.get(f"/api/search?q=hello&channel_id={channel.id}&limit={limit}")
+    assert response.status_code == 200
+    page = response.get_json()
+    assert page["pagination"]["limit"] == expected
+    assert len(page["results"]) == expected
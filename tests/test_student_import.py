@@ -0,0 +1,38 @@
+import io
+
+from server.app import db
+from server.models import Student
+from server.student_import import read_student_ids, import_students, MAX_ID_LENGTH
+
+ROSTER = """name,student_id
+Ada,IMP001
+Bob,IMP002
+Cy,IMP003
+Ada again,IMP001
+Dee,
+Eve,{too_long}
+Fay,IMP004
+Old,IMP000
+""".format(too_long='X' * (MAX_ID_LENGTH + 1))
+
+
+def test_import_skips_duplicate_and_bad_rows_across_batches(app):
+    db.session.add(Student(id='IMP000'))
+    db.session.commit()
+    progress = []
+
+    # Batches of three, so the repeated IMP001 lands in a later batch than the first one
+    counts = import_students(read_student_ids(io.StringIO(ROSTER)), batch_size=3,
+                             progress=lambda counts: progress.append(dict(counts)))
+
+    assert counts == {"read": 8, "inserted": 4, "skipped": 2, "invalid": 2}
+    assert [entry["read"] for entry in progress] == [3, 6, 8]
+    assert sorted(db.session.scalars(db.select(Student.id).where(Student.id.like('IMP%')))) == \
+        ['IMP000', 'IMP001', 'IMP002', 'IMP003', 'IMP004']
+
+
+def test_dry_run_writes_nothing(app):
+    counts = import_students(read_student_ids(io.StringIO("DRY001\nDRY002\nDRY001\n")), dry_run=True)
+
+    assert counts == {"read": 3, "inserted": 2, "skipped": 1, "invalid": 0}
+    assert db.session.get(Student, 'DRY001') is None
@@ -0,0 +1,52 @@
+from server.app import socketio
+from server.typing_indicators import TypingTracker, typing_tracker
+
+
+def test_frames_carry_started_and_stopped_typers():
+    frames = []
+    tracker = TypingTracker(emit=lambda event, data, to: frames.append(data))
+
+    tracker.typing(1, 'ada', 5, now=0)
+    tracker.typing(2, 'bob', 5, now=0)
+    tracker.tick(now=0.1)
+    assert frames[-1]["started"] == [{"user_id": 1, "alias": 'ada'}, {"user_id": 2, "alias": 'bob'}]
+
+    tracker.stop(1, 5)
+    tracker.tick(now=0.2)
+    assert (frames[-1]["started"], frames[-1]["stopped"]) == ([], [{"user_id": 1, "alias": 'ada'}])
+
+    # Starting and stopping between two frames sends nothing
+    sent = len(frames)
+    tracker.typing(3, 'cy', 5, now=0.3)
+    tracker.stop(3, 5)
+    tracker.tick(now=0.4)
+    assert len(frames) == sent
+
+    tracker.tick(now=10)
+    assert frames[-1]["stopped"] == [{"user_id": 2, "alias": 'bob'}]
+
+
+def test_joining_a_channel_sends_who_is_already_typing(app, make_user, make_channel, client_for, monkeypatch):
+    frames = []
+    monkeypatch.setattr(typing_tracker, '_emit', lambda event, data, to: frames.append((to, data)))
+    typer, watcher = make_user(), make_user()
+    channel_id = make_channel().id
+    typing_client = socketio.test_client(app, flask_test_client=client_for(typer))
+    watching_client = socketio.test_client(app, flask_test_client=client_for(watcher))
+    try:
+        typing_client.emit('join', {'channel_id': channel_id})
+        typing_client.emit('typing', {'channel_id': channel_id})
+        typing_tracker.tick()
+
+        watching_client.emit('join', {'channel_id': channel_id})
+        watcher_sid = socketio.server.manager.sid_from_eio_sid(watching_client.eio_sid, '/')
+        assert [data for to, data in frames if to == watcher_sid] == [{
+            "channel_id": channel_id,
+            "started": [{"user_id": typer.id, "alias": typer.alias}],
+            "stopped": []
+        }]
+    finally:
+        typing_tracker.stop_all(typer.id)
+        typing_tracker.tick()
+        typing_client.disconnect()
+        watching_client.disconnect()